@@ -0,0 +1,141 @@
+# encoding=utf-8
+"""
+Client 请求本地模拟的 api 服务器的吞吐量 (请求/秒),
+服务器使用自签名证书的 https, 以包含 TLS 握手的开销 (需安装 cryptography)
+
+    PYTHONPATH=. python benchmarks/bench_client.py
+"""
+import datetime
+import ipaddress
+import json
+import os
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from weixin.config import Config
+from weixin.client_api import Client
+from weixin.storage import Sqlite3Storage
+from weixin.token import TOKEN_KEY
+
+
+BODY = json.dumps(dict(errcode=0, menu=dict(button=[]))).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+def make_certificate():
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.utcnow()
+    cert = x509.CertificateBuilder() \
+        .subject_name(name).issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+            critical=False) \
+        .sign(key, hashes.SHA256())
+
+    directory = tempfile.mkdtemp()
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+class OneShotSession(object):
+    """
+    旧版本的行为: 每次请求都使用 requests.request, 重新建立连接
+    """
+
+    def __init__(self, verify):
+        self.verify = verify
+
+    def request(self, *args, **kwargs):
+        return requests.request(*args, verify=self.verify, **kwargs)
+
+    def close(self):
+        pass
+
+
+class LocalClient(Client):
+
+    def get_api_base(self, protocol="https"):
+        return "https://%s:%s" % self.config.address
+
+
+def bench(name, client, threads, seconds=2.0):
+    count = [0]
+    deadline = time.perf_counter() + seconds
+
+    def run():
+        n = 0
+        while time.perf_counter() < deadline:
+            client.get_menu()
+            n += 1
+        count.append(n)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(run) for _ in range(threads)]
+        for future in futures:
+            future.result()
+
+    elapsed = time.perf_counter() - start
+    print("%-12s threads=%-3s %8.0f calls/s" % (name, threads, sum(count) / elapsed))
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    certfile, keyfile = make_certificate()
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    storage = Sqlite3Storage(":memory:")
+    storage.set(TOKEN_KEY, "TOKEN")
+    config = Config(storage=storage, address=server.server_address)
+
+    for threads in (1, 8):
+        session = OneShotSession(certfile)
+        bench("per-call", LocalClient(config, session=session), threads)
+
+        client = LocalClient(config)
+        # 环境变量中的 CA 证书会覆盖 session.verify
+        client.session.trust_env = False
+        client.session.verify = certfile
+        bench("keep-alive", client, threads)
+
+    server.shutdown()
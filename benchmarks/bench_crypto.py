@@ -0,0 +1,48 @@
+# encoding=utf-8
+"""
+消息加解密吞吐量 (条/秒), 分别测试已安装的AES实现
+
+    PYTHONPATH=. python benchmarks/bench_crypto.py
+"""
+import time
+
+from weixin.crypto import XMLMsgCryptor, CryptorError, get_backend
+
+
+APPID = 'wx' + 'a' * 16
+TOKEN = 'A' * 20
+AESKEY = 'E5HSDyJ78YwCSelWbCSFb4ZcXXSN1LQPdkHPblR8ilo'
+
+
+def make_xml(size):
+    head = "<xml><ToUserName><![CDATA[toUser]]></ToUserName><Content><![CDATA["
+    tail = "]]></Content></xml>"
+    return head + "x" * (size - len(head) - len(tail)) + tail
+
+
+def bench(backend, size, seconds=1.0):
+    cryptor = XMLMsgCryptor(APPID, TOKEN, AESKEY, backend=backend)
+    xml = make_xml(size)
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(100):
+            kw = cryptor.encrypt(xml)
+            cryptor.decrypt(kw['enctext'])
+        count += 100
+
+    elapsed = time.perf_counter() - start
+    print("%-13s %5d bytes  %9.0f msg/s" % (backend, size, count / elapsed))
+
+
+if __name__ == "__main__":
+    for backend in ("pycrypto", "cryptography"):
+        try:
+            get_backend(backend)
+        except CryptorError as e:
+            print(e)
+            continue
+
+        for size in (300, 4096):
+            bench(backend, size)
@@ -0,0 +1,109 @@
+# encoding=utf-8
+"""
+微信消息xml解析耗时: xmltodict, weixin.parse.parse_xml
+以及只访问 MsgType/FromUserName (路由与会话) 时 LazyWeixinMsg 的对比
+
+    PYTHONPATH=. python benchmarks/bench_parse.py
+
+xmltodict 已不是依赖项, 只用于对比, 未安装时跳过 (pip install xmltodict)
+"""
+import timeit
+
+try:
+    import xmltodict
+except ImportError:
+    xmltodict = None
+
+from weixin.parse import parse_xml, LazyWeixinMsg
+
+
+FIXTURES = {
+    "text": """<xml>
+     <ToUserName><![CDATA[toUser]]></ToUserName>
+     <FromUserName><![CDATA[fromUser]]></FromUserName>
+     <CreateTime>123456789</CreateTime>
+     <MsgType><![CDATA[text]]></MsgType>
+     <Content><![CDATA[你好]]></Content>
+     <MsgId>123456789</MsgId>
+     </xml>
+     """,
+    "location": """<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <FromUserName><![CDATA[fromUser]]></FromUserName>
+    <CreateTime>123456789</CreateTime>
+    <MsgType><![CDATA[location]]></MsgType>
+    <Location_X>23.134521</Location_X>
+    <Location_Y>113.358803</Location_Y>
+    <Scale>20</Scale>
+    <Label><![CDATA[位置信息]]></Label>
+    <MsgId>123456789</MsgId>
+    </xml>
+     """,
+    "link": """<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <FromUserName><![CDATA[fromUser]]></FromUserName>
+    <CreateTime>123456789</CreateTime>
+    <MsgType><![CDATA[link]]></MsgType>
+    <Title><![CDATA[公众平台官网链接]]></Title>
+    <Description><![CDATA[公众平台官网链接]]></Description>
+    <Url><![CDATA[url]]></Url>
+    <MsgId>123456789</MsgId>
+    </xml>
+     """,
+    # 带有大量嵌套节点的事件, 处理器通常只用到 MsgType/Event
+    "pic_weixin": """<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <FromUserName><![CDATA[fromUser]]></FromUserName>
+    <CreateTime>1408090816</CreateTime>
+    <MsgType><![CDATA[event]]></MsgType>
+    <Event><![CDATA[pic_weixin]]></Event>
+    <EventKey><![CDATA[6]]></EventKey>
+    <SendPicsInfo><Count>9</Count>
+    <PicList>%s</PicList>
+    </SendPicsInfo>
+    </xml>
+     """ % "".join(
+        "<item><PicMd5Sum><![CDATA[%032x]]></PicMd5Sum></item>\n" % i
+        for i in range(9)),
+    "scancode": """<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <FromUserName><![CDATA[fromUser]]></FromUserName>
+    <CreateTime>1408090816</CreateTime>
+    <MsgType><![CDATA[event]]></MsgType>
+    <Event><![CDATA[scancode_waitmsg]]></Event>
+    <EventKey><![CDATA[6]]></EventKey>
+    <ScanCodeInfo><ScanType><![CDATA[qrcode]]></ScanType>
+    <ScanResult><![CDATA[%s]]></ScanResult>
+    </ScanCodeInfo>
+    </xml>
+     """ % ("https://example.com/?" + "a" * 512),
+}
+
+
+def best(func, number, rounds):
+    return min(timeit.timeit(func, number=number)
+               for _ in range(rounds)) / number * 1e6
+
+
+def bench(number=2000, rounds=20):
+    # 取多轮中的最小值, 减少机器负载的影响
+    for name, xml in FIXTURES.items():
+        def lazy():
+            msg = LazyWeixinMsg(xml)
+            return msg.MsgType, msg.FromUserName
+
+        assert LazyWeixinMsg(xml).materialize() == parse_xml(xml)
+
+        line = "%-10s" % name
+        if xmltodict is not None:
+            assert parse_xml(xml) == dict(xmltodict.parse(xml)['xml'])
+            old = best(lambda: xmltodict.parse(xml)['xml'], number, rounds)
+            line += " xmltodict %7.2f us" % old
+
+        print("%s  parse_xml %7.2f us  lazy %7.2f us" % (
+            line, best(lambda: parse_xml(xml), number, rounds),
+            best(lazy, number, rounds)))
+
+
+if __name__ == "__main__":
+    bench()
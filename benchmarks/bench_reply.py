@@ -0,0 +1,81 @@
+# encoding=utf-8
+"""
+回复消息渲染耗时: 每次 str.format(**dict) 与 预编译模板 的对比
+
+    PYTHONPATH=. python benchmarks/bench_reply.py
+"""
+import timeit
+
+from weixin.reply import Text, Image, Voice, Video, Music, Article, Encrypt
+from weixin.utils import AttributeDict
+
+
+FROM_MSG = AttributeDict(FromUserName="fromUser", ToUserName="toUser")
+
+
+def make_replies():
+    article = Article()
+    for i in range(4):
+        article.add_article(
+            "title%d" % i, description="description",
+            url="http://example.com/%d" % i, image_url="http://img/%d" % i)
+
+    replies = [
+        Text("你好, 这是一条文本回复"),
+        Image("media_id"),
+        Voice("media_id"),
+        Video("media_id", title="title", description="description"),
+        Music("thumb_media_id", url="http://m", hq_url="http://hqm",
+              title="title", description="description"),
+        article,
+    ]
+    for reply in replies:
+        reply.postmark(FROM_MSG)
+
+    encrypt = Encrypt("enctext" * 40, "nonce", 1513500000, "signature")
+    encrypt.postmark(FROM_MSG)
+    replies.append(encrypt)
+    return replies
+
+
+def format_baseline(reply):
+    """
+    与旧实现相同的渲染方式, 每次对模板调用 str.format(**dict)
+    """
+    template = "".join(
+        literal + ("{%s}" % field if field else "")
+        for literal, field in zip(reply.template.literals,
+                                  reply.template.fields + (None,)))
+    values = dict(
+        (field, getattr(reply, field)) for field in reply.template.fields)
+
+    if isinstance(reply, Article):
+        item = "<item>" \
+               "<Title><![CDATA[{Title}]]></Title>" \
+               "<Description><![CDATA[{Description}]]></Description>" \
+               "<PicUrl><![CDATA[{PicUrl}]]></PicUrl>" \
+               "<Url><![CDATA[{Url}]]></Url>" \
+               "</item>"
+
+        def render():
+            values['Articles'] = "".join(
+                item.format(**ar) for ar in reply.articles)
+            return template.format(**values)
+
+        return render
+
+    return lambda: template.format(**values)
+
+
+def bench(number=50000):
+    for reply in make_replies():
+        reply.xml
+        old = timeit.timeit(format_baseline(reply), number=number)
+        new = timeit.timeit(lambda: reply.xml, number=number)
+
+        print("%-14s str.format %6.2f us  template %6.2f us" % (
+            type(reply).__name__, old / number * 1e6, new / number * 1e6))
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,73 @@
+# encoding=utf-8
+"""
+存储器序列化耗时与体积: 旧版本的 msgpack, Serializer 默认配置及压缩配置
+
+    PYTHONPATH=. python benchmarks/bench_serializer.py
+"""
+import timeit
+
+import msgpack
+
+from weixin.storage import Serializer
+
+
+PAYLOADS = {
+    "access_token": "ACCESS_TOKEN_" + "x" * 140,
+    "small_session": {
+        "state": "menu",
+        "step": 2,
+        "openid": "oLVPpjqs9BhvzwPj5A-vTYAX3GLc",
+    },
+    "large_session": {
+        "state": "order",
+        "openid": "oLVPpjqs9BhvzwPj5A-vTYAX3GLc",
+        "cart": [{"sku": "SKU%04d" % i, "name": "商品名称%s" % i,
+                  "count": i % 5 + 1, "price": 1999} for i in range(60)],
+        "history": ["查看了商品 SKU%04d" % i for i in range(60)],
+    },
+}
+
+
+class LegacySerializer(object):
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        return msgpack.dumps(pyobj)
+
+    def loads(self, data, encoding=None):
+        return msgpack.loads(data, raw=encoding is None)
+
+
+SERIALIZERS = [("legacy msgpack", LegacySerializer()),
+               ("default", Serializer())]
+
+for compress in ("zlib", "lz4"):
+    try:
+        SERIALIZERS.append(
+            (compress, Serializer(compress=compress, threshold=1024)))
+    except KeyError:
+        pass
+
+
+def bench(payload, number=2000, rounds=15):
+    """
+    各序列化器交替运行, 取最快的一轮, 减少机器负载波动的影响
+    """
+    best = dict()
+    for _ in range(rounds):
+        for name, serializer in SERIALIZERS:
+            dumps, loads = serializer.dumps, serializer.loads
+            t = timeit.timeit(lambda: loads(dumps(payload), encoding="utf-8"),
+                              number=number)
+            best[name] = min(best.get(name, t), t)
+
+    for name, serializer in SERIALIZERS:
+        data = serializer.dumps(payload)
+        assert serializer.loads(data, encoding="utf-8") == payload
+        print("  %-15s %6d bytes  %7.2f us" % (
+            name, len(data), best[name] / number * 1e6))
+
+
+if __name__ == "__main__":
+    for payload_name, payload in PAYLOADS.items():
+        print(payload_name)
+        bench(payload)
@@ -0,0 +1,45 @@
+# encoding=utf-8
+"""
+Sqlite3Storage 会话读写吞吐量 (会话/秒), 每个会话为一次加载与一次保存
+
+    PYTHONPATH=. python benchmarks/bench_sqlite3_session.py
+"""
+import os
+import tempfile
+import time
+
+from weixin.config import Config
+from weixin.session import Session
+from weixin.storage import Sqlite3Storage
+
+
+CONFIGS = [
+    # 旧版本的行为: rollback journal, synchronous=FULL, 每次写入都提交
+    ("delete/full", dict(journal_mode="DELETE", synchronous="FULL")),
+    ("wal/normal", dict()),
+    ("wal/normal+group", dict(commit_interval=0.05)),
+]
+
+
+def bench(name, options, seconds=2.0):
+    path = os.path.join(tempfile.mkdtemp(), "weixin.sqlite3")
+    storage = Sqlite3Storage(path, **options)
+    request = Config(message=Config(), config=Config(storage=storage))
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        request.message.FromUserName = "openid_%s" % (count % 1000)
+        session = Session(request)
+        session["count"] = (session["count"] or 0) + 1
+        session.save()
+        count += 1
+
+    storage.close()
+    elapsed = time.perf_counter() - start
+    print("%-18s %9.0f sessions/s" % (name, count / elapsed))
+
+
+if __name__ == "__main__":
+    for name, options in CONFIGS:
+        bench(name, options)
@@ -0,0 +1,41 @@
+# encoding=utf-8
+"""
+文本关键词路由耗时: 逐个正则匹配 与 关键词索引 的对比
+
+    PYTHONPATH=. python benchmarks/bench_text_filter.py
+"""
+import timeit
+
+from weixin.router import TextFilterRouter, compile_keywords
+
+
+def linear_match(handlers, content):
+    for cpre, h in handlers:
+        if cpre.match(content):
+            return h
+
+
+def bench(count, number=2000):
+    handlers = []
+    router = TextFilterRouter()
+    for i in range(count):
+        kws = ["kw%d" % i, "关键词%d" % i]
+        handlers.append((compile_keywords(kws), i))
+        router.add(kws, i)
+
+    # 命中最后一个关键词以及无匹配, 都是逐个匹配的最坏情况
+    contents = ["kw%d" % (count - 1), "no such keyword"]
+    for content in contents:
+        linear = timeit.timeit(
+            lambda: linear_match(handlers, content), number=number)
+        indexed = timeit.timeit(
+            lambda: router.match(content), number=number)
+
+        print("%6d filters  %-18r linear %9.2f us  indexed %6.2f us" % (
+            count, content,
+            linear / number * 1e6, indexed / number * 1e6))
+
+
+if __name__ == "__main__":
+    for n in (10, 1000, 10000):
+        bench(n, number=20000 // n + 10)
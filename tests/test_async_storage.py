@@ -0,0 +1,177 @@
+# encoding=utf-8
+import asyncio
+import warnings
+import pytest
+
+from weixin.dedup import MessageDeduplicator
+from weixin.storage import Sqlite3Storage
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def check_storage(storage):
+    await storage.set("key", "value")
+    assert await storage.get("key") == b"value"
+    assert await storage.get("key", encoding="utf-8") == "value"
+
+    await storage.set("dict", {"a": 1, "b": [1, 2]})
+    assert await storage.get("dict", encoding="utf-8") == {"a": 1, "b": [1, 2]}
+
+    await storage.delete("key")
+    assert await storage.get("key") == None
+    assert await storage.get("key_not_exist") == None
+    assert await storage.is_expired("key")
+    assert not await storage.is_expired("dict")
+    assert 0 < await storage.get_ttl("dict") <= 86400
+
+    for index in range(12):
+        await storage.set("prefix_%s" % index, "value")
+
+    lists = await storage.get_all_keys_by_wildcard(wildcard='prefix_*')
+    assert len(lists) == 12
+
+    await storage.purge_expired()
+    assert isinstance(await storage.get_ttl("key_not_exist"), int)
+
+    await storage.hset("hash", {"a": 1, "b": "2"}, expires=60)
+    assert await storage.hget("hash", "b", encoding="utf-8") == "2"
+    await storage.hdel("hash", ["a"])
+    assert await storage.hget_many("hash", ["a", "b"]) == [None, b"2"]
+    assert await storage.htouch("hash", 120)
+    await storage.hclear("hash")
+    assert await storage.hget("hash", "b") is None
+
+
+def test_async_sqlite3_storage():
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    async def main():
+        storage = AsyncSqlite3Storage(":memory:")
+        await check_storage(storage)
+        await storage.close()
+
+    run(main())
+
+
+def test_async_sqlite3_shared_file(tmpdir):
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    # 同步与异步存储器读写同一份数据
+    path = str(tmpdir.join("weixin.sqlite3"))
+    Sqlite3Storage(path).set("key", {"openid": "o1"})
+
+    async def main():
+        storage = AsyncSqlite3Storage(path)
+        assert await storage.get("key", encoding="utf-8") == {"openid": "o1"}
+        await storage.set("key2", "value")
+        await storage.close()
+
+    run(main())
+    assert Sqlite3Storage(path).get("key2") == b"value"
+
+
+def test_async_sqlite3_lock(tmpdir):
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    path = str(tmpdir.join("weixin.sqlite3"))
+
+    async def main():
+        storage = AsyncSqlite3Storage(path)
+        token = await storage.lock_acquire("openid", ttl=60)
+        assert token == 1
+        assert await storage.lock_acquire("openid", ttl=60) is None
+
+        # 获取失败时也已提交, 其他连接可以写入
+        other = Sqlite3Storage(path)
+        other.set("key", "value")
+        assert other.lock_acquire("openid", ttl=60) is None
+
+        assert await storage.lock_release("openid", token)
+        assert await storage.lock_acquire("openid", ttl=60) == 2
+        await storage.close()
+
+    run(main())
+
+
+def test_async_sqlite3_event_loops():
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    # 在事件循环外创建, 依次在不同的事件循环中使用
+    storage = AsyncSqlite3Storage(":memory:")
+
+    async def main(value):
+        await asyncio.gather(*[storage.set("key", value) for _ in range(3)])
+        assert await storage.get("key", encoding="utf-8") == value
+        await storage.close()
+
+    run(main("v1"))
+    run(main("v2"))
+
+
+def test_async_redis_storage():
+    fakeredis = pytest.importorskip("fakeredis")
+    from weixin.storage import AsyncRedisStorage
+
+    async def main():
+        storage = AsyncRedisStorage(client=fakeredis.FakeAsyncRedis())
+        await check_storage(storage)
+        # 新版 redis-py 中 close() 会发出 DeprecationWarning
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            await storage.close()
+
+    run(main())
+
+
+def test_async_storage_dedup():
+    fakeredis = pytest.importorskip("fakeredis")
+    from weixin.storage import AsyncRedisStorage
+
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return "<xml></xml>"
+
+    async def main():
+        storage = AsyncRedisStorage(client=fakeredis.FakeAsyncRedis())
+        # 两个节点共享同一个异步存储器
+        first = MessageDeduplicator(storage)
+        second = MessageDeduplicator(storage)
+        assert await first.run_async("msg:1", handler) == "<xml></xml>"
+        assert await second.run_async("msg:1", handler) == "<xml></xml>"
+        assert await storage.get_ttl("dedup:msg:1") > 0
+
+        # 加密的回复从存储器读取时仍是 bytes
+        async def encrypted():
+            return b"<xml>\xff</xml>"
+
+        assert await first.run_async("msg:3", encrypted) == b"<xml>\xff</xml>"
+        assert await second.run_async("msg:3", handler) == b"<xml>\xff</xml>"
+
+        # 返回 None 的处理器也只调用一次
+        async def side_effect():
+            calls.append(2)
+
+        assert await first.run_async("msg:2", side_effect) is None
+        assert await second.run_async("msg:2", side_effect) is None
+
+    run(main())
+    assert calls == [1, 2]
+
+
+if __name__ == "__main__":
+    test_async_sqlite3_storage()
+    test_async_sqlite3_event_loops()
+    test_async_redis_storage()
+    test_async_storage_dedup()
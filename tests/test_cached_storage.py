@@ -0,0 +1,99 @@
+# encoding=utf-8
+import time
+import pytest
+
+from weixin.storage import *
+
+
+def test_cached_storage():
+    backend = Sqlite3Storage(":memory:")
+    storage = CachedStorage(backend, maxsize=2, ttl=60)
+
+    storage.set("k1", {"a": "b"})
+    assert storage.get("k1", encoding="utf-8") == {"a": "b"}
+    assert storage.get("k1") == {b"a": b"b"}
+    assert storage.stats() == dict(hits=2, misses=0, size=1)
+
+    # 每次读取返回新的对象
+    storage.get("k1", encoding="utf-8")["a"] = "c"
+    assert storage.get("k1", encoding="utf-8") == {"a": "b"}
+
+    # 后端写入的数据在未命中时读取并缓存
+    backend.set("k2", "v2")
+    assert storage.get("k2") == b"v2"
+    assert storage.get("k2") == b"v2"
+    assert storage.get("missing") is None
+    assert storage.stats() == dict(hits=5, misses=2, size=2)
+
+    storage.delete("k1")
+    assert storage.get("k1") is None
+    assert backend.get("k1") is None
+
+    # 批量读取
+    storage.set_many({"k3": 3, "k4": 4})
+    assert storage.get_many(["k2", "k3", "k5"]) == [b"v2", 3, None]
+
+
+def test_cached_storage_backend_ttl():
+    backend = Sqlite3Storage(":memory:")
+    storage = CachedStorage(backend, ttl=60)
+
+    backend.set("key", "value", expires=1)
+    assert storage.get("key") == b"value"
+    time.sleep(1.5)
+    # 缓存的过期时间不超过后端的剩余时间
+    assert storage.get("key") is None
+
+
+def test_cached_storage_get_many():
+    backend = Sqlite3Storage(":memory:")
+    storage = CachedStorage(backend, ttl=60)
+
+    backend.set_many({"k1": {"a": "b"}, "k2": "v2"})
+    backend.set("k3", "v3", expires=1)
+    assert storage.get_many(["k1", "k2", "k3", "k4"], encoding="utf-8") == \
+        [{"a": "b"}, "v2", "v3", None]
+    assert storage.stats() == dict(hits=0, misses=4, size=3)
+
+    # 后端命中的数据写入本地缓存
+    assert storage.get_many(["k2", "k1"]) == [b"v2", {b"a": b"b"}]
+    assert storage.stats() == dict(hits=2, misses=4, size=3)
+
+    # 缓存的过期时间不超过后端的剩余时间
+    time.sleep(1.5)
+    assert storage.get_many(["k3"]) == [None]
+
+
+def test_cached_storage_invalidation():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+
+    def make_node():
+        client = fakeredis.FakeStrictRedis(server=server)
+        return CachedStorage(
+            RedisStorage(client=client),
+            invalidator=RedisInvalidator(client))
+
+    node1, node2 = make_node(), make_node()
+    node1.set("key", "v1")
+    assert node2.get("key") == b"v1"
+
+    node1.set("key", "v2")
+    for _ in range(50):
+        if "key" not in node2.cache:
+            break
+        time.sleep(0.05)
+
+    assert node2.get("key") == b"v2"
+    # 自己发布的失效消息不会删除本地缓存
+    assert "key" in node1.cache
+
+    node1.invalidator.close()
+    node2.invalidator.close()
+
+
+if __name__ == "__main__":
+    test_cached_storage()
+    test_cached_storage_backend_ttl()
+    test_cached_storage_get_many()
+    test_cached_storage_invalidation()
@@ -0,0 +1,171 @@
+# encoding=utf-8
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from weixin.config import Config
+from weixin.client_api import Client, ClientError
+from weixin.storage import Sqlite3Storage
+from weixin.token import TOKEN_KEY
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    # 保持长连接
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super(FakeApiHandler, self).setup()
+        self.server.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+
+        self.server.requests.append((self.command, self.path))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        result = dict(errcode=0, menu={})
+        if self.path.startswith("/cgi-bin/user/info/batchget"):
+            users = json.loads(data.decode("utf-8"))["user_list"]
+            result = dict(user_info_list=[
+                dict(openid=u["openid"], nickname=u["openid"].upper())
+                for u in users if u["openid"] != "unknown"])
+            if any(u["openid"] == "error" for u in users):
+                result = dict(errcode=45009, errmsg="api freq out of limit")
+            if any(u["openid"] == "slow" for u in users):
+                time.sleep(0.5)
+        body = json.dumps(result).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = []
+    server.statuses = []
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class LocalClient(Client):
+
+    def get_api_base(self, protocol="http"):
+        return "http://%s:%s" % self.config.server.server_address
+
+
+def make_client(server, **kwargs):
+    storage = Sqlite3Storage(":memory:")
+    storage.set(TOKEN_KEY, "TOKEN")
+    return LocalClient(Config(storage=storage, server=server), **kwargs)
+
+
+def test_client_keep_alive(server):
+    client = make_client(server)
+    for _ in range(10):
+        assert client.get_menu() == {}
+
+    assert len(server.requests) == 10
+    assert server.connections == 1
+    client.close()
+
+
+def test_client_retry(server):
+    client = make_client(server)
+
+    # GET 遇到 5xx 时重试
+    server.statuses = [503, 502]
+    assert client.get_menu() == {}
+    assert len(server.requests) == 3
+
+    # POST 不重试, 避免重复发送
+    server.requests = []
+    server.statuses = [503]
+    client.send_custom_message(dict(touser="openid"))
+    assert len(server.requests) == 1
+
+
+def test_client_timeout(server):
+    session = requests.Session()
+    calls = []
+    request = session.request
+
+    def record(*args, **kwargs):
+        calls.append(kwargs["timeout"])
+        return request(*args, **kwargs)
+
+    session.request = record
+    client = make_client(server, session=session, timeout=(1, 2))
+    client.get_menu()
+    assert calls == [(1, 2)]
+
+
+def test_client_user_info_many(server):
+    client = make_client(server)
+    openids = ["openid_%s" % i for i in range(250)] + ["openid_0", "unknown"]
+
+    result = client.get_user_info_many(openids)
+    assert len(result) == 252
+    assert result[1] == dict(openid="openid_1", nickname="OPENID_1")
+    assert result[250] == result[0]
+    assert result[251] is None
+    # 去重后每100个一组
+    assert len(server.requests) == 3
+
+    # 缓存有效期内不再请求
+    server.requests = []
+    assert client.get_user_info_many(openids[:10]) == result[:10]
+    assert client.get_user_info_many(["unknown"]) == [None]
+    assert len(server.requests) == 1
+    assert client.user_info_cache.stats()["hits"] == 10
+
+
+def test_client_user_info_many_error(server):
+    client = make_client(server, timeout=(1, 0.2))
+    openids = ["openid_%s" % i for i in range(199)] + ["error"]
+    openids += ["openid_%s" % i for i in range(300, 399)] + ["slow"]
+    openids += ["openid_x"]
+
+    # 接口错误与请求超时的组返回 None, 其他组正常返回并缓存
+    errors = []
+    result = client.get_user_info_many(openids, errors=errors)
+    assert result[:100] == [dict(openid=openid, nickname=openid.upper())
+                            for openid in openids[:100]]
+    assert result[100:300] == [None] * 200
+    assert result[300] == dict(openid="openid_x", nickname="OPENID_X")
+
+    assert sorted(len(chunk) for chunk, _ in errors) == [100, 100]
+    errors = dict((chunk[-1], error) for chunk, error in errors)
+    assert isinstance(errors["error"], ClientError)
+    assert errors["error"].code == 45009
+    assert isinstance(errors["slow"], requests.Timeout)
+
+    # 失败的用户没有缓存, 下次重新获取
+    server.requests = []
+    assert client.get_user_info_many(openids[:10])[0] == result[0]
+    assert client.get_user_info_many(openids[150:151]) == \
+        [dict(openid="openid_150", nickname="OPENID_150")]
+    assert len(server.requests) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,241 @@
+# encoding=utf-8
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from weixin.config import Config
+from weixin.client_api import Client
+from weixin.storage import Sqlite3Storage
+from weixin.token import TOKEN_KEY
+
+httpx = pytest.importorskip("httpx")
+from weixin.client_async import AsyncClient
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _result(self, path, query, body):
+        if path == "/cgi-bin/token":
+            return dict(access_token="NEW", expires_in=7200)
+
+        if query.get("access_token") != ["NEW"]:
+            return dict(errcode=40001, errmsg="invalid credential")
+
+        if path == "/cgi-bin/menu/get":
+            return dict(menu={"button": []})
+        if path == "/cgi-bin/user/info/batchget":
+            users = json.loads(body.decode("utf-8"))["user_list"]
+            if any(u["openid"] == "error" for u in users):
+                return dict(errcode=45009, errmsg="api freq out of limit")
+            return dict(user_info_list=[
+                dict(openid=u["openid"], nickname=u["openid"].upper())
+                for u in users])
+        if path == "/cgi-bin/media/upload":
+            return dict(type=query["type"][0], size=len(body))
+        return dict(errcode=0, path=path, body=body.decode("utf-8"))
+
+    def _reply(self):
+        server = self.server
+        with server.lock:
+            server.inflight += 1
+            server.max_inflight = max(server.max_inflight, server.inflight)
+
+        time.sleep(server.delay)
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        data = json.dumps(self._result(url.path, parse_qs(url.query), body))
+        data = data.encode("utf-8")
+
+        with server.lock:
+            server.inflight -= 1
+            server.requests.append(url.path)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _reply
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.inflight = server.max_inflight = 0
+    server.delay = 0
+    server.requests = []
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class LocalSyncClient(Client):
+
+    def get_api_base(self, protocol="http"):
+        return "http://%s:%s" % self.config.server.server_address
+
+
+class LocalClient(AsyncClient):
+
+    get_api_base = LocalSyncClient.get_api_base
+
+
+def make_client(server, token="NEW", **kwargs):
+    storage = Sqlite3Storage(":memory:")
+    storage.set(TOKEN_KEY, token)
+    config = Config(storage=storage, server=server, appid="wx", appsec="sec")
+
+    # 同步与异步客户端共用token管理器
+    config.token_manager = LocalSyncClient(config).token_manager
+    return LocalClient(config, **kwargs)
+
+
+def test_async_client_methods(server, tmpdir):
+    media = tmpdir.join("image.png")
+    media.write_binary(b"\x89PNG" * 10)
+
+    async def main():
+        client = make_client(server)
+        assert await client.get_menu() == {"button": []}
+        assert json.loads(await client.get_menu(string=True)) == {"button": []}
+
+        result = await client.send_custom_message(dict(touser="openid"))
+        assert result["path"] == "/cgi-bin/message/custom/send"
+        assert json.loads(result["body"]) == dict(touser="openid")
+
+        result = await client.upload_tmp_media(str(media))
+        assert result["type"] == "image"
+        assert result["size"] > 40
+        await client.close()
+
+    run(main())
+
+
+def test_async_client_token_retry(server):
+    async def main():
+        client = make_client(server, token="EXPIRED")
+        results = await asyncio.gather(*[client.get_menu() for _ in range(5)])
+        await client.close()
+        return results
+
+    assert run(main()) == [{"button": []}] * 5
+    # 单次刷新
+    assert server.requests.count("/cgi-bin/token") == 1
+
+
+def test_async_client_concurrency(server):
+    server.delay = 0.05
+
+    async def main():
+        client = make_client(server, concurrency=2)
+        await asyncio.gather(*[client.get_user_info("openid_%s" % i)
+                               for i in range(8)])
+        await client.close()
+
+    run(main())
+    assert len(server.requests) == 8
+    assert server.max_inflight == 2
+
+
+def test_async_client_async_storage(server):
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    async def main():
+        storage = AsyncSqlite3Storage(":memory:")
+        await storage.set(TOKEN_KEY, "EXPIRED")
+        config = Config(storage=storage, server=server, appid="wx", appsec="sec")
+        client = LocalClient(config)
+
+        results = await asyncio.gather(*[client.get_menu() for _ in range(3)])
+        assert results == [{"button": []}] * 3
+        assert await storage.get(TOKEN_KEY, encoding="utf-8") == "NEW"
+
+        # token不存在时自动获取
+        await storage.delete(TOKEN_KEY)
+        assert await client.get_menu() == {"button": []}
+        assert await client.refresh_access_token() == "NEW"
+
+        await client.close()
+        await storage.close()
+
+    run(main())
+    assert server.requests.count("/cgi-bin/token") == 3
+
+
+def test_async_client_user_info_many(server):
+    server.delay = 0.05
+    openids = ["openid_%s" % i for i in range(350)]
+
+    async def main():
+        client = make_client(server, concurrency=4)
+        result = await client.get_user_info_many(openids)
+        assert [info["nickname"] for info in result] == \
+            [openid.upper() for openid in openids]
+
+        # 第二次全部命中缓存
+        assert await client.get_user_info_many(openids[::-1]) == result[::-1]
+        await client.close()
+
+    run(main())
+    assert server.requests == ["/cgi-bin/user/info/batchget"] * 4
+    # 各组同时请求
+    assert server.max_inflight == 4
+
+
+def test_async_client_user_info_many_async_storage(server):
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    openids = ["openid_%s" % i for i in range(150)] + ["error"]
+
+    async def main():
+        storage = AsyncSqlite3Storage(":memory:")
+        await storage.set(TOKEN_KEY, "NEW")
+        config = Config(storage=storage, server=server, appid="wx", appsec="sec")
+        client = LocalClient(config)
+        assert client.user_info_cache is storage
+
+        errors = []
+        result = await client.get_user_info_many(openids, errors=errors)
+        assert result[0] == dict(openid="openid_0", nickname="OPENID_0")
+        # 出错的一组返回 None
+        assert result[100:] == [None] * 51
+        assert [(len(chunk), e.code) for chunk, e in errors] == [(51, 45009)]
+        assert await storage.get("userinfo:zh_CN:openid_0",
+                                 encoding="utf-8") == result[0]
+
+        assert await client.get_user_info_many(openids[:100]) == result[:100]
+        await client.close()
+        await storage.close()
+
+    run(main())
+    assert server.requests == ["/cgi-bin/user/info/batchget"] * 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
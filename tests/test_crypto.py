@@ -1,4 +1,6 @@
 # encoding=utf-8
+import pytest
+
 from weixin.crypto import*
 
 
@@ -45,3 +47,86 @@ def test_xmlmsg_en_decrypt():
     de_result = xml_cryptor.decrypt(param_dict['enctext'])
 
     assert de_result == msg
+
+
+def test_xmlmsg_encrypt_chunks():
+    chunks = [b"<xml>", "你好".encode(), b"</xml>"]
+
+    param_dict = xml_cryptor.encrypt(chunks, binary=True)
+    assert isinstance(param_dict['enctext'], bytes)
+    assert isinstance(param_dict['signature'], bytes)
+
+    de_result = xml_cryptor.decrypt(param_dict['enctext'])
+    assert de_result == "<xml>你好</xml>"
+
+
+def test_aes_backends():
+    backends = []
+    for name in ("pycrypto", "cryptography"):
+        try:
+            get_backend(name)
+        except CryptorError:
+            # 未安装的实现不做测试
+            continue
+        backends.append(name)
+
+    key = b'k' * 32
+
+    for name in backends:
+        cipher = AESCipher(key, backend=name)
+        for other in backends:
+            enc = AESCipher(key, backend=other).encrypt(b'x' * 100)
+            assert cipher.decrypt(enc) == b'x' * 100
+
+
+def test_aes_invalid_padding():
+    cipher = AESCipher(b'k' * 32)
+
+    assert cipher.unpad(b'a' * 30 + b'\x02\x02') == b'a' * 30
+    for data in [b'a' * 31 + b'\x00', b'a' * 31 + b'\x21', b'a' * 30 + b'\x01\x02']:
+        with pytest.raises(CryptorError):
+            cipher.unpad(data)
+
+    with pytest.raises(CryptorError):
+        cipher.decrypt(base64_encode(b'a' * 15))
+
+
+def test_xmlmsg_batch():
+    msgs = ["<xml><Content>%d</Content></xml>" % i for i in range(10)]
+    encrypted = [kw for kw, err in xml_cryptor.encrypt_many(msgs)]
+    assert all(encrypted)
+
+    other = XMLMsgCryptor('wx' + 'b'*16, 'A'*20, 'A'*43)
+    enctexts = [kw['enctext'] for kw in encrypted]
+    enctexts[3] = other.encrypt(msgs[3])['enctext']
+    enctexts[5] = "not base64!"
+
+    for workers in (None, 2):
+        results = list(xml_cryptor.decrypt_many(
+            enctexts, workers=workers, chunksize=4))
+
+        assert len(results) == 10
+        for i, (xml, err) in enumerate(results):
+            if i in (3, 5):
+                assert xml is None and err is not None
+            else:
+                assert xml == msgs[i] and err is None
+
+    assert isinstance(results[3][1], CryptorError)
+
+
+def test_xmlmsg_batch_bounded():
+    enctext = xml_cryptor.encrypt("<xml></xml>")['enctext']
+    consumed = []
+
+    def enctexts():
+        for i in range(10000):
+            consumed.append(i)
+            yield enctext
+
+    results = xml_cryptor.decrypt_many(enctexts(), workers=2, chunksize=10)
+    assert next(results) == ("<xml></xml>", None)
+    # 只读取了正在处理的块, 提前关闭时取消其余的块
+    assert len(consumed) <= 10 * (2 * 2 + 1)
+    results.close()
+    assert len(consumed) <= 10 * (2 * 2 + 1)
@@ -0,0 +1,107 @@
+# encoding=utf-8
+import time
+import threading
+
+from weixin.dedup import *
+from weixin.storage import StorageBase
+from weixin.utils import AttributeDict
+
+
+class DictStorage(StorageBase):
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, encoding=None):
+        return self.data.get(key)
+
+    def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.data[key] = pyobj
+
+
+def test_dedup_key():
+    assert message_dedup_key(AttributeDict(MsgId="1")) == "msg:1"
+    assert message_dedup_key(
+        AttributeDict(FromUserName="u", CreateTime="2")) == "event:u:2"
+    assert message_dedup_key(AttributeDict()) is None
+
+
+def test_dedup_concurrent():
+    dedup = MessageDeduplicator()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        time.sleep(0.2)
+        return "<xml>reply</xml>"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(dedup.run("k", handler)))
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["<xml>reply</xml>"] * 3
+
+    # 处理完成后的重复消息直接命中缓存
+    assert dedup.run("k", handler) == "<xml>reply</xml>"
+    assert len(calls) == 1
+
+    # 无法确定key的消息不去重
+    dedup.run(None, handler)
+    assert len(calls) == 2
+
+
+def test_dedup_storage():
+    storage = DictStorage()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return "reply"
+
+    MessageDeduplicator(storage).run("k", handler)
+    # 另一个节点从存储器读取回复
+    assert MessageDeduplicator(storage).run("k", handler) == "reply"
+    assert len(calls) == 1
+
+
+def test_dedup_storage_bytes():
+    storage = DictStorage()
+
+    # 加密的回复是 bytes, 从存储器读取时类型不变
+    for result in [b"<xml>\xe5\x9b\x9e\xff</xml>", u"<xml>回复</xml>", "b:reply"]:
+        key = repr(result)
+        MessageDeduplicator(storage).run(key, lambda: result)
+        cached = MessageDeduplicator(storage).run(key, lambda: None)
+        assert cached == result
+        assert type(cached) is type(result)
+
+
+def test_dedup_none_result():
+    storage = DictStorage()
+    calls = []
+
+    def handler():
+        # 只有副作用的处理器
+        calls.append(1)
+
+    dedup = MessageDeduplicator(storage)
+    assert dedup.run("k", handler) is None
+    assert dedup.run("k", handler) is None
+    # 其他节点同样不再调用
+    assert MessageDeduplicator(storage).run("k", handler) is None
+    assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    test_dedup_key()
+    test_dedup_concurrent()
+    test_dedup_storage()
+    test_dedup_storage_bytes()
+    test_dedup_none_result()
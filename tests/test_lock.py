@@ -0,0 +1,195 @@
+# encoding=utf-8
+import asyncio
+import threading
+import time
+import pytest
+
+from weixin.dedup import MessageDeduplicator
+from weixin.lock import *
+from weixin.main import Weechat
+from weixin.storage import Sqlite3Storage, RedisStorage
+
+
+def make_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStorage(client=fakeredis.FakeStrictRedis())
+
+
+def test_local_lock():
+    lock = LocalLock(stripes=4, timeout=0.05)
+
+    token = lock.acquire("openid")
+    assert token is not None
+    assert lock.acquire("openid") is None
+
+    lock.release("openid", token)
+    with lock.hold("openid") as token:
+        assert token is not None
+
+    stats = lock.stats.as_dict()
+    assert stats["acquired"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["contended"] == 1
+    assert stats["max_wait"] >= 0.05
+
+
+@pytest.mark.parametrize("make_storage", [
+    lambda: Sqlite3Storage(":memory:"),
+    lambda: Sqlite3Storage(":memory:", commit_interval=1),
+    make_redis,
+])
+def test_storage_lock(make_storage):
+    storage = make_storage()
+    lock = StorageLock(storage, ttl=0.2, timeout=0.05)
+
+    token = lock.acquire("openid")
+    assert token is not None
+    assert lock.acquire("openid") is None
+    assert lock.acquire("other") is not None
+
+    assert not lock.release("openid", token + 100)
+    assert lock.release("openid", token)
+    assert not lock.release("openid", token)
+
+    # 令牌递增, 持有者崩溃后锁在 ttl 后过期
+    second = lock.acquire("openid")
+    assert second > token
+    time.sleep(0.3)
+    third = lock.acquire("openid")
+    assert third > second
+    assert not lock.release("openid", second)
+
+    assert lock.stats.timeouts == 1
+
+
+def test_reply_session_lock():
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    app.set_storage(Sqlite3Storage(":memory:"))
+    app.add_config("session_autosave", True)
+    app.add_config("session_lock", LocalLock())
+    tokens = []
+
+    @app.text_filter(["count"])
+    def count(req):
+        value = req.session["count"] or 0
+        time.sleep(0.01)
+        req.session["count"] = value + 1
+        tokens.append(req.lock_token)
+        return "ok"
+
+    xml = "<xml>" \
+          "<ToUserName><![CDATA[toUser]]></ToUserName>" \
+          "<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+          "<CreateTime>123456789</CreateTime>" \
+          "<MsgType><![CDATA[text]]></MsgType>" \
+          "<Content><![CDATA[count]]></Content>" \
+          "</xml>"
+
+    threads = [threading.Thread(target=app.reply, args=(xml,))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 加锁后没有丢失的更新
+    storage = app.config.storage
+    assert storage.get("session:fromUser", encoding="utf-8") == {"count": 10}
+    assert None not in tokens
+    assert app.config.session_lock.stats.acquired == 10
+
+    async def main():
+        return await asyncio.gather(
+            *[app.reply_async(xml) for _ in range(5)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) == ["ok"] * 5
+    finally:
+        loop.close()
+
+    assert storage.get("session:fromUser", encoding="utf-8") == {"count": 15}
+
+
+@pytest.mark.parametrize("on_timeout", ["drop", "raise", "proceed"])
+def test_reply_lock_timeout(on_timeout):
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    app.set_storage(Sqlite3Storage(":memory:"))
+    lock = LocalLock(timeout=0.05, on_timeout=on_timeout)
+    app.add_config("session_lock", lock)
+    app.add_config("deduplicator", MessageDeduplicator())
+    calls = []
+
+    @app.text_filter(["count"])
+    def count(req):
+        calls.append(req.lock_token)
+        return "ok"
+
+    xml = "<xml>" \
+          "<ToUserName><![CDATA[toUser]]></ToUserName>" \
+          "<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+          "<CreateTime>123456789</CreateTime>" \
+          "<MsgType><![CDATA[text]]></MsgType>" \
+          "<Content><![CDATA[count]]></Content>" \
+          "<MsgId>1</MsgId>" \
+          "</xml>"
+
+    # 其他请求持有锁
+    token = lock.acquire("fromUser")
+
+    def reply():
+        loop = asyncio.new_event_loop()
+        try:
+            return [app.reply(xml),
+                    loop.run_until_complete(app.reply_async(xml))]
+        finally:
+            loop.close()
+
+    if on_timeout == "raise":
+        with pytest.raises(LockTimeoutError):
+            app.reply(xml)
+        assert calls == []
+    elif on_timeout == "drop":
+        assert reply() == [None, None]
+        assert calls == []
+    else:
+        # 第二次命中去重缓存
+        assert reply() == ["ok", "ok"]
+        assert calls == [None]
+    assert lock.stats.timeouts >= 1
+
+    # 超时的消息没有被去重缓存, 锁释放后重试可以正常处理
+    lock.release("fromUser", token)
+    if on_timeout != "proceed":
+        assert app.reply(xml) == "ok"
+        assert len(calls) == 1 and calls[0] is not None
+
+
+def test_async_storage_lock():
+    pytest.importorskip("aiosqlite")
+    fakeredis = pytest.importorskip("fakeredis")
+    from weixin.storage import AsyncSqlite3Storage, AsyncRedisStorage
+
+    async def check(storage):
+        lock = StorageLock(storage, ttl=1, timeout=0.05)
+        token = await lock.acquire_async("openid")
+        assert token is not None
+        assert await lock.acquire_async("openid") is None
+        assert await lock.release_async("openid", token)
+        assert await lock.acquire_async("openid") > token
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(check(AsyncSqlite3Storage(":memory:")))
+        loop.run_until_complete(
+            check(AsyncRedisStorage(client=fakeredis.FakeAsyncRedis())))
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    test_local_lock()
+    test_storage_lock(lambda: Sqlite3Storage(":memory:"))
+    test_reply_session_lock()
+    test_reply_lock_timeout("drop")
+    test_async_storage_lock()
@@ -0,0 +1,154 @@
+# encoding=utf-8
+import asyncio
+
+from weixin.main import Weechat
+from weixin.dedup import MessageDeduplicator
+from weixin.storage import StorageBase, Sqlite3Storage
+
+
+class AsyncDictStorage(StorageBase):
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key, encoding=None):
+        return self.data.get(key)
+
+    async def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.data[key] = pyobj
+
+
+def make_event(event, key=None):
+    xml = "<xml>" \
+          "<ToUserName><![CDATA[toUser]]></ToUserName>" \
+          "<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+          "<CreateTime>123456789</CreateTime>" \
+          "<MsgType><![CDATA[event]]></MsgType>" \
+          "<Event><![CDATA[{0}]]></Event>" \
+          "{1}" \
+          "</xml>"
+    ek = "<EventKey><![CDATA[%s]]></EventKey>" % key if key else ""
+    return xml.format(event, ek)
+
+
+def make_text(content):
+    return "<xml>" \
+           "<ToUserName><![CDATA[toUser]]></ToUserName>" \
+           "<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+           "<CreateTime>123456789</CreateTime>" \
+           "<MsgType><![CDATA[text]]></MsgType>" \
+           "<Content><![CDATA[%s]]></Content>" \
+           "<MsgId>123456789</MsgId>" \
+           "</xml>" % content
+
+
+def test_dispatch():
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    finished = []
+
+    app.click_event(lambda req: "click")
+    app.click_event_filter("settings")(lambda req: "click_settings")
+    app.scan_event_filter("1001")(lambda req: "scan_1001")
+    app.subscribe_event(lambda req: "subscribe")
+    app.on_finish(lambda req: finished.append(req))
+    app.text_filter(["hello"])(lambda req: "hello")
+    app.as_text_filter_default(lambda req: "text")
+
+    assert app.reply(make_event("CLICK", "settings")) == "click_settings"
+    assert app.reply(make_event("click", "other")) == "click"
+    assert app.reply(make_event("SCAN", "1001")) == "scan_1001"
+    assert app.reply(make_event("subscribe")) == "subscribe"
+    assert app.reply(make_event("VIEW")) is None
+    assert app.reply(make_text("hello")) == "hello"
+    assert app.reply(make_text("world")) == "text"
+    assert len(finished) == 7
+
+    # 初始化之后注册的处理器同样生效
+    app.view_event(lambda req: "view")
+    assert app.reply(make_event("VIEW")) == "view"
+
+
+def test_dedup():
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    app.add_config("deduplicator", MessageDeduplicator())
+    calls = []
+
+    @app.text
+    def text(req):
+        calls.append(req)
+        return "reply"
+
+    assert app.reply(make_text("hello")) == "reply"
+    assert app.reply(make_text("hello")) == "reply"
+    assert len(calls) == 1
+
+
+def test_reply_async():
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    app.set_storage(AsyncDictStorage())
+    app.add_config("deduplicator", MessageDeduplicator())
+    calls = []
+
+    @app.text_filter(["hello"])
+    async def hello(req):
+        calls.append(req)
+        session = await req.session_async()
+        session["count"] = (session["count"] or 0) + 1
+        await session.save_async()
+        await asyncio.sleep(0.1)
+        return "hello"
+
+    @app.subscribe_event
+    def subscribe(req):
+        return "subscribe"
+
+    async def main():
+        return await asyncio.gather(
+            app.reply_async(make_text("hello")),
+            app.reply_async(make_text("hello")),
+            app.reply_async(make_event("subscribe")),
+        )
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+    assert results == ["hello", "hello", "subscribe"]
+    assert len(calls) == 1
+    assert app.config.storage.data["session:fromUser"] == {"count": 1}
+
+
+def test_session_autosave():
+    app = Weechat(token='A'*20, appid='wx' + 'a'*16)
+    app.set_storage(Sqlite3Storage(":memory:"))
+    app.add_config("session_autosave", True)
+
+    @app.text_filter(["count"])
+    def count(req):
+        req.session["count"] = (req.session["count"] or 0) + 1
+        return str(req.session["count"])
+
+    @app.text_filter(["read"])
+    def read(req):
+        return str(req.session["count"])
+
+    @app.text_filter(["none"])
+    def none(req):
+        return "none"
+
+    assert app.reply(make_text("count")) == "1"
+    assert app.reply(make_text("count")) == "2"
+    assert app.reply(make_text("read")) == "2"
+    assert app.reply(make_text("none")) == "none"
+
+    storage = app.config.storage
+    assert storage.get("session:fromUser", encoding="utf-8") == {"count": 2}
+
+
+if __name__ == "__main__":
+    test_dispatch()
+    test_dedup()
+    test_reply_async()
+    test_session_autosave()
@@ -1,4 +1,7 @@
 # encoding=utf-8
+import pytest
+from xml.parsers.expat import ExpatError
+
 from weixin.parse import *
 
 
@@ -174,6 +177,116 @@ def test_link_msg():
     assert msg.Url == 'url'
 
 
+def test_nested_msg():
+    print('test_nested_msg')
+    xml = b"""<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <MsgType><![CDATA[event]]></MsgType>
+    <Event><![CDATA[pic_sysphoto]]></Event>
+    <SendPicsInfo><Count>2</Count>
+    <PicList>
+    <item><PicMd5Sum><![CDATA[1b5f7c23b5bf75682a53e7b6d163e185]]></PicMd5Sum></item>
+    <item><PicMd5Sum><![CDATA[2b5f7c23b5bf75682a53e7b6d163e185]]></PicMd5Sum></item>
+    </PicList>
+    </SendPicsInfo>
+    <Empty></Empty>
+    </xml>
+    """
+    msg = WeixinMsg(xml)
+
+    assert msg.ToUserName == 'toUser'
+    assert msg.Empty is None
+    assert msg.SendPicsInfo['Count'] == '2'
+    items = msg.SendPicsInfo['PicList']['item']
+    assert len(items) == 2
+    assert items[1]['PicMd5Sum'] == '2b5f7c23b5bf75682a53e7b6d163e185'
+
+
+def test_reject_entity():
+    print('test_reject_entity')
+    xml = """<?xml version="1.0"?>
+    <!DOCTYPE xml [<!ENTITY a "aaaaaaaaaa">]>
+    <xml><Content>&a;&a;</Content></xml>
+    """
+    with pytest.raises(ExpatError):
+        WeixinMsg(xml)
+
+    with pytest.raises(KeyError):
+        WeixinMsg("<notxml><Content>a</Content></notxml>")
+
+
+def test_lazy_msg():
+    print('test_lazy_msg')
+    xml = """<xml>
+    <ToUserName><![CDATA[toUser]]></ToUserName>
+    <FromUserName><![CDATA[fromUser]]></FromUserName>
+    <CreateTime>123456789</CreateTime>
+    <MsgType><![CDATA[event]]></MsgType>
+    <Event><![CDATA[scancode_push]]></Event>
+    <EventKey><![CDATA[6]]></EventKey>
+    <ScanCodeInfo><ScanType><![CDATA[qrcode]]></ScanType>
+    <ScanResult><![CDATA[1]]></ScanResult>
+    </ScanCodeInfo>
+    <Label>a &amp; b</Label>
+    <Empty/>
+    </xml>
+    """
+    msg = LazyWeixinMsg(xml)
+
+    assert msg.MsgType == 'event'
+    # 只有访问过的节点被解码
+    assert list(msg.keys()) == ['MsgType']
+    assert 'ScanCodeInfo' in msg
+    assert msg.ScanCodeInfo['ScanType'] == 'qrcode'
+    assert msg.Label == 'a & b'
+    assert msg.Empty is None
+    assert msg.NotExist is None
+
+    assert msg.materialize() == WeixinMsg(xml)
+
+    with pytest.raises(ExpatError):
+        LazyWeixinMsg('<!DOCTYPE xml [<!ENTITY a "a">]><xml></xml>')
+
+
+@pytest.mark.parametrize("xml", [
+    b"<xml><Content><![CDATA[a\r\nb\rc]]></Content></xml>",
+    b"<xml><Content>a\r\nb\rc</Content></xml>",
+    b"\xef\xbb\xbf<xml><Content><![CDATA[bom]]></Content></xml>",
+    b"<xml><Content>x</Content></xml>\n<!-- end -->\n",
+    b'<xml a="1"><Content>x</Content></xml>',
+    b"<xml>text<Content>x</Content></xml>",
+    b'<xml><A x="a>b"/><Content x="1>">x</Content></xml>',
+    b"<xml><A><![CDATA[</A>]]></A><Content>x</Content></xml>",
+    b"<xml><A><!-- <A> --><A>x</A><?p </A>?></A><Content>x</Content></xml>",
+    u'<?xml version="1.0" encoding="ISO-8859-1"?>'
+    u'<xml><Content>\xe9</Content></xml>'.encode("latin-1"),
+])
+def test_lazy_msg_equivalence(xml):
+    print('test_lazy_msg_equivalence')
+    msg = LazyWeixinMsg(xml)
+    assert msg.Content == WeixinMsg(xml).Content
+    assert msg.materialize() == WeixinMsg(xml)
+
+
+@pytest.mark.parametrize("xml, error", [
+    (b"<xml><Content>x</Content></xml>junk", ExpatError),
+    (b"<xml><MsgType>text</Foo></xml>", ExpatError),
+    (b"<xml><A><B>1</C></A></xml>", ExpatError),
+    (b"<xml><!-- a -- b --><MsgType>text</MsgType></xml>", ExpatError),
+    (b"<xml><Content>\xff\xfe</Content></xml>", ExpatError),
+    (b"<notxml><Content>x</Content></notxml>", KeyError),
+    (b"<xml></xml>", TypeError),
+])
+def test_lazy_msg_rejects(xml, error):
+    print('test_lazy_msg_rejects')
+    # 与 WeixinMsg 拒绝相同的输入, 并在构造时抛出相同的异常
+    with pytest.raises(error) as eager:
+        WeixinMsg(xml)
+    with pytest.raises(error) as lazy:
+        LazyWeixinMsg(xml)
+    assert str(lazy.value) == str(eager.value)
+
+
 if __name__ == "__main__":
     test_text_msg()
     test_image_msg()
@@ -182,3 +295,7 @@ if __name__ == "__main__":
     test_shortvideo_msg()
     test_location_msg()
     test_link_msg()
+    test_nested_msg()
+    test_reject_entity()
+    test_lazy_msg()
+    test_lazy_msg_rejects(b"<xml><MsgType>text</Foo></xml>", ExpatError)
@@ -145,3 +145,30 @@ def test_article_reply():
     msg = WeixinMsg(msg.xml)
     assert_msg(msg)
 
+
+def test_reply_template():
+    template = ReplyTemplate("<a>{A}</a>100%<b>{B}</b>")
+    assert template.fields == ('A', 'B')
+    assert template.render_values((1, "b")) == "<a>1</a>100%<b>b</b>"
+
+    msg = Text("a]]>b")
+    msg.postmark(from_msg, created=123456789)
+
+    assert msg['Content'] == 'a]]&gt;b'
+    assert msg.xml == \
+        "<xml>" \
+        "<ToUserName><![CDATA[fromUser]]></ToUserName>" \
+        "<FromUserName><![CDATA[toUser]]></FromUserName>" \
+        "<CreateTime>123456789</CreateTime>" \
+        "<MsgType><![CDATA[text]]></MsgType>" \
+        "<Content><![CDATA[a]]&gt;b]]></Content>" \
+        "</xml>"
+    assert msg.xml_bytes == msg.xml.encode("utf-8")
+
+
+def test_reply_bytes_none():
+    # 未设置内容的回复, bytes 与 str 渲染结果一致
+    msg = Text(None)
+    msg.postmark(from_msg, created=123456789)
+    assert msg.xml_bytes == msg.xml.encode("utf-8")
+    assert b"<Content><![CDATA[None]]></Content>" in msg.xml_bytes
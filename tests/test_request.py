@@ -37,6 +37,8 @@ enc_cfg['cryptor'] = XMLMsgCryptor(
 @pytest.mark.parametrize("config,umsg", [
     (Config(**common_cfg), text_msg),
     (Config(**enc_cfg), text_msg_encrypted),
+    (Config(lazy_message=True, **common_cfg), text_msg),
+    (Config(lazy_message=True, **enc_cfg), text_msg_encrypted),
 ])
 def test_request(config, umsg):
 
@@ -65,6 +67,9 @@ def test_request(config, umsg):
     assert_req_msg(req)
 
     req.render(Text, "hello")
+    if config.cryptor:
+        # 加密回复直接以字节返回
+        assert isinstance(req.get_response_xml(), bytes)
     resp_msg = WeixinMsg(req.get_response_xml())
     assert_reply(resp_msg)
 
@@ -0,0 +1,52 @@
+# encoding=utf-8
+import re
+from weixin.router import *
+
+
+def test_keyword_match():
+    router = TextFilterRouter()
+    router.add(["签到", "sign"], "sign")
+    router.add(["help", "帮助"], "help")
+
+    assert router.match("签到") == "sign"
+    assert router.match("  sign \n") == "sign"
+    assert router.match("帮助") == "help"
+    assert router.match("签到啊") is None
+    assert router.match("") is None
+
+
+def test_registration_priority():
+    router = TextFilterRouter()
+    router.add(r"^h", "regex_h")
+    router.add(["help", "hi"], "keyword")
+    router.add(["help"], "keyword_late")
+    router.add(r".*", "regex_all")
+
+    # 先注册的正则表达式优先于后注册的关键词
+    assert router.match("help") == "regex_h"
+    # 先注册的规则都不匹配时, 按注册顺序匹配到后注册的正则表达式
+    assert router.match("xhelp") == "regex_all"
+
+    router = TextFilterRouter()
+    router.add(["help"], "keyword")
+    router.add(["help"], "keyword_late")
+    router.add(re.compile(".*"), "regex_all")
+
+    # 先注册的关键词优先于后注册的关键词和正则表达式
+    assert router.match("help") == "keyword"
+    assert router.match("other") == "regex_all"
+
+
+def test_regex_keyword():
+    router = TextFilterRouter()
+    router.add(["a.c", "plain"], "mixed")
+
+    assert router.match("abc") == "mixed"
+    assert router.match("plain") == "mixed"
+    assert router.match("ab") is None
+
+
+if __name__ == "__main__":
+    test_keyword_match()
+    test_registration_priority()
+    test_regex_keyword()
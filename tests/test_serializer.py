@@ -0,0 +1,89 @@
+# encoding=utf-8
+import msgpack
+import pytest
+
+from weixin.storage import Sqlite3Storage, Serializer
+from weixin.storage.serializer import MARKER, UnknownCodecError, get_codec
+
+
+SESSION = {
+    "state": "bind",
+    "nickname": "你好",
+    "history": ["hello"] * 200,
+    "avatar": b"\x89PNG\r\n",
+}
+
+
+def test_serializer_roundtrip():
+    serializer = Serializer()
+
+    for value in ("token", "你好", b"\x00\xff", 12, [1, "a"], SESSION, None):
+        data = serializer.dumps(value)
+        assert serializer.loads(data, encoding="utf-8") == value
+
+    # 未指定encoding时字符串以bytes返回
+    assert serializer.loads(serializer.dumps("token")) == b"token"
+    assert serializer.loads(serializer.dumps({"a": "b"})) == {b"a": b"b"}
+    assert serializer.loads(serializer.dumps(b"raw"), encoding="utf-8") == b"raw"
+
+    # str 与 bytes 不经过 msgpack, 其他对象与旧版本的格式相同
+    assert serializer.dumps("token") == MARKER + b"s" + b"token"
+    assert serializer.dumps(b"raw") == MARKER + b"b" + b"raw"
+    assert serializer.dumps(SESSION) == msgpack.dumps(SESSION)
+    assert serializer.loads(None) is None
+
+    # 带标记的 msgpack 数据
+    data = MARKER + b"m" + msgpack.dumps({"a": "b"})
+    assert serializer.loads(data, encoding="utf-8") == {"a": "b"}
+
+
+def test_serializer_unknown_codec():
+    # 如其他节点写入的 lz4 数据, 而本节点未安装 lz4
+    with pytest.raises(UnknownCodecError) as e:
+        Serializer().loads(MARKER + b"?" + b"data")
+    assert "b'?'" in str(e.value)
+
+
+def test_serializer_legacy():
+    serializer = Serializer()
+
+    data = msgpack.dumps({"a": "b"})
+    assert serializer.loads(data, encoding="utf-8") == {"a": "b"}
+    assert serializer.loads(data) == {b"a": b"b"}
+    assert serializer.loads(msgpack.dumps("value")) == b"value"
+
+
+@pytest.mark.parametrize("compress", ["zlib", "lz4"])
+def test_serializer_compress(compress):
+    if compress == "lz4":
+        pytest.importorskip("lz4.frame")
+
+    serializer = Serializer(compress=compress, threshold=256)
+    small = serializer.dumps({"a": 1})
+    large = serializer.dumps(SESSION)
+
+    assert small == msgpack.dumps({"a": 1})
+    assert large[1:2] == get_codec(compress).tag
+    assert len(large) < len(Serializer().dumps(SESSION))
+
+    # 任意配置写入的数据都可以被其他配置读取
+    assert Serializer().loads(large, encoding="utf-8") == SESSION
+
+
+def test_storage_serializer():
+    storage = Sqlite3Storage(":memory:")
+    storage.serializer = Serializer(compress="zlib", threshold=128)
+
+    storage.set("session", SESSION)
+    storage.set("token", "ACCESS_TOKEN")
+    assert storage.get("session", encoding="utf-8") == SESSION
+    assert storage.get("token", encoding="utf-8") == "ACCESS_TOKEN"
+    assert storage.get("token") == b"ACCESS_TOKEN"
+
+
+if __name__ == "__main__":
+    test_serializer_roundtrip()
+    test_serializer_legacy()
+    test_serializer_unknown_codec()
+    test_serializer_compress("zlib")
+    test_storage_serializer()
@@ -1,5 +1,6 @@
 # encoding=utf-8
 import time
+import pytest
 from weixin.config import *
 from weixin.storage import *
 from weixin.session import *
@@ -43,3 +44,132 @@ def test_session():
     time.sleep(3)
     session = Session(request)
     assert session('exp') == None
+
+
+class CountingStorage(Sqlite3Storage):
+
+    def __init__(self):
+        super(CountingStorage, self).__init__(":memory:")
+        self.calls = []
+
+    def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.calls.append("set")
+        super(CountingStorage, self).set(key, pyobj, expires, encoding)
+
+    def touch(self, key, expires=86400):
+        self.calls.append("touch")
+        return super(CountingStorage, self).touch(key, expires)
+
+
+def test_dirty_tracking():
+    storage = CountingStorage()
+    req = Config(
+        message=Config(FromUserName="openid"),
+        config=Config(storage=storage)
+    )
+
+    # 新会话未修改时不写入
+    session = Session(req)
+    session.save()
+    assert storage.calls == []
+
+    session['k1'] = 'v1'
+    session.save(expires=30)
+    session.save(expires=60)
+    assert storage.calls == ["set", "touch"]
+    assert 30 < storage.get_ttl(session.session_id()) <= 60
+
+    session = Session(req)
+    assert session['k1'] == 'v1' and not session.dirty
+    session('k1')
+    session.save()
+    assert storage.calls == ["set", "touch", "touch"]
+
+    del session['k1']
+    session.save()
+    assert storage.calls[-1] == "set"
+    assert Session(req)['k1'] is None
+
+    # 销毁后的空会话不再写入
+    count = len(storage.calls)
+    session.destroy()
+    session.save()
+    assert len(storage.calls) == count
+    assert storage.touch("missing") is False
+
+
+def make_redis_storage():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStorage(client=fakeredis.FakeStrictRedis())
+
+
+class BlobStorage(StorageBase):
+    """
+    未实现哈希接口的存储器, 使用默认实现
+    """
+
+    def __init__(self):
+        self.storage = Sqlite3Storage(":memory:")
+
+    def get(self, key, encoding=None):
+        return self.storage.get(key, encoding=encoding)
+
+    def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.storage.set(key, pyobj, expires=expires, encoding=encoding)
+
+    def delete(self, key):
+        self.storage.delete(key)
+
+    def get_ttl(self, key):
+        return self.storage.get_ttl(key)
+
+
+def check_hash_session(storage):
+    req = Config(
+        message=Config(FromUserName="openid"),
+        config=Config(storage=storage)
+    )
+
+    # 同一用户的两个请求分别修改不同字段
+    first, second = HashSession(req), HashSession(req)
+    first['state'] = 'menu'
+    first('你好', '不好')
+    second['count'] = 1
+    first.save(expires=60)
+    second.save(expires=60)
+
+    session = HashSession(req)
+    assert session['state'] == 'menu'
+    assert session('你好') == '不好'
+    assert session['count'] == 1
+    assert session['key_not_exist'] is None
+    assert not session.dirty
+
+    del session['state']
+    session['count'] = {"a": [1, 2]}
+    session.save()
+
+    session = HashSession(req)
+    session.load(['state', 'count'])
+    assert session.dict == {'state': None, 'count': {"a": [1, 2]}}
+    assert session['你好'] == '不好'
+
+    # 构造时预先加载 prefetch 中的字段
+    class PrefetchSession(HashSession):
+        prefetch = ('count', 'state')
+
+    session = PrefetchSession(req)
+    assert session.dict == {'state': None, 'count': {"a": [1, 2]}}
+    assert PrefetchSession(req, load=False).dict == {}
+
+    session.destroy()
+    assert HashSession(req)['count'] is None
+
+
+@pytest.mark.parametrize("make_storage", [
+    lambda: Sqlite3Storage(":memory:"),
+    make_redis_storage,
+    BlobStorage,
+])
+def test_hash_session(make_storage):
+    check_hash_session(make_storage())
@@ -0,0 +1,69 @@
+# encoding=utf-8
+import sqlite3
+import time
+
+from weixin.storage import Sqlite3Storage
+
+
+def test_sqlite3_pragmas(tmpdir):
+    path = str(tmpdir.join("weixin.sqlite3"))
+    storage = Sqlite3Storage(path)
+
+    db = storage.database
+    assert db.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    # NORMAL == 1
+    assert db.execute("PRAGMA synchronous;").fetchone()[0] == 1
+
+    indexes = [r[1] for r in db.execute("PRAGMA index_list(storage);")]
+    assert "storage_expired" in indexes
+
+    storage = Sqlite3Storage(
+        str(tmpdir.join("legacy.sqlite3")), journal_mode=None, synchronous=None)
+    assert storage.database.execute(
+        "PRAGMA journal_mode;").fetchone()[0] == "delete"
+
+
+def test_sqlite3_reads_no_transaction():
+    storage = Sqlite3Storage(":memory:")
+    storage.set("key", {"a": 1})
+    assert not storage.database.in_transaction
+
+    assert storage.get("key", encoding="utf-8") == {"a": 1}
+    assert storage.get_ttl("key") > 0
+    assert not storage.is_expired("key")
+    assert storage.get_all_keys_by_wildcard("k*") == ["key"]
+    assert not storage.database.in_transaction
+
+
+def test_sqlite3_group_commit(tmpdir):
+    path = str(tmpdir.join("weixin.sqlite3"))
+    storage = Sqlite3Storage(path, commit_interval=0.2)
+    reader = sqlite3.connect(path)
+
+    def visible():
+        return reader.execute(
+            "SELECT count(*) FROM storage;").fetchone()[0]
+
+    for index in range(10):
+        storage.set("key_%s" % index, "value")
+
+    # 同一连接可以读到未提交的写入, 其他连接要等到提交之后
+    assert storage.get("key_9") == b"value"
+    assert visible() == 0
+
+    time.sleep(0.5)
+    assert visible() == 10
+
+    storage.set("key_10", "value")
+    storage.flush()
+    assert visible() == 11
+
+    storage.close()
+
+
+if __name__ == "__main__":
+    import py
+
+    test_sqlite3_pragmas(py.path.local.mkdtemp())
+    test_sqlite3_reads_no_transaction()
+    test_sqlite3_group_commit(py.path.local.mkdtemp())
@@ -0,0 +1,96 @@
+# encoding=utf-8
+import asyncio
+import pytest
+
+from weixin.storage import Sqlite3Storage, RedisStorage, StorageBase
+
+
+class DictStorage(StorageBase):
+    """
+    只实现单key方法, 批量方法使用默认实现
+    """
+
+    def __init__(self):
+        self.data = dict()
+
+    def get(self, key, encoding=None):
+        return self.unserialize(self.data.get(key), encoding=encoding)
+
+    def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.data[key] = self.serialize(pyobj, encoding=encoding)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def get_all_keys_by_wildcard(self, wildcard="*"):
+        return [k for k in self.data if k.startswith(wildcard.rstrip("*"))]
+
+
+def make_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStorage(client=fakeredis.FakeStrictRedis())
+
+
+@pytest.mark.parametrize("make_storage", [
+    DictStorage,
+    lambda: Sqlite3Storage(":memory:"),
+    make_redis,
+])
+def test_storage_many(make_storage):
+    storage = make_storage()
+
+    # 超过单条语句的参数上限, 分多条语句执行
+    mapping = dict(("user_%s" % i, {"n": i}) for i in range(1000))
+    storage.set_many(mapping, expires=60)
+    storage.set_many([("pair", "value")])
+
+    keys = ["user_3", "missing", "user_999", "pair", "user_3"]
+    assert storage.get_many(keys, encoding="utf-8") == \
+        [{"n": 3}, None, {"n": 999}, "value", {"n": 3}]
+    assert storage.get_many([]) == []
+
+    values = storage.get_many(list(mapping), encoding="utf-8")
+    assert values == list(mapping.values())
+
+    assert sorted(storage.iter_keys_by_wildcard("user_*")) == sorted(mapping)
+    assert len(storage.get_all_keys_by_wildcard("user_*")) == 1000
+
+    storage.delete_many(["user_%s" % i for i in range(500)] + ["missing"])
+    storage.delete_many([])
+    assert len(storage.get_all_keys_by_wildcard("user_*")) == 500
+    assert storage.get("user_1") is None
+    assert storage.get("user_500", encoding="utf-8") == {"n": 500}
+
+
+async def check_async_many(storage):
+    await storage.set_many(
+        dict(("user_%s" % i, i) for i in range(400)), expires=60)
+
+    assert await storage.get_many(["user_1", "missing", "user_399"]) == \
+        [1, None, 399]
+
+    await storage.delete_many(["user_%s" % i for i in range(100)])
+    assert len(await storage.get_all_keys_by_wildcard("user_*")) == 300
+
+
+def test_async_storage_many():
+    loop = asyncio.new_event_loop()
+    try:
+        pytest.importorskip("aiosqlite")
+        from weixin.storage import AsyncSqlite3Storage
+        storage = AsyncSqlite3Storage(":memory:")
+        loop.run_until_complete(check_async_many(storage))
+        loop.run_until_complete(storage.close())
+
+        fakeredis = pytest.importorskip("fakeredis")
+        from weixin.storage import AsyncRedisStorage
+        storage = AsyncRedisStorage(client=fakeredis.FakeAsyncRedis())
+        loop.run_until_complete(check_async_many(storage))
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    test_storage_many(DictStorage)
+    test_storage_many(lambda: Sqlite3Storage(":memory:"))
+    test_async_storage_many()
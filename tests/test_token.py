@@ -0,0 +1,176 @@
+# encoding=utf-8
+import asyncio
+import threading
+import time
+
+import pytest
+
+from weixin.config import Config
+from weixin.client_api import Client, ClientError
+from weixin.storage import Sqlite3Storage
+from weixin.token import AccessTokenManager, TOKEN_KEY
+
+
+class FakeFetch(object):
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            return dict(access_token="TOKEN_%s" % self.calls, expires_in=7200)
+
+
+def run_threads(target, count=10):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target()))
+               for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_token_single_flight():
+    fetch = FakeFetch(delay=0.1)
+    config = Config(storage=Sqlite3Storage(":memory:"))
+    manager = AccessTokenManager(config, fetch)
+
+    assert run_threads(manager.get_token) == ["TOKEN_1"] * 10
+    assert fetch.calls == 1
+    assert manager.get_token() == "TOKEN_1"
+
+    # 失效的token只刷新一次
+    results = run_threads(lambda: manager.refresh(stale="TOKEN_1"))
+    assert results == ["TOKEN_2"] * 10
+    assert fetch.calls == 2
+
+
+def test_token_multi_node(tmpdir):
+    path = str(tmpdir.join("weixin.sqlite3"))
+    fetch = FakeFetch(delay=0.2)
+
+    # 两个节点分别使用自己的存储器连接与管理器
+    managers = [AccessTokenManager(Config(storage=Sqlite3Storage(path)), fetch)
+                for _ in range(2)]
+
+    results = []
+    threads = [threading.Thread(
+                   target=lambda m=m: results.append(m.get_token()))
+               for m in managers * 3]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["TOKEN_1"] * 6
+    assert fetch.calls == 1
+
+
+def test_token_refresh_ahead():
+    fetch = FakeFetch()
+    storage = Sqlite3Storage(":memory:")
+    manager = AccessTokenManager(Config(storage=storage), fetch,
+                                 refresh_ahead=300)
+
+    storage.set(TOKEN_KEY, "OLD", expires=100)
+    wait = manager._tick(interval=60)
+    assert storage.get(TOKEN_KEY, encoding="utf-8") == "TOKEN_1"
+    assert wait == 60
+
+    # 剩余时间充足时不刷新
+    manager._tick(interval=60)
+    assert fetch.calls == 1
+
+    thread = manager.start(interval=60)
+    manager.stop()
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def test_token_async_storage():
+    pytest.importorskip("aiosqlite")
+    from weixin.storage import AsyncSqlite3Storage
+
+    fetch = FakeFetch()
+
+    async def async_fetch():
+        await asyncio.sleep(0.05)
+        return fetch()
+
+    async def main():
+        storage = AsyncSqlite3Storage(":memory:")
+        manager = AccessTokenManager(Config(storage=storage), async_fetch,
+                                     refresh_ahead=300)
+
+        tokens = await asyncio.gather(
+            *[manager.get_token_async() for _ in range(5)])
+        assert tokens == ["TOKEN_1"] * 5
+        assert await storage.get(TOKEN_KEY, encoding="utf-8") == "TOKEN_1"
+
+        assert await manager.refresh_async(stale="TOKEN_1") == "TOKEN_2"
+
+        # 即将过期时提前刷新
+        await storage.set(TOKEN_KEY, "OLD", expires=100)
+        assert await manager._tick_async(interval=60) == 60
+        assert await manager.get_token_async() == "TOKEN_3"
+
+        # 同步方法不能用于异步存储器
+        with pytest.raises(TypeError):
+            manager.get_token()
+        await storage.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert fetch.calls == 3
+
+
+class FakeClient(Client):
+
+    def __init__(self, config):
+        super(FakeClient, self).__init__(config)
+        self.requests = []
+
+    def _send(self, path, method, params, data, raw_response, **kwargs):
+        self.requests.append((path, params.get("access_token")))
+        if path == "/cgi-bin/token":
+            return dict(access_token="NEW", expires_in=7200)
+
+        if params["access_token"] != "NEW":
+            raise ClientError("invalid credential", code=40001)
+        return dict(errcode=0, menu={})
+
+
+def test_client_token_retry():
+    storage = Sqlite3Storage(":memory:")
+    storage.set(TOKEN_KEY, "EXPIRED")
+    client = FakeClient(Config(storage=storage, appid="wx", appsec="sec"))
+
+    assert client.get_menu() == {}
+    assert client.requests == [
+        ("/cgi-bin/menu/get", "EXPIRED"),
+        ("/cgi-bin/token", None),
+        ("/cgi-bin/menu/get", "NEW"),
+    ]
+
+    # token不存在时自动获取
+    storage.delete(TOKEN_KEY)
+    client.requests = []
+    assert client.get_menu() == {}
+    assert [p for p, _ in client.requests] == ["/cgi-bin/token",
+                                               "/cgi-bin/menu/get"]
+
+
+if __name__ == "__main__":
+    test_token_single_flight()
+    test_token_refresh_ahead()
+    test_token_async_storage()
+    test_client_token_retry()
@@ -1,4 +1,5 @@
 # encoding=utf-8
+import time
 from weixin.utils import *
 
 
@@ -62,9 +63,97 @@ def test_to_bytes():
     assert to_bytes(b'\xe6\x98\xaf') == b'\xe6\x98\xaf'
     
 
+
+def test_get_nonce():
+    table = set('0123456789'
+                'abcdefghijklmnopqrstuvwxyz'
+                'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+    for length in (0, 5, 16, 1000):
+        nonce = get_nonce(length)
+        assert isinstance(nonce, str)
+        assert len(nonce) == length
+        assert set(nonce) <= table
+
+    nonce = get_nonce_bytes(16)
+    assert isinstance(nonce, bytes)
+    assert len(nonce) == 16
+    assert get_nonce(16) != get_nonce(16)
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    # b 最久未被使用, 被淘汰
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.set("d", 4, ttl=-1)
+    assert cache.get("d") is None
+    cache.delete("a")
+    assert cache.get("a", 0) == 0
+
+
+def test_signature_verifier():
+    token = 'A' * 20
+    timestamp = str(int(time.time()))
+    sig = get_signature(token, "nonce", timestamp)
+
+    verifier = SignatureVerifier(token)
+    assert verifier.verify("nonce", timestamp, sig)
+    # 缓存命中
+    assert verifier.verify("nonce", timestamp, sig)
+    assert not verifier.verify("nonce", timestamp, "0" * 40)
+    assert not verifier.verify("nonce", "abc", sig)
+
+    old = str(int(time.time()) - 3600)
+    assert not verifier.verify("nonce", old, get_signature(token, "nonce", old))
+
+    verifier = SignatureVerifier(token, reject_replay=True)
+    assert verifier.verify("nonce", timestamp, sig)
+    assert not verifier.verify("nonce", timestamp, sig)
+
+    assert is_valid_request(token, "nonce", timestamp, sig)
+    assert not is_valid_request(token, "nonce", timestamp, "不是签名")
+    assert not is_valid_request(token, "nonce", timestamp, None)
+    assert not SignatureVerifier(token).verify("nonce", timestamp, None)
+
+    # 未来的时间戳在整个有效期内都不能被重放
+    now = [1000.0]
+    future = "1300"
+    sig = get_signature(token, "nonce", future)
+    verifier = SignatureVerifier(token, reject_replay=True,
+                                 clock=lambda: now[0])
+    assert verifier.cache.ttl == 600
+    assert verifier.verify("nonce", future, sig)
+    now[0] = 1599
+    assert not verifier.verify("nonce", future, sig)
+    # 缓存过期时时间戳也已超出有效期
+    now[0] = 1601
+    assert not verifier.verify("nonce", future, sig)
+
+    # 被淘汰的签名在有效期内可以重放
+    verifier = SignatureVerifier(token, cache_size=1, reject_replay=True,
+                                 clock=lambda: now[0])
+    timestamp = "1601"
+    sig = get_signature(token, "nonce", timestamp)
+    assert verifier.verify("nonce", timestamp, sig)
+    assert verifier.verify("other", timestamp,
+                           get_signature(token, "other", timestamp))
+    assert verifier.verify("nonce", timestamp, sig)
+
+
 if __name__ == "__main__":
     test_attrdict()
     test_get_signature()
     test_join_sequence()
     test_to_str()
     test_to_bytes()
+    test_get_nonce()
+    test_lru_cache()
+    test_signature_verifier()
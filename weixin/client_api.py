@@ -1,52 +1,86 @@
 # encoding=utf-8
+import logging
 import re
 import IPy
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps, loads
 
+from .storage.cached import CachedStorage
+from .token import AccessTokenManager, TOKEN_KEY
+from .transport import make_session, HttpxSession, DEFAULT_TIMEOUT, \
+    TRANSPORT_ERRORS
 from .utils import to_bytes
 
 
 __all__ = ["Client", "ClientError"]
 
 
+# access_token 无效或已过期
+TOKEN_INVALID_CODES = frozenset([40001, 42001])
+
+# 批量获取用户信息接口每次最多100个openid
+USER_INFO_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
 class ClientError(Exception):
-    pass
+
+    def __init__(self, message, code=None):
+        super(ClientError, self).__init__(message)
+        # 微信接口返回的错误码
+        self.code = code
 
 
 class Client(object):
 
-    def __init__(self, config):
+    def __init__(self, config, session=None, timeout=DEFAULT_TIMEOUT,
+                 http2=False):
         """
         config: config.Config 类
+        session: 复用连接的 requests.Session, 默认由 transport.make_session 创建
+        timeout: 请求超时 (连接超时, 读取超时) 秒
+        http2: 使用 httpx 的 HTTP/2 传输
         """
         self.config = config
+        self.timeout = timeout
+
+        if session is None:
+            session = HttpxSession() if http2 else make_session()
+        self.session = session
 
         # 设置默认的api服务器地址
         self.config.setnx("domain", "api.weixin.qq.com")
 
+        # 多个客户端可以通过 config.token_manager 共用一个token管理器
+        self.token_manager = self.config.token_manager
+        if self.token_manager is None:
+            self.token_manager = AccessTokenManager(
+                self.config, self.get_access_token)
+
+        self._user_info_cache = None
+
     def get_api_base(self, protocol="https"):
         return "".join([protocol, "://", self.config.domain])
 
     def get_access_token_from_db(self):
         storage = self.config.storage
-        token = storage.get("weixin:ACCESS_TOKEN", encoding="utf-8")
+        token = storage.get(TOKEN_KEY, encoding="utf-8")
         return token
 
     def refresh_access_token(self, expires=None):
-        result = self.get_access_token()
-
-        token = result["access_token"]
-        exp = expires or result['expires_in']
+        # 其他进程或节点同时刷新时使用它们的结果
+        return self.token_manager.refresh(
+            stale=self.get_access_token_from_db(), expires=expires)
 
-        storage = self.config.storage
-        storage.set("weixin:ACCESS_TOKEN", token, expires=exp)
-        return token
+    def close(self):
+        self.session.close()
 
     def _read_file(self, file):
         if re.match("^https?://", file):
             # 文件是url, 下载图片, 稍微伪装一下UA
-            resp = requests.get(file, headers={"User-Agent": "Mozilla/5.0"})
+            resp = self.session.get(file, headers={"User-Agent": "Mozilla/5.0"},
+                                    timeout=self.timeout)
             content = resp.content
 
         else:
@@ -58,6 +92,17 @@ class Client(object):
     def _format_json(self, data):
         return dumps(data, indent=4, ensure_ascii=False)
 
+    def _guess_media_type(self, media, media_type):
+        if media_type is None:
+            media_type = self.get_media_type_by_file_suffix(media)
+
+            # 无法获取媒体类型且用户未指定, 无法继续愉快玩耍
+            if not media_type:
+                raise ClientError(
+                    "cannot guess mediatype from %s." % media)
+
+        return media_type
+
     def get_media_type_by_file_suffix(self, filename):
         match = re.search("\.(?P<suffix>PNG|JPEG|JPG|GIF|AMR|MP3|MP4)$",
                           filename,
@@ -78,22 +123,32 @@ class Client(object):
 
     def make_request(self, path, method=None, params=None, data=None, with_token=False, raw_response=False, **kwargs):
         params = params or {}
-        if with_token:
-            # 如果请求需要token则在get参数中带上token
-            token = self.get_access_token_from_db()
-            if token is None:
-                raise ClientError(
-                    "no access token in database!")
-
-            params["access_token"] = token
-
         if data is not None:
 
             # data必须是字典或者列表类型
             data = dumps(data, ensure_ascii=False)
             data = to_bytes(data)
 
-        resp = requests.request(
+        if not with_token:
+            return self._send(path, method, params, data, raw_response, **kwargs)
+
+        # 如果请求需要token则在get参数中带上token, token不存在时自动刷新
+        token = self.token_manager.get_token()
+        try:
+            return self._send(path, method, dict(params, access_token=token),
+                              data, raw_response, **kwargs)
+        except ClientError as e:
+            if e.code not in TOKEN_INVALID_CODES:
+                raise
+
+        # token已失效 (如被其他地方刷新), 刷新后重试一次
+        token = self.token_manager.refresh(stale=token)
+        return self._send(path, method, dict(params, access_token=token),
+                          data, raw_response, **kwargs)
+
+    def _send(self, path, method, params, data, raw_response, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        resp = self.session.request(
             url=self.get_api_base() + path,
             method=method,
             params=params,
@@ -104,13 +159,17 @@ class Client(object):
         if raw_response:
             return resp
 
-        result = loads(resp.content.decode("utf-8"))
+        return self._parse_result(resp.content)
+
+    def _parse_result(self, content):
+        result = loads(content.decode("utf-8"))
         # 对返回数据进行简单检查, 是否请求失败
         code = result.get("errcode", 0)
         if code != 0:
             # 微信api返回了错误码, 触发异常
             raise ClientError(
-                "api returned error, code=%s, msg=%s." % (code, result.get("errmsg")))
+                "api returned error, code=%s, msg=%s." % (code, result.get("errmsg")),
+                code=code)
 
         return result
 
@@ -133,6 +192,95 @@ class Client(object):
             with_token=True
             )
 
+    @property
+    def user_info_cache(self):
+        """
+        用户信息缓存, 默认为 config.storage 前的进程内缓存,
+        可以通过 config.user_info_cache 指定其他存储器
+        """
+        if self._user_info_cache is None:
+            self._user_info_cache = self.config.user_info_cache or \
+                CachedStorage(self.config.storage, maxsize=4096, ttl=86400)
+        return self._user_info_cache
+
+    def _user_info_keys(self, openids, lang):
+        return ["userinfo:%s:%s" % (lang, openid) for openid in openids]
+
+    def _user_info_chunks(self, openids, cached):
+        # 未缓存的openid去重后按批量接口的上限分组
+        missing = list(dict.fromkeys(
+            openid for openid, info in zip(openids, cached) if info is None))
+        return [missing[i:i + USER_INFO_BATCH_SIZE]
+                for i in range(0, len(missing), USER_INFO_BATCH_SIZE)]
+
+    def _merge_user_info(self, openids, keys, cached, results):
+        """
+        返回 (与 openids 顺序一致的用户信息, 需要写入缓存的 (key, info))
+        """
+        fetched = dict()
+        for result in results:
+            for info in result.get("user_info_list", []):
+                fetched[info["openid"]] = info
+
+        items = [(key, fetched[openid]) for openid, key in zip(openids, keys)
+                 if openid in fetched]
+        infos = [info if info is not None else fetched.get(openid)
+                 for openid, info in zip(openids, cached)]
+        return infos, items
+
+    def batchget_user_info(self, openids, lang="zh_CN"):
+        return self.make_request(
+            "/cgi-bin/user/info/batchget",
+            method="POST",
+            with_token=True,
+            data=dict(user_list=[dict(openid=openid, lang=lang)
+                                 for openid in openids])
+            )
+
+    def _user_info_chunk_failed(self, openids, error, errors):
+        logger.warning("batchget user info failed for %d openids: %r",
+                       len(openids), error)
+        if errors is not None:
+            errors.append((openids, error))
+        return {}
+
+    def _batchget_user_info_chunk(self, openids, lang, errors):
+        # 一组失败不影响其他组, 该组的用户返回 None
+        try:
+            return self.batchget_user_info(openids, lang)
+        except (ClientError,) + TRANSPORT_ERRORS as e:
+            return self._user_info_chunk_failed(openids, e, errors)
+
+    def get_user_info_many(self, openids, lang="zh_CN", ttl=3600,
+                           concurrency=4, errors=None):
+        """
+        批量获取用户信息, 返回与 openids 顺序一致的数组, 获取失败的为 None
+
+        结果在 user_info_cache 中缓存 ttl 秒, 未缓存的openid每100个一组
+        通过 batchget 接口获取, 最多 concurrency 组同时请求。
+        某一组接口返回错误或请求失败时该组用户均为 None, 不影响其他组,
+        错误记录到日志; errors 为列表时追加该组的 (openids, 异常)
+        """
+        openids = list(openids)
+        keys = self._user_info_keys(openids, lang)
+        cached = self.user_info_cache.get_many(keys, encoding="utf-8")
+
+        chunks = self._user_info_chunks(openids, cached)
+        if len(chunks) > 1 and concurrency > 1:
+            with ThreadPoolExecutor(min(concurrency, len(chunks))) as executor:
+                results = list(executor.map(
+                    lambda chunk: self._batchget_user_info_chunk(
+                        chunk, lang, errors),
+                    chunks))
+        else:
+            results = [self._batchget_user_info_chunk(chunk, lang, errors)
+                       for chunk in chunks]
+
+        infos, items = self._merge_user_info(openids, keys, cached, results)
+        if items:
+            self.user_info_cache.set_many(items, expires=ttl)
+        return infos
+
     def get_ip_list(self, parse_subnet=False):
         result = self.make_request(
             "/cgi-bin/getcallbackip",
@@ -140,7 +288,9 @@ class Client(object):
             with_token=True
             )
 
-        ip_list = result["ip_list"]
+        return self._parse_ip_list(result["ip_list"], parse_subnet)
+
+    def _parse_ip_list(self, ip_list, parse_subnet):
         if parse_subnet:
             sub_ip_list = []
             for ip in map(IPy.IP, ip_list):
@@ -166,7 +316,9 @@ class Client(object):
             with_token=True
             )
 
-        menu = result["menu"]
+        return self._parse_menu(result["menu"], string)
+
+    def _parse_menu(self, menu, string):
         if not string:
             return menu
 
@@ -241,14 +393,7 @@ class Client(object):
             )
 
     def upload_tmp_media(self, media, media_type=None):
-        if media_type is None:
-            media_type = self.get_media_type_by_file_suffix(media)
-
-            # 无法获取媒体类型且用户未指定, 无法继续愉快玩耍
-            if not media_type:
-                raise ClientError(
-                    "cannot guess mediatype from %s." % media)
-
+        media_type = self._guess_media_type(media, media_type)
         content = self._read_file(media)
 
         return self.make_request(
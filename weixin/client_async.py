@@ -0,0 +1,203 @@
+# encoding=utf-8
+import asyncio
+import re
+from json import dumps
+
+import httpx
+
+from .client_api import Client, ClientError, TOKEN_INVALID_CODES
+from .storage.storage import AsyncStorageBase
+from .token import AccessTokenManager, TOKEN_KEY
+from .transport import DEFAULT_TIMEOUT, TRANSPORT_ERRORS, httpx_timeout
+from .utils import call_async, to_bytes
+
+
+__all__ = ["AsyncClient"]
+
+
+class AsyncClient(Client):
+    """
+    基于 httpx 的异步客户端, 接口与 Client 相同, 所有方法都需要 await
+
+    >>> await client.get_user_info(openid)
+
+    同时进行的请求不超过 concurrency 个, 避免超出接口频率限制。
+    token 由 config.token_manager 管理, 与同步客户端共用时只需设置一次;
+    config.storage 可以是同步或异步存储器
+    """
+
+    def __init__(self, config, concurrency=10, timeout=DEFAULT_TIMEOUT,
+                 http2=False, retries=3, client=None):
+        self.config = config
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        self.config.setnx("domain", "api.weixin.qq.com")
+
+        self.token_manager = self.config.token_manager
+        if self.token_manager is None:
+            self.token_manager = AccessTokenManager(
+                self.config, self.get_access_token)
+
+        self._user_info_cache = None
+
+        if client is None:
+            # httpx 只支持连接失败时重试
+            transport = httpx.AsyncHTTPTransport(
+                http2=http2,
+                retries=retries,
+                limits=httpx.Limits(max_connections=concurrency),
+            )
+            client = httpx.AsyncClient(transport=transport)
+        self.client = client
+
+        # 在事件循环中创建
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    @property
+    def user_info_cache(self):
+        """
+        CachedStorage 只能包装同步存储器, 异步存储器直接作为缓存
+        """
+        if self._user_info_cache is None and \
+                self.config.user_info_cache is None and \
+                isinstance(self.config.storage, AsyncStorageBase):
+            self._user_info_cache = self.config.storage
+        return Client.user_info_cache.fget(self)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def get_access_token_from_db(self):
+        return await call_async(
+            self.config.storage.get, TOKEN_KEY, encoding="utf-8")
+
+    async def refresh_access_token(self, expires=None):
+        return await self.token_manager.refresh_async(
+            stale=await self.get_access_token_from_db(), expires=expires)
+
+    async def get_access_token(self):
+        return await self.make_request(
+            "/cgi-bin/token",
+            method="GET",
+            params=dict(
+                grant_type="client_credential",
+                appid=self.config.appid,
+                secret=self.config.appsec
+                )
+            )
+
+    async def _read_file(self, file):
+        if re.match("^https?://", file):
+            resp = await self.client.get(
+                file, headers={"User-Agent": "Mozilla/5.0"},
+                timeout=httpx_timeout(self.timeout))
+            return resp.content
+
+        with open(file, 'rb') as f:
+            return await call_async(f.read)
+
+    async def make_request(self, path, method=None, params=None, data=None, with_token=False, raw_response=False, **kwargs):
+        params = params or {}
+        if data is not None:
+            data = to_bytes(dumps(data, ensure_ascii=False))
+
+        if not with_token:
+            return await self._send(path, method, params, data, raw_response, **kwargs)
+
+        token = await self.token_manager.get_token_async()
+        try:
+            return await self._send(path, method, dict(params, access_token=token),
+                                    data, raw_response, **kwargs)
+        except ClientError as e:
+            if e.code not in TOKEN_INVALID_CODES:
+                raise
+
+        token = await self.token_manager.refresh_async(stale=token)
+        return await self._send(path, method, dict(params, access_token=token),
+                                data, raw_response, **kwargs)
+
+    async def _send(self, path, method, params, data, raw_response, **kwargs):
+        kwargs["timeout"] = httpx_timeout(kwargs.get("timeout", self.timeout))
+        if data is not None:
+            kwargs["content"] = data
+
+        async with self.semaphore:
+            resp = await self.client.request(
+                method, self.get_api_base() + path, params=params, **kwargs)
+
+        if raw_response:
+            return resp
+
+        return self._parse_result(resp.content)
+
+    async def _batchget_user_info_chunk(self, openids, lang, errors):
+        try:
+            return await self.batchget_user_info(openids, lang)
+        except (ClientError,) + TRANSPORT_ERRORS as e:
+            return self._user_info_chunk_failed(openids, e, errors)
+
+    async def get_user_info_many(self, openids, lang="zh_CN", ttl=3600,
+                                 errors=None):
+        """
+        各组请求同时进行, 并发数由 concurrency 限制
+        """
+        openids = list(openids)
+        keys = self._user_info_keys(openids, lang)
+        cached = await call_async(
+            self.user_info_cache.get_many, keys, encoding="utf-8")
+
+        results = await asyncio.gather(*[
+            self._batchget_user_info_chunk(chunk, lang, errors)
+            for chunk in self._user_info_chunks(openids, cached)])
+
+        infos, items = self._merge_user_info(openids, keys, cached, results)
+        if items:
+            await call_async(self.user_info_cache.set_many, items, expires=ttl)
+        return infos
+
+    async def get_ip_list(self, parse_subnet=False):
+        result = await self.make_request(
+            "/cgi-bin/getcallbackip",
+            method="GET",
+            with_token=True
+            )
+
+        return self._parse_ip_list(result["ip_list"], parse_subnet)
+
+    async def get_menu(self, string=False):
+        result = await self.make_request(
+            "/cgi-bin/menu/get",
+            method="GET",
+            with_token=True
+            )
+
+        return self._parse_menu(result["menu"], string)
+
+    async def upload_kfavatar(self, kf_account, avatar):
+        content = await self._read_file(avatar)
+        return await self.make_request(
+            "/customservice/kfaccount/uploadheadimg",
+            method="POST",
+            params=dict(kf_account=kf_account),
+            files={"file": (avatar, content)},
+            with_token=True
+            )
+
+    async def upload_tmp_media(self, media, media_type=None):
+        media_type = self._guess_media_type(media, media_type)
+        content = await self._read_file(media)
+
+        return await self.make_request(
+            "/cgi-bin/media/upload",
+            method="POST",
+            params=dict(type=media_type),
+            files={"file": (media, content)},
+            with_token=True
+            )
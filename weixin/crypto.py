@@ -1,20 +1,34 @@
 # encoding=utf-8
 import base64
-from Crypto.Cipher import AES
+from collections import deque
+from hmac import compare_digest
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
 
 from .utils import (
     get_timestamp,
-    join_sequence,
     to_bytes,
     to_str,
     get_signature,
-    get_nonce)
+    get_nonce,
+    get_nonce_bytes)
 
 
 __all__ = [
     "AESCipher",
     "XMLMsgCryptor",
     "CryptorError",
+    "get_backend",
     "base64_encode",
     "base64_decode"
 ]
@@ -43,57 +57,164 @@ class CryptorError(Exception):
     pass
 
 
+class _PyCryptoBackend(object):
+    """
+    pycrypto / pycryptodome 实现
+
+    CBC对象带有状态, 加密时每条消息新建一个; 解密时复用预先展开密钥的
+    ECB对象, 整段解密后再与前一个密文块整体异或, 等价于CBC解密
+    """
+
+    def __init__(self, key, iv):
+        self.key = key
+        self.iv = iv
+        self.ecb = AES.new(key, AES.MODE_ECB)
+
+    def encrypt_into(self, buf):
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        try:
+            cipher.encrypt(buf, output=buf)
+        except TypeError:
+            # pycrypto 不支持 output 参数
+            buf[:] = cipher.encrypt(bytes(buf))
+        return buf
+
+    def decrypt(self, data):
+        size = len(data)
+        plain = self.ecb.decrypt(data)
+        chain = self.iv + data[:size - 16]
+
+        plain = int.from_bytes(plain, 'big') ^ int.from_bytes(chain, 'big')
+        return plain.to_bytes(size, 'big')
+
+
+class _CryptographyBackend(object):
+    """
+    cryptography (OpenSSL) 实现, Cipher 对象只创建一次
+    """
+
+    def __init__(self, key, iv):
+        self.cipher = Cipher(
+            algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+
+    def encrypt_into(self, buf):
+        encryptor = self.cipher.encryptor()
+        return encryptor.update(buf) + encryptor.finalize()
+
+    def decrypt(self, data):
+        decryptor = self.cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+
+BACKENDS = {
+    "pycrypto": _PyCryptoBackend,
+    "cryptography": _CryptographyBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    获取AES实现, 默认优先使用 cryptography
+    """
+    if name is None:
+        name = "cryptography" if Cipher is not None else "pycrypto"
+
+    if name == "cryptography" and Cipher is None \
+            or name == "pycrypto" and AES is None:
+        raise CryptorError("AES backend %s is not installed." % name)
+
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise CryptorError("unknown AES backend %s." % name)
+
+
 class AESCipher:
     """
     基础部分来自 http://stackoverflow.com/questions/12524994
     稍微做了一下兼容性修改
     """
 
-    def __init__(self, key=None, iv=None):
+    def __init__(self, key=None, iv=None, backend=None):
         self.BS = 32
 
-        def pad(data):
-            lenth = (self.BS - len(data) % self.BS)
-            ch = chr(lenth)
-            if isinstance(data, bytes):
-                ch = to_bytes(ch)
-
-            return data + (lenth * ch)
-
         self.iv = iv
         self.key = key
-        self.pad = pad
-        self.unpad = lambda s: s[:-s[-1]]
+        self.backend = get_backend(backend)
+        # 默认key的加解密对象只创建一次
+        self._cipher = None
+        if key is not None:
+            self._cipher = self.backend(key, iv or key[:16])
+
+    def _get_cipher(self, key=None, iv=None):
+        if key is None and iv is None and self._cipher is not None:
+            return self._cipher
 
-    def encrypt(self, raw, key=None, iv=None):
-        raw = self.pad(raw)
         key, iv = key or self.key, iv or self.iv
+        return self.backend(key, iv or key[:16])
 
-        cipher = AES.new(key, AES.MODE_CBC, iv or key[:16])
-        return base64_encode(cipher.encrypt(raw))
+    def pad(self, data):
+        lenth = (self.BS - len(data) % self.BS)
+        return data + bytes((lenth,)) * lenth
+
+    def unpad(self, data):
+        """
+        严格检查PKCS#7填充, 检查过程不因填充内容提前返回
+        """
+        size = len(data)
+        lenth = data[-1] if size else 0
+        window = min(self.BS, size)
+
+        valid = 0 < lenth <= window
+        count = lenth if valid else window
+        # 用期望的填充替换末尾字节后整体做常量时间比较
+        tail = data[size - window:]
+        expected = tail[:window - count] + bytes((lenth,)) * count
+
+        if not (compare_digest(tail, expected) & valid):
+            raise CryptorError("invalid padding.")
+
+        return data[:size - lenth]
+
+    def encrypt(self, raw, key=None, iv=None):
+        buf = bytearray(self.pad(to_bytes(raw)))
+        return self.encrypt_into(buf, key, iv)
+
+    def encrypt_into(self, buf, key=None, iv=None):
+        """
+        加密已经填充好的 bytearray (尽可能原地加密), 返回base64编码后的密文
+        """
+        cipher = self._get_cipher(key, iv)
+        return base64_encode(cipher.encrypt_into(buf))
 
     def decrypt(self, enc, key=None, iv=None):
         enc = base64_decode(enc)
-        key, iv = key or self.key, iv or self.iv
+        if not enc or len(enc) % 16:
+            raise CryptorError("invalid ciphertext length.")
 
-        cipher = AES.new(key, AES.MODE_CBC, iv or key[:16])
+        cipher = self._get_cipher(key, iv)
         return self.unpad(cipher.decrypt(enc))
 
 
 class XMLMsgCryptor(object):
 
-    def __init__(self, appid, token, enc_aeskey):
+    def __init__(self, appid, token, enc_aeskey, backend=None):
         pad = ("=" * (len(enc_aeskey) % 3))
         aeskey = base64_decode(enc_aeskey + pad)
 
         self.token = token
         self.appid = appid.encode('ascii')
-        self.cryptor = AESCipher(aeskey)
+        self.cryptor = AESCipher(aeskey, backend=backend)
+        # 用于在子进程中重建 cryptor
+        self._init_args = (appid, token, enc_aeskey, backend)
 
     def decrypt(self, enctext, appid_check=True):
         text = self.cryptor.decrypt(enctext)
         # xml 内容的长度
         lenth = int.from_bytes(text[16:20], 'big')
+        if lenth + 20 > len(text):
+            raise CryptorError("invalid message length %s." % lenth)
+
         if appid_check :
             # appid 检查，如果解密出来的appid与提供的不同，那么返回 None
             aid = text[lenth + 20:]
@@ -105,22 +226,140 @@ class XMLMsgCryptor(object):
         content = to_str(text[20: lenth + 20])
         return content
 
-    def encrypt(self, xml):
-        # 先将xml转换为字节，否则当内容含有多字节字符时会导致len计数错误
-        xml = to_bytes(xml)
+    def _pack(self, chunks):
+        """
+        将 随机串(16) + 长度(4) + xml + appid + 填充 直接写入预分配的缓冲区
+        """
+        lenth = sum(map(len, chunks))
+        size = 20 + lenth + len(self.appid)
+        bs = self.cryptor.BS
+        padding = bs - size % bs
+
+        buf = bytearray(size + padding)
+        buf[0:16] = get_nonce_bytes(16)
+        buf[16:20] = int.to_bytes(lenth, 4, 'big')
+
+        view = memoryview(buf)
+        offset = 20
+        for chunk in chunks:
+            end = offset + len(chunk)
+            view[offset:end] = chunk
+            offset = end
+
+        view[offset:size] = self.appid
+        view[size:] = bytes((padding,)) * padding
+        view.release()
+        return buf
 
-        blenth = int.to_bytes(len(xml), 4, 'big')
-        seq = join_sequence(map(to_bytes, [get_nonce(16), blenth, xml, self.appid]))
-        enctext = self.cryptor.encrypt(seq)
-        enctext = to_str(enctext)
+    def encrypt(self, xml, binary=False, timestamp=None):
+        """
+        xml 可以是字符串, 字节或 BaseWeixinReply.xml_chunks() 返回的字节片段,
+        binary 为真时返回的密文, 随机串与签名为 bytes
+        """
+        if isinstance(xml, (list, tuple)):
+            chunks = xml
+        else:
+            # 先将xml转换为字节，否则当内容含有多字节字符时会导致len计数错误
+            chunks = (to_bytes(xml),)
+
+        enctext = self.cryptor.encrypt_into(self._pack(chunks))
 
         # 加密后的内容, bytes Type
         nonce = get_nonce(5)
-        timestamp = get_timestamp()
+        timestamp = timestamp or get_timestamp()
         sig = get_signature(self.token, nonce, timestamp, enctext)
 
+        if binary:
+            nonce, sig = to_bytes(nonce), to_bytes(sig)
+        else:
+            enctext = to_str(enctext)
+
         # 返回的字典供 reply.EncryptReply 使用
         return dict(enctext=enctext,
                     nonce=nonce,
                     timestamp=timestamp,
                     signature=sig)
+
+    def _map_many(self, method, items, workers, chunksize, **kwargs):
+        if not workers:
+            func = getattr(self, method)
+            for item in items:
+                yield _call_catching(func, item, kwargs)
+            return
+
+        # 按块分发到进程池, 子进程中缓存重建的 cryptor。
+        # 同时最多提交 workers * PENDING_CHUNKS_PER_WORKER 块, 输入按需读取
+        executor = ProcessPoolExecutor(workers)
+        pending = deque()
+        try:
+            for chunk in _chunked(items, chunksize):
+                pending.append(executor.submit(
+                    _run_chunk, (self._init_args, method, chunk, kwargs)))
+                if len(pending) >= workers * PENDING_CHUNKS_PER_WORKER:
+                    for result in pending.popleft().result():
+                        yield result
+
+            while pending:
+                for result in pending.popleft().result():
+                    yield result
+        finally:
+            # 提前关闭生成器时取消未开始的块, 不等待正在执行的块
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=not pending)
+
+    def decrypt_many(self, enctexts, appid_check=True, workers=None, chunksize=256):
+        """
+        批量解密, 返回生成器, 按输入顺序产生 (xml, None) 或 (None, 异常)
+        单条消息的错误(appid不符, 填充错误等)不会中断整个批次
+        workers 不为空时使用进程池并行处理
+        """
+        return self._map_many("decrypt", enctexts, workers, chunksize,
+                              appid_check=appid_check)
+
+    def encrypt_many(self, xmls, binary=False, workers=None, chunksize=256):
+        """
+        批量加密, 返回生成器, 按输入顺序产生 (encrypt() 的结果字典, None)
+        或 (None, 异常), 同一批次共用一个时间戳
+        """
+        return self._map_many("encrypt", xmls, workers, chunksize,
+                              binary=binary, timestamp=get_timestamp())
+
+
+# 进程池中每个进程最多排队的块数
+PENDING_CHUNKS_PER_WORKER = 2
+
+# 批量处理时单条消息可能出现的错误
+_ITEM_ERRORS = (CryptorError, ValueError, TypeError)
+
+# 子进程中按参数缓存的 XMLMsgCryptor
+_worker_cryptors = {}
+
+
+def _call_catching(func, item, kwargs):
+    try:
+        return func(item, **kwargs), None
+    except _ITEM_ERRORS as e:
+        return None, e
+
+
+def _chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _run_chunk(args):
+    init_args, method, chunk, kwargs = args
+
+    cryptor = _worker_cryptors.get(init_args)
+    if cryptor is None:
+        cryptor = _worker_cryptors[init_args] = XMLMsgCryptor(*init_args)
+
+    func = getattr(cryptor, method)
+    return [_call_catching(func, item, kwargs) for item in chunk]
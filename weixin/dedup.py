@@ -0,0 +1,182 @@
+# encoding=utf-8
+import asyncio
+import threading
+
+from .utils import LRUCache, call_async
+
+
+__all__ = ['MessageDeduplicator', 'message_dedup_key']
+
+
+_MISSING = object()
+
+# 处理器返回 None 时写入存储器的值, 重复消息同样不再调用处理器
+_NONE_RESULT = "dedup:none"
+
+# 存储器只保存字符串, 写入时加上前缀记录回复的类型:
+# 消息加密时 Weixin.reply 返回 bytes, 否则返回 str
+_STR_PREFIX = "s:"
+_BYTES_PREFIX = "b:"
+
+
+def message_dedup_key(message):
+    """
+    消息的去重key, 普通消息使用 MsgId, 事件使用 FromUserName + CreateTime
+    """
+    if message.MsgId:
+        return "msg:%s" % message.MsgId
+
+    if message.FromUserName and message.CreateTime:
+        return "event:%s:%s" % (message.FromUserName, message.CreateTime)
+
+
+class _InFlight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class MessageDeduplicator(object):
+    """
+    消息去重
+
+    微信在5秒内未收到回复时会重新推送同一条消息, 重复的消息等待第一次调用的
+    结果而不再调用处理器, 渲染的回复在 ttl 秒内被缓存。
+    设置了 storage (StorageBase) 时回复同时写入存储器, 多个节点之间共享;
+    正在处理中的消息只在进程内可见
+
+    >>> app.add_config("deduplicator", MessageDeduplicator(app.config.storage))
+    """
+
+    def __init__(self, storage=None, ttl=30, wait_timeout=5, maxsize=10240):
+        self.storage = storage
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+        self._lock = threading.Lock()
+        self._inflight = dict()
+        # 事件循环中处理中的消息, key -> asyncio.Future
+        self._inflight_async = dict()
+
+    def _storage_key(self, key):
+        return "dedup:%s" % key
+
+    def _loaded(self, key, stored):
+        if stored is None:
+            return _MISSING
+
+        if stored == _NONE_RESULT:
+            result = None
+        elif stored.startswith(_BYTES_PREFIX):
+            result = stored[len(_BYTES_PREFIX):].encode("latin-1")
+        elif stored.startswith(_STR_PREFIX):
+            result = stored[len(_STR_PREFIX):]
+        else:
+            result = stored
+        self.cache.set(key, result)
+        return result
+
+    def _stored(self, result):
+        if result is None:
+            return _NONE_RESULT
+        if isinstance(result, bytes):
+            # latin-1 可以无损地表示任意字节
+            return _BYTES_PREFIX + result.decode("latin-1")
+        return _STR_PREFIX + result
+
+    def get(self, key):
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING and self.storage is not None:
+            result = self._loaded(key, self.storage.get(
+                self._storage_key(key), encoding="utf-8"))
+
+        return result
+
+    def set(self, key, result):
+        self.cache.set(key, result)
+        if self.storage is not None:
+            self.storage.set(self._storage_key(key), self._stored(result),
+                             expires=self.ttl)
+
+    async def get_async(self, key):
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING and self.storage is not None:
+            result = self._loaded(key, await call_async(
+                self.storage.get, self._storage_key(key), encoding="utf-8"))
+
+        return result
+
+    async def set_async(self, key, result):
+        self.cache.set(key, result)
+        if self.storage is not None:
+            await call_async(
+                self.storage.set,
+                self._storage_key(key), self._stored(result),
+                expires=self.ttl)
+
+    def run(self, key, function):
+        """
+        调用 function 并缓存结果, 同一个key同时只有一个调用
+        """
+        if key is None:
+            return function()
+
+        result = self.get(key)
+        if result is not _MISSING:
+            return result
+
+        with self._lock:
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = self._inflight[key] = _InFlight()
+
+        if not owner:
+            # 等待第一次调用的结果, 超时或出错时返回 None
+            inflight.event.wait(self.wait_timeout)
+            return inflight.result
+
+        try:
+            inflight.result = function()
+            # 先写入缓存再移除处理中的记录, 之后的重复消息直接命中缓存;
+            # 返回 None 的处理器同样缓存, 避免重复执行其副作用
+            self.set(key, inflight.result)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            inflight.event.set()
+
+        return inflight.result
+
+    async def run_async(self, key, function):
+        """
+        run 的协程版本, function 返回一个awaitable
+        """
+        if key is None:
+            return await function()
+
+        result = await self.get_async(key)
+        if result is not _MISSING:
+            return result
+
+        inflight = self._inflight_async.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(inflight), self.wait_timeout)
+            except asyncio.TimeoutError:
+                return
+
+        inflight = self._inflight_async[key] = \
+            asyncio.get_running_loop().create_future()
+        result = None
+        try:
+            result = await function()
+            await self.set_async(key, result)
+        finally:
+            del self._inflight_async[key]
+            inflight.set_result(result)
+
+        return result
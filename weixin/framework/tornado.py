@@ -9,9 +9,14 @@ def weixin_request_only(func):
         nts = map(lambda k: req.get_query_argument(k, ""),
                   ['nonce', 'timestamp', 'signature'])
         nonce, timestamp, sig = nts
-        token = req.config.token
+        verifier = req.config.verifier
 
-        if is_valid_request(token, nonce, timestamp, sig):
+        if verifier is not None:
+            valid = verifier.verify(nonce, timestamp, sig)
+        else:
+            valid = is_valid_request(req.config.token, nonce, timestamp, sig)
+
+        if valid:
             return func(req)
 
         req.set_status(403)
@@ -41,7 +46,7 @@ def make_handler(weapp):
 
         @weixin_request_only
         async def post(self):
-            xml = self.weapp.reply(self.request.body) or ""
+            xml = await self.weapp.reply_async(self.request.body) or ""
             self.write(xml)
 
     return WeixinRequestHandler
@@ -0,0 +1,199 @@
+# encoding=utf-8
+import asyncio
+import contextlib
+import itertools
+import threading
+import time
+import zlib
+
+from .utils import call_async
+
+
+__all__ = ['LocalLock', 'StorageLock', 'LockStats', 'LockTimeoutError']
+
+
+# 等待锁超时时的处理方式
+ON_TIMEOUT = ("drop", "raise", "proceed")
+
+
+class LockTimeoutError(Exception):
+    pass
+
+
+class LockStats(object):
+    """
+    锁的竞争统计: 获取成功次数, 需要等待的次数, 等待超时次数及等待时间(秒)
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited, contended, acquired):
+        with self._lock:
+            if acquired:
+                self.acquired += 1
+            else:
+                self.timeouts += 1
+            if contended:
+                self.contended += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def as_dict(self):
+        return dict(acquired=self.acquired, contended=self.contended,
+                    timeouts=self.timeouts, wait_time=self.wait_time,
+                    max_wait=self.max_wait)
+
+
+class BaseLock(object):
+    """
+    按key加锁, 最多等待 timeout 秒, 获取成功时返回令牌, 超时返回 None
+
+    on_timeout 为 hold 及消息处理中等待超时时的处理方式:
+    drop (默认) 不处理该消息并返回空回复; raise 抛出 LockTimeoutError,
+    由web框架返回错误使微信重试; proceed 不加锁继续处理, 可能丢失更新
+    """
+
+    def __init__(self, timeout=4, retry_interval=0.01, on_timeout="drop"):
+        if on_timeout not in ON_TIMEOUT:
+            raise ValueError("on_timeout must be one of %s." % (ON_TIMEOUT,))
+
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.on_timeout = on_timeout
+        self.stats = LockStats()
+
+    def check_timeout(self, key, token):
+        """
+        token 为 None (等待超时) 且 on_timeout 不为 proceed 时抛出 LockTimeoutError
+        """
+        if token is None and self.on_timeout != "proceed":
+            raise LockTimeoutError("timeout waiting for lock %s." % key)
+
+    def try_acquire(self, key):
+        """
+        不等待地尝试加锁, 成功时返回令牌
+        """
+        raise NotImplementedError
+
+    def release(self, key, token):
+        raise NotImplementedError
+
+    def acquire(self, key, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        interval = self.retry_interval
+
+        token = self.try_acquire(key)
+        contended = token is None
+        while token is None:
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 0.1)
+            token = self.try_acquire(key)
+
+        self.stats.record(time.monotonic() - start, contended, token is not None)
+        return token
+
+    async def acquire_async(self, key, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        interval = self.retry_interval
+
+        token = await call_async(self.try_acquire, key)
+        contended = token is None
+        while token is None:
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, 0.1)
+            token = await call_async(self.try_acquire, key)
+
+        self.stats.record(time.monotonic() - start, contended, token is not None)
+        return token
+
+    async def release_async(self, key, token):
+        return await call_async(self.release, key, token)
+
+    @contextlib.contextmanager
+    def hold(self, key, timeout=None):
+        """
+        >>> with lock.hold(openid) as token:
+        ...     pass
+        """
+        token = self.acquire(key, timeout=timeout)
+        self.check_timeout(key, token)
+        try:
+            yield token
+        finally:
+            if token is not None:
+                self.release(key, token)
+
+
+class LocalLock(BaseLock):
+    """
+    进程内的分段锁, key 按哈希分到 stripes 个锁上,
+    不同的key可能共用一个锁, 适合单进程多线程部署
+    """
+
+    def __init__(self, stripes=256, timeout=4, retry_interval=0.01,
+                 on_timeout="drop"):
+        super(LocalLock, self).__init__(timeout, retry_interval, on_timeout)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._tokens = itertools.count(1)
+
+    def _stripe(self, key):
+        data = key.encode("utf-8") if isinstance(key, str) else key
+        return self._locks[zlib.crc32(data) % len(self._locks)]
+
+    def try_acquire(self, key):
+        if self._stripe(key).acquire(False):
+            return next(self._tokens)
+
+    def acquire(self, key, timeout=None):
+        # 同步等待直接阻塞在锁上, 无需轮询
+        timeout = self.timeout if timeout is None else timeout
+        lock = self._stripe(key)
+        start = time.monotonic()
+
+        acquired = lock.acquire(False)
+        contended = not acquired
+        if not acquired:
+            acquired = lock.acquire(timeout=timeout)
+
+        self.stats.record(time.monotonic() - start, contended, acquired)
+        if acquired:
+            return next(self._tokens)
+
+    def release(self, key, token):
+        self._stripe(key).release()
+
+
+class StorageLock(BaseLock):
+    """
+    基于存储器的分布式锁, 存储器需实现 lock_acquire/lock_release
+    (RedisStorage 及 SQL 存储器)
+
+    锁在 ttl 秒后自动过期, 防止持有锁的节点崩溃后无法释放;
+    令牌随每次加锁递增, 可作为 fencing token 交给下游校验
+    """
+
+    def __init__(self, storage, ttl=10, timeout=4, retry_interval=0.01,
+                 on_timeout="drop"):
+        super(StorageLock, self).__init__(timeout, retry_interval, on_timeout)
+        self.storage = storage
+        self.ttl = ttl
+
+    def try_acquire(self, key):
+        return self.storage.lock_acquire(key, ttl=self.ttl)
+
+    def release(self, key, token):
+        return self.storage.lock_release(key, token)
@@ -1,10 +1,12 @@
 # encoding=utf-8
-import re
-
 from .config import Config
 from .crypto import XMLMsgCryptor
+from .dedup import message_dedup_key
+from .lock import LockTimeoutError
 from .request import WeixinRequest
+from .router import TextFilterRouter
 from .storage import Sqlite3Storage
+from .utils import SignatureVerifier, call_async
 
 
 __all__ = ['Weechat',]
@@ -24,10 +26,15 @@ class Weechat(object):
         default = lambda req: None
 
         self.handlers = dict()
+        # 分派表, 由 handlers 构建, 注册处理器后失效
+        self._dispatch_table = None
+        self._on_finish = None
         # 未知消息类型的处理器
         self.default = default
         # 关键字处理器数组
         self.text_filter_handlers = []
+        # 关键词路由索引
+        self.text_filter_router = TextFilterRouter()
         # 默认关键字无匹配处理器
         self.text_filter_default = default
 
@@ -43,15 +50,22 @@ class Weechat(object):
             self.add_config("cryptor", XMLMsgCryptor(
                     appid=appid,
                     token=token,
-                    enc_aeskey=enc_aeskey
+                    enc_aeskey=enc_aeskey,
+                    backend=self.config.crypto_backend
                 )
             )
 
+        if self.config.verifier is None:
+            # 请求签名校验, 可在初始化前设置自定义的 SignatureVerifier
+            self.add_config("verifier", SignatureVerifier(token))
+
         if self.config.storage is None:
             sqlite_file = "weixin.%s.sqlite3" % appid
             storage = Sqlite3Storage(uri=sqlite_file)
             self.set_storage(storage)
 
+        self._build_dispatch_table()
+
     def add_config(self, key, value):
         """
         >>> app.add_config('sqlconn', DB_CONNECTION)
@@ -87,6 +101,8 @@ class Weechat(object):
         """
         key = self.uniform(key)
         self.handlers[key] = function
+        # 使分派表失效, 下次回复时重新构建
+        self._dispatch_table = None
         return
 
     def get_base_handler(self, key_list):
@@ -214,39 +230,22 @@ class Weechat(object):
 
         return register
 
-    def _compile_text_filter(self, filter_):
-        if isinstance(filter_, list):
-            # 关键词数组, 编译关键词表达式
-            regex = '^\s*(%s)\s*$' % '|'.join(filter_)
-            return re.compile(regex)
-
-        elif isinstance(filter_, str):
-            # 编译自定义的正则表达式
-            return re.compile(filter_)
-
-        elif isinstance(filter_, re._pattern_type):
-            # 已编译的正则表达式，直接返回
-            return filter_
-
-        raise Exception(
-            "filter is not list, str or re_pattern.")
-
     def text_filter(self, kw_filter):
-        filter_ = self._compile_text_filter(kw_filter)
-
+        """
+        为文本消息注册关键词(数组)或正则表达式处理器, 先注册的优先
+        """
         def register(function):
-            self.text_filter_handlers.append((filter_, function))
+            self.text_filter_router.add(kw_filter, function)
+            self.text_filter_handlers.append((kw_filter, function))
 
             @self.text
             def handle_text_message(request):
                 ##
                 # 注册自定义的text类型消息处理器, 此处理器用于关键词路由
                 ##
-                content = request.message.Content
-                for cpre, h in self.text_filter_handlers:
-                    if cpre.match(content):
-                        break
-                else:
+                content = request.message.Content or ""
+                h = self.text_filter_router.match(content)
+                if h is None:
                     # 无匹配关键词, 调用默认处理器
                     h = self.text_filter_default
 
@@ -264,40 +263,154 @@ class Weechat(object):
         self.add_base_handler("_on_finish_", function)
         return function
 
-    def _get_msg_handler_key(self, message):
-        mtype = self.uniform(message.MsgType)
-        if mtype and mtype == self.uniform("EVENT"):
-            ev = self.uniform(message.Event)
-            main_h_key = "EVENT_%s" % ev
-            # 这几个事件都是有一个固定key的, 所以直接拼接成
-            # 给主路由获取处理器用的key
-            if ev in ("CLICK", "SCAN",) and message.EventKey:
-                ev_key = self.uniform(message.EventKey)
-                sub_h_key = "EVENT_%s_%s" % (ev, ev_key)
+    def _parse_handler_key(self, key):
+        """
+        将处理器的key转换为分派表使用的 (MsgType, Event, EventKey)
+        """
+        if key.startswith("EVENT_"):
+            ev = key[len("EVENT_"):]
+            for sub in ("CLICK_", "SCAN_"):
+                # 点击与扫描事件可以绑定固定的key
+                if ev.startswith(sub) and len(ev) > len(sub):
+                    return "EVENT", sub[:-1], ev[len(sub):]
+
+            return "EVENT", ev, None
+
+        return key, None, None
+
+    def _build_dispatch_table(self):
+        table = dict()
+        for key, h in self.handlers.items():
+            if callable(h):
+                table[self._parse_handler_key(key)] = h
+
+        self._on_finish = table.pop(("_ON_FINISH_", None, None), None)
+        self._dispatch_table = table
+        return table
+
+    def _get_msg_handler(self, message):
+        """
+        根据消息类型查找处理器, 消息不含MsgType时返回 None
+        """
+        table = self._dispatch_table
+        if table is None:
+            table = self._build_dispatch_table()
+
+        mtype = message.MsgType
+        # 不存在可能是因为发送的是加密消息,
+        # 而enc_aeskey未设置导致获取属性时返回None
+        if not mtype:
+            return
+
+        mtype = mtype.upper()
+        if mtype != "EVENT":
+            return table.get((mtype, None, None), self.default)
 
-                return sub_h_key, main_h_key
-            else:
-                return main_h_key,
+        ev = (message.Event or "").upper()
+        if ev in ("CLICK", "SCAN",) and message.EventKey:
+            h = table.get(("EVENT", ev, message.EventKey.upper()))
+            if h is not None:
+                return h
 
-        return mtype,
+        return table.get(("EVENT", ev, None), self.default)
 
     def reply(self, xmlbody):
         """
         解析xml并查找对应处理器对消息做出回应,返回以渲染的xml字符串
+        (设置了消息加密时返回 bytes)
         """
         req = WeixinRequest(self.config, xmlbody)
 
-        keys = self._get_msg_handler_key(req.message)
-        # 检查key是否存在, 不存在可能是因为
-        # 发送的是加密消息, 而enc_aeskey未设置导致获取属性时返回None
-        if not keys:
-            return
+        try:
+            dedup = self.config.deduplicator
+            if dedup is not None:
+                # 重复推送的消息等待或直接使用第一次处理的结果
+                key = message_dedup_key(req.message)
+                return dedup.run(key, lambda: self._process(req))
 
+            return self._process(req)
+        except LockTimeoutError as e:
+            # 超时的消息不会被去重缓存, 微信重试时重新处理
+            return self._lock_timeout(e)
+
+    def _lock_timeout(self, error):
+        # on_timeout 为 drop 时返回空回复
+        if self.config.session_lock.on_timeout == "raise":
+            raise error
+
+    def _process(self, req):
         # 获取处理器
-        processer = self.get_base_handler(keys)
-        on_finish = self.get_base_handler(["_on_finish_", ])
+        processer = self._get_msg_handler(req.message)
+        if processer is None:
+            return
+
+        lock = self.config.session_lock
+        openid = req.message.FromUserName
+        if lock is None or not openid:
+            return self._run_handler(req, processer)
+
+        # 同一用户的消息串行处理, 等待超时按 lock.on_timeout 处理
+        with lock.hold(openid) as token:
+            req.lock_token = token
+            return self._run_handler(req, processer)
+
+    def _run_handler(self, req, processer):
         result = processer(req)
-        on_finish(req)
+        if self._on_finish is not None:
+            self._on_finish(req)
+        if self.config.session_autosave:
+            # 处理完成后保存使用过的会话, 未修改的会话只延长过期时间
+            req.save_session()
+
+        xml = req.get_response_xml(default=result)
+        return xml
+
+    async def reply_async(self, xmlbody):
+        """
+        reply 的协程版本, 协程处理器直接等待, 普通处理器在线程池中执行,
+        线程池可通过 add_config("executor", ...) 设置
+
+        默认线程池中多条消息的普通处理器会同时执行, 处理器需是线程安全的,
+        需要逐条执行时设置 ThreadPoolExecutor(1)
+        """
+        req = WeixinRequest(self.config, xmlbody)
+
+        try:
+            dedup = self.config.deduplicator
+            if dedup is not None:
+                key = message_dedup_key(req.message)
+                return await dedup.run_async(
+                    key, lambda: self._process_async(req))
+
+            return await self._process_async(req)
+        except LockTimeoutError as e:
+            return self._lock_timeout(e)
+
+    async def _process_async(self, req):
+        processer = self._get_msg_handler(req.message)
+        if processer is None:
+            return
+
+        lock = self.config.session_lock
+        openid = req.message.FromUserName
+        if lock is None or not openid:
+            return await self._run_handler_async(req, processer)
+
+        token = req.lock_token = await lock.acquire_async(openid)
+        lock.check_timeout(openid, token)
+        try:
+            return await self._run_handler_async(req, processer)
+        finally:
+            if token is not None:
+                await lock.release_async(openid, token)
+
+    async def _run_handler_async(self, req, processer):
+        executor = self.config.executor
+        result = await call_async(processer, req, executor=executor)
+        if self._on_finish is not None:
+            await call_async(self._on_finish, req, executor=executor)
+        if self.config.session_autosave:
+            await req.save_session_async()
 
         xml = req.get_response_xml(default=result)
         return xml
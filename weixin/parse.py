@@ -1,10 +1,293 @@
 # encoding=utf-8
-import xmltodict
+import codecs
+import re
+from xml.parsers import expat
 
-from .utils import get_timestamp, AttributeDict
+from .utils import get_timestamp, to_bytes, AttributeDict
+
+
+__all__ = ['WeixinMsg', 'LazyWeixinMsg', 'parse_xml', 'scan_xml_spans']
+
+
+# xml声明, 注释以及 <xml> 根节点的开始标签
+_ROOT_RE = re.compile(
+    br'\s*(?:<\?(.*?)\?>\s*)?(?:<!--.*?-->\s*)*<xml\s*>', re.S)
+
+# 非utf-8的编码声明
+_ENCODING_RE = re.compile(
+    br'\sencoding\s*=\s*["\'](?!utf-?8["\'])', re.I)
+
+# <xml> 下的一项: 只含有一段文本或CDATA的子节点以及自闭合的子节点(1, 2),
+# 其他子节点的开始(3), 根节点的结束(4), 注释与处理指令。
+# 文档已经过expat校验, 结束标签一定与开始标签匹配
+_ITEM_RE = re.compile(
+    br'\s*(?:'
+    br'(<([^\s/>!?]+)(?:\s(?:[^>"\']|"[^"]*"|\'[^\']*\')*?)?(?:/>|>'
+    br'(?:<!\[CDATA\[[^\]]*(?:\](?!\]>)[^\]]*)*\]\]>|[^<]*)</[^>]*>))'
+    br'|<([^\s/>!?]+)'
+    br'|(</xml\s*>)'
+    br'|<!--.*?-->|<\?.*?\?>)', re.S)
+
+_TOKEN_RE = re.compile(
+    br'<!\[CDATA\[.*?\]\]>'
+    br'|<!--.*?-->'
+    br'|<\?.*?\?>'
+    br'|<(/?)[^\s/>]+(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>', re.S)
+
+# 只含有一段文本或CDATA的节点, 无需经过expat解析
+_SIMPLE_NODE_RE = re.compile(
+    br'<[^\s>]*>(?:<!\[CDATA\[(.*?)\]\]>|([^<&]*))</[^>]*>$', re.S)
+
+
+def _forbid(*args):
+    raise expat.ExpatError("DTD and entity declarations are forbidden.")
+
+
+def _make_parser():
+    # 出于安全考虑, 拒绝DTD与实体声明
+    parser = expat.ParserCreate()
+    parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_NEVER)
+    parser.StartDoctypeDeclHandler = _forbid
+    parser.EntityDeclHandler = _forbid
+    parser.ExternalEntityRefHandler = _forbid
+    return parser
+
+
+def parse_xml(xmlstr):
+    """
+    单次解析微信消息xml, 返回 <xml> 节点的字典
+
+    结果与 xmltodict.parse(xmlstr)['xml'] 一致: 只有文本的节点为字符串,
+    空节点为 None, 重复的节点合并为数组。出于安全考虑, 拒绝DTD与实体声明
+    """
+    parser = _make_parser()
+    parser.buffer_text = True
+
+    # [节点名, 子节点字典, 文本片段]
+    stack = [[None, None, []]]
+
+    def start_element(name, attrs):
+        children = None
+        if attrs:
+            children = {'@' + k: v for k, v in attrs.items()}
+        stack.append([name, children, []])
+
+    def end_element(name):
+        name, children, texts = stack.pop()
+        text = "".join(texts).strip() or None
+        if children is None:
+            value = text
+        else:
+            if text:
+                children['#text'] = text
+            value = children
+
+        parent = stack[-1]
+        if parent[1] is None:
+            parent[1] = {name: value}
+        elif name not in parent[1]:
+            parent[1][name] = value
+        elif isinstance(parent[1][name], list):
+            parent[1][name].append(value)
+        else:
+            parent[1][name] = [parent[1][name], value]
+
+    def character_data(data):
+        stack[-1][2].append(data)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    parser.Parse(xmlstr, True)
+
+    return (stack[0][1] or {})['xml']
+
+
+_name_tag_res = dict()
+
+# (开始, 结束), 其中不会出现结束的文本
+_SECTIONS = ((b'<![CDATA[', b']]>'), (b'<!--', b'-->'), (b'<?', b'?>'))
+
+
+def _name_tag_re(name):
+    # 只匹配同名节点的开始与结束标签
+    pattern = _name_tag_res.get(name)
+    if pattern is None:
+        pattern = _name_tag_res[name] = re.compile(
+            br'<(/?)' + re.escape(name) +
+            br'(?:\s(?:[^>"\']|"[^"]*"|\'[^\']*\')*?)?(/?)>')
+    return pattern
+
+
+def _in_section(data, start, pos):
+    for begin, end in _SECTIONS:
+        index = data.rfind(begin, start, pos)
+        if index >= 0 and data.find(end, index, pos) < 0:
+            return True
+    return False
+
+
+def _depth_end(pattern, data, pos):
+    depth = 0
+    for m in pattern.finditer(data, pos):
+        if m.group(1) is None:
+            continue
+        if m.group(1):
+            depth -= 1
+        elif not m.group(2):
+            depth += 1
+        if depth == 0:
+            return m.end()
+
+    raise expat.ExpatError("unclosed element in xml document.")
+
+
+def _element_end(data, pos, name):
+    """
+    返回从pos开始的节点的结束位置
+
+    只数同名标签的层数, CDATA, 注释或处理指令中出现同名标签的文本时
+    才逐个标签扫描
+    """
+    depth = 0
+    for m in _name_tag_re(name).finditer(data, pos):
+        if depth and _in_section(data, pos, m.start()):
+            return _depth_end(_TOKEN_RE, data, pos)
+        if m.group(1):
+            depth -= 1
+        elif not m.group(2):
+            depth += 1
+        if depth == 0:
+            return m.end()
+
+    raise expat.ExpatError("unclosed element in xml document.")
+
+
+def scan_xml_spans(data):
+    """
+    扫描一遍xml字节串, 记录 <xml> 下每个子节点的字节偏移
+
+    返回 {节点名: [(start, end), ...]}, 节点内容不做解码。文档先由不带
+    回调的expat完整校验, 与 parse_xml 拒绝的输入一致; 只文本或CDATA的
+    节点由一次正则匹配完成, 其他节点逐个标签扫描。
+
+    根节点带有属性, 文本或没有子节点, 以及非utf-8编码时返回 None,
+    此时应使用 parse_xml 解析
+    """
+    m = _ROOT_RE.match(data, 3 if data.startswith(codecs.BOM_UTF8) else 0)
+    if m is not None and m.group(1) and _ENCODING_RE.search(m.group(1)):
+        return None
+
+    _make_parser().Parse(data, True)
+    if m is None:
+        return None
+
+    spans = dict()
+    pos = m.end()
+    match_item = _ITEM_RE.match
+
+    while True:
+        m = match_item(data, pos)
+        if m is None:
+            # 根节点下的文本或CDATA
+            return None
+
+        index = m.lastindex
+        if index == 1:
+            start, pos = m.span(1)
+            name = m.group(2).decode("utf-8")
+        elif index == 3:
+            start = m.start(3) - 1
+            pos = _element_end(data, start, m.group(3))
+            name = m.group(3).decode("utf-8")
+        elif index == 4:
+            return spans or None
+        else:
+            pos = m.end()
+            continue
+
+        if name in spans:
+            spans[name].append((start, pos))
+        else:
+            spans[name] = [(start, pos)]
 
 
 class WeixinMsg(AttributeDict):
 
     def __init__(self, xmlstr):
-        super(WeixinMsg, self).__init__(xmltodict.parse(xmlstr)['xml'])
+        super(WeixinMsg, self).__init__(parse_xml(xmlstr))
+
+
+class LazyWeixinMsg(AttributeDict):
+    """
+    延迟解码的微信消息
+
+    构造时校验整个文档并扫描一遍节点位置, 节点在第一次被访问时才解码并
+    缓存在实例上, 非法的xml在构造时抛出与 WeixinMsg 相同的异常。
+    未被访问过的节点不会出现在 keys()/items() 中, 需要时调用 materialize()
+    """
+
+    def __init__(self, xmlstr):
+        super(LazyWeixinMsg, self).__init__()
+
+        data = to_bytes(xmlstr)
+        spans = scan_xml_spans(data)
+        if spans is None:
+            # 不常见的结构直接完整解析, 结果与 WeixinMsg 一致
+            self.update(parse_xml(xmlstr))
+            spans = {}
+
+        object.__setattr__(self, '_xml_data_', data)
+        object.__setattr__(self, '_xml_spans_', spans)
+
+    def _decode(self, key, spans):
+        data = self._xml_data_
+        if len(spans) == 1:
+            start, end = spans[0]
+            m = _SIMPLE_NODE_RE.match(data, start, end)
+            if m and m.end() == end:
+                text = m.group(1)
+                if text is None:
+                    text = m.group(2)
+                if b']]>' not in text:
+                    if b'\r' in text:
+                        # expat 将换行统一为 \n
+                        text = text.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+                    return text.decode("utf-8").strip() or None
+
+        body = b''.join(data[s:e] for s, e in spans)
+        return parse_xml(b'<xml>' + body + b'</xml>')[key]
+
+    def __missing__(self, key):
+        spans = self._xml_spans_.get(key)
+        if spans is None:
+            raise KeyError(key)
+
+        value = self._decode(key, spans)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._xml_spans_
+
+    def __delitem__(self, key):
+        spans = self._xml_spans_.pop(key, None)
+        try:
+            dict.__delitem__(self, key)
+        except KeyError:
+            if spans is None:
+                raise
+
+    def get(self, key, default=None):
+        value = self.__getitem__(key)
+        if value is None and key not in self:
+            return default
+        return value
+
+    def materialize(self):
+        """
+        解码全部节点
+        """
+        for key in list(self._xml_spans_):
+            self.__getitem__(key)
+        return self
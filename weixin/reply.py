@@ -1,5 +1,8 @@
 # encoding=utf-8
-from .utils import get_timestamp, join_sequence
+from string import Formatter
+from operator import attrgetter
+
+from .utils import get_timestamp, to_bytes, to_str
 
 
 def cdata_escape(escape_s):
@@ -15,91 +18,184 @@ def _make_node(k, v):
     return ""
 
 
-class BaseWeixinReply(dict):
+class ReplyTemplate(object):
+    """
+    预编译的回复模板
+
+    模板在类定义时被拆分为字面量片段与字段名, 渲染时只需按顺序取出字段值
+    与字面量片段拼接, 不再每次解析模板字符串
+    """
+
+    __slots__ = ('literals', 'fields', '_format', '_bliterals', '_getter')
+
+    def __init__(self, template):
+        literals, fields = [], []
+        pending = ""
+        for literal, field, _, _ in Formatter().parse(template):
+            if field is None:
+                # 模板末尾的字面量
+                pending += literal
+                continue
+
+            literals.append(pending + literal)
+            fields.append(field)
+            pending = ""
+
+        literals.append(pending)
+
+        self.literals = tuple(literals)
+        self.fields = tuple(fields)
+        # 字面量片段之间以 %s 连接, 渲染时由 % 运算符一次拼接完成
+        self._format = "%s".join(l.replace("%", "%%") for l in literals)
+        self._bliterals = tuple(map(to_bytes, literals))
+
+        getter = attrgetter(*fields)
+        if len(fields) == 1:
+            self._getter = lambda obj: (getter(obj),)
+        else:
+            self._getter = getter
+
+    def render_values(self, values):
+        return self._format % values
+
+    def render(self, obj):
+        return self.render_values(self._getter(obj))
+
+    def render_chunks(self, obj):
+        """
+        渲染为字节片段的列表, 供加密时直接写入缓冲区
+        """
+        literals = self._bliterals
+        chunks = [literals[0]]
+        for value, literal in zip(self._getter(obj), literals[1:]):
+            # 与 render 的 %s 一致, None 等其他值按 str() 转换
+            if not isinstance(value, (str, bytes)):
+                value = str(value)
+            chunks.append(to_bytes(value))
+            chunks.append(literal)
+
+        return chunks
+
+
+class BaseWeixinReply(object):
+
+    __slots__ = ('_marked', 'ToUserName', 'FromUserName', 'CreateTime')
+
+    template = None
 
     def __init__(self):
         self._marked = False
 
     def postmark(self, from_msg, created=None):
-        self['ToUserName'] = from_msg.FromUserName
-        self['FromUserName'] = from_msg.ToUserName
-        self['CreateTime'] = created or int(get_timestamp())
+        self.ToUserName = from_msg.FromUserName
+        self.FromUserName = from_msg.ToUserName
+        self.CreateTime = created or int(get_timestamp())
         self._marked = True
 
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def _prepare(self):
+        # 渲染前计算派生字段
+        pass
+
     def _generate(self):
-        raise NotImplementedError
+        self._prepare()
+        return self.template.render(self)
+
+    def xml_chunks(self):
+        self._prepare()
+        return self.template.render_chunks(self)
 
     @property
     def xml(self):
         # generate xml
         return self._generate()
 
+    @property
+    def xml_bytes(self):
+        return b"".join(self.xml_chunks())
+
 
 class TextReply(BaseWeixinReply):
 
+    __slots__ = ('Content',)
+
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[text]]></MsgType>"
+        "<Content><![CDATA[{Content}]]></Content>"
+        "</xml>")
+
     def __init__(self, content):
         super(TextReply, self).__init__()
 
-        self['Content'] = cdata_escape(content)
+        self.Content = cdata_escape(content)
 
-    def _generate(self):
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[text]]></MsgType>" \
-            "<Content><![CDATA[{Content}]]></Content>" \
-            "</xml>"
 
-        return template.format(**self)
+class ImageReply(BaseWeixinReply):
 
+    __slots__ = ('MediaId',)
 
-class ImageReply(BaseWeixinReply):
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[image]]></MsgType>"
+        "<Image>"
+        "<MediaId><![CDATA[{MediaId}]]></MediaId>"
+        "</Image>"
+        "</xml>")
 
     def __init__(self, media_id):
         super(ImageReply, self).__init__()
 
-        self['MediaId'] = media_id
+        self.MediaId = media_id
 
-    def _generate(self):
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[image]]></MsgType>" \
-            "<Image>" \
-            "<MediaId><![CDATA[{MediaId}]]></MediaId>" \
-            "</Image>" \
-            "</xml>"
 
-        return template.format(**self)
+class VoiceReply(BaseWeixinReply):
 
+    __slots__ = ('MediaId',)
 
-class VoiceReply(BaseWeixinReply):
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[voice]]></MsgType>"
+        "<Voice>"
+        "<MediaId><![CDATA[{MediaId}]]></MediaId>"
+        "</Voice>"
+        "</xml>")
 
     def __init__(self, media_id):
         super(VoiceReply, self).__init__()
 
-        self['MediaId'] = media_id
+        self.MediaId = media_id
 
-    def _generate(self):
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[voice]]></MsgType>" \
-            "<Voice>" \
-            "<MediaId><![CDATA[{MediaId}]]></MediaId>" \
-            "</Voice>" \
-            "</xml>"
 
-        return template.format(**self)
+class VideoReply(BaseWeixinReply):
 
+    __slots__ = ('MediaId', 'TitleNode', 'DescriptionNode')
 
-class VideoReply(BaseWeixinReply):
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[video]]></MsgType>"
+        "<Video>"
+        "<MediaId><![CDATA[{MediaId}]]></MediaId>"
+        "{TitleNode}{DescriptionNode}"
+        "</Video>"
+        "</xml>")
 
     def __init__(self, media_id, title=None, description=None):
         super(VideoReply, self).__init__()
@@ -107,104 +203,80 @@ class VideoReply(BaseWeixinReply):
         title = cdata_escape(title)
         description = cdata_escape(description)
 
-        self['MediaId'] = media_id
-        self['TitleNode'] = _make_node("Title", title)
-        self['DescriptionNode'] = _make_node("Description", description)
-
-    def _generate(self):
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[video]]></MsgType>" \
-            "<Video>" \
-            "<MediaId><![CDATA[{MediaId}]]></MediaId>" \
-            "{TitleNode}{DescriptionNode}" \
-            "</Video>" \
-            "</xml>"
-
-        return template.format(**self)
+        self.MediaId = media_id
+        self.TitleNode = _make_node("Title", title)
+        self.DescriptionNode = _make_node("Description", description)
 
 
 class MusicReply(BaseWeixinReply):
 
+    __slots__ = ('ThumbMediaId', 'TitleNode', 'DescriptionNode',
+                 'MusicUrlNode', 'HQMusicUrlNode')
+
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[music]]></MsgType>"
+        "<Music>"
+        "{TitleNode}{DescriptionNode}{MusicUrlNode}{HQMusicUrlNode}"
+        "<ThumbMediaId><![CDATA[{ThumbMediaId}]]></ThumbMediaId>"
+        "</Music>"
+        "</xml>")
+
     def __init__(self, thumb_media_id, url=None, hq_url=None,  title=None, description=None):
         super(MusicReply, self).__init__()
 
         title = cdata_escape(title)
         description = cdata_escape(description)
 
-        self['ThumbMediaId'] = thumb_media_id
-        self['TitleNode'] = _make_node ("Title", title)
-        self['DescriptionNode'] = _make_node ("Description", description)
-        self['MusicUrlNode'] = _make_node ("MusicUrl", url)
-        self['HQMusicUrlNode'] = _make_node ("HQMusicUrl", hq_url)
-
-    def _generate(self):
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[music]]></MsgType>" \
-            "<Music>" \
-            "{TitleNode}{DescriptionNode}{MusicUrlNode}{HQMusicUrlNode}" \
-            "<ThumbMediaId><![CDATA[{ThumbMediaId}]]></ThumbMediaId>" \
-            "</Music>" \
-            "</xml>"
-
-        return template.format(**self)
+        self.ThumbMediaId = thumb_media_id
+        self.TitleNode = _make_node ("Title", title)
+        self.DescriptionNode = _make_node ("Description", description)
+        self.MusicUrlNode = _make_node ("MusicUrl", url)
+        self.HQMusicUrlNode = _make_node ("HQMusicUrl", hq_url)
 
 
 class ArticleReply(BaseWeixinReply):
 
+    __slots__ = ('articles', 'Articles', 'Count')
+
+    item_template = ReplyTemplate(
+        "<item>"
+        "<Title><![CDATA[{Title}]]></Title>"
+        "<Description><![CDATA[{Description}]]></Description>"
+        "<PicUrl><![CDATA[{PicUrl}]]></PicUrl>"
+        "<Url><![CDATA[{Url}]]></Url>"
+        "</item>")
+
+    template = ReplyTemplate(
+        "<xml>"
+        "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>"
+        "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>"
+        "<CreateTime>{CreateTime}</CreateTime>"
+        "<MsgType><![CDATA[news]]></MsgType>"
+        "<ArticleCount>{Count}</ArticleCount>"
+        "<Articles>{Articles}</Articles>"
+        "</xml>")
+
     def __init__(self, articles=None):
         super(ArticleReply, self).__init__()
 
         self.articles = articles or []
 
-    def _generate(self):
-        def make_item(articles):
-            item = \
-                "<item>" \
-                "<Title><![CDATA[{Title}]]></Title>" \
-                "<Description><![CDATA[{Description}]]></Description>" \
-                "<PicUrl><![CDATA[{PicUrl}]]></PicUrl>" \
-                "<Url><![CDATA[{Url}]]></Url>" \
-                "</item>"
-
-            def set_default(article):
-                article.setdefault("Description", "")
-                article.setdefault("PicUrl", "")
-                article.setdefault("Url", "")
-
-                a_title = article['Title']
-                a_desc = article['Description']
-
-                article['Title'] = cdata_escape(a_title)
-                article['Description'] = cdata_escape(a_desc)
-
-                return article
-
-            return join_sequence(
-                item.format(**set_default(ar)) for ar in articles
-            )
-
-        self['Articles'] = make_item(self.articles)
-        self['Count'] = len(self.articles)
-
-        template = \
-            "<xml>" \
-            "<ToUserName><![CDATA[{ToUserName}]]></ToUserName>" \
-            "<FromUserName><![CDATA[{FromUserName}]]></FromUserName>" \
-            "<CreateTime>{CreateTime}</CreateTime>" \
-            "<MsgType><![CDATA[news]]></MsgType>" \
-            "<ArticleCount>{Count}</ArticleCount>" \
-            "<Articles>{Articles}</Articles>" \
-            "</xml>"
-
-        return template.format(**self)
+    def _prepare(self):
+        render_item = self.item_template.render_values
+
+        self.Articles = "".join(
+            render_item((
+                cdata_escape(ar['Title']),
+                cdata_escape(ar.get("Description", "")),
+                ar.get("PicUrl", ""),
+                ar.get("Url", ""),
+            )) for ar in self.articles
+        )
+        self.Count = len(self.articles)
 
     def add_article(self, title, description=None, url=None, image_url=None):
         ar = dict()
@@ -219,27 +291,30 @@ class ArticleReply(BaseWeixinReply):
 
 class EncryptReply(BaseWeixinReply):
 
+    __slots__ = ('Encrypt', 'Nonce', 'TimeStamp', 'MsgSignature')
+
+    template = ReplyTemplate(
+        "<xml>"
+        "<Encrypt><![CDATA[{Encrypt}]]></Encrypt>"
+        "<MsgSignature><![CDATA[{MsgSignature}]]></MsgSignature>"
+        "<TimeStamp>{TimeStamp}</TimeStamp>"
+        "<Nonce><![CDATA[{Nonce}]]></Nonce>"
+        "</xml>")
+
     def __init__(self, enctext, nonce, timestamp, signature):
         super(EncryptReply, self).__init__()
 
-        self['Encrypt'] = enctext
-        self['Nonce'] = nonce
-        self['TimeStamp'] = timestamp
-        self['MsgSignature'] = signature
+        self.Encrypt = enctext
+        self.Nonce = nonce
+        self.TimeStamp = timestamp
+        self.MsgSignature = signature
 
     def postmark(self, from_msg):
         self._marked = True
 
     def _generate(self):
-        template = \
-            "<xml>"\
-            "<Encrypt><![CDATA[{Encrypt}]]></Encrypt>" \
-            "<MsgSignature><![CDATA[{MsgSignature}]]></MsgSignature>" \
-            "<TimeStamp>{TimeStamp}</TimeStamp>" \
-            "<Nonce><![CDATA[{Nonce}]]></Nonce>" \
-            "</xml>"
-
-        return template.format(**self)
+        # 加密的字段可能为 bytes
+        return to_str(self.xml_bytes)
 
 
 class CustomMsgReply(object):
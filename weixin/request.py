@@ -3,7 +3,7 @@ from xml.parsers.expat import ExpatError
 
 from .utils import AttrNone
 from .session import Session
-from .parse import WeixinMsg
+from .parse import WeixinMsg, LazyWeixinMsg
 from .reply import EncryptReply, BaseWeixinReply
 
 
@@ -13,21 +13,57 @@ class WeixinRequest(object):
         self.config = config
         self._raw_xml_ = xmldoc
         self._response_xml_ = None
+        # 设置了 session_lock 时为加锁的令牌, 等待超时为 None
+        self.lock_token = None
 
     @property
     def session(self):
         if not hasattr(self, '_weixin_session_'):
-            self._weixin_session_ = Session(self)
+            # 可通过 add_config("session_class", HashSession) 按字段保存会话
+            session_class = self.config.session_class or Session
+            self._weixin_session_ = session_class(self)
 
         return self._weixin_session_
 
+    async def session_async(self):
+        """
+        异步加载会话, 供协程处理器使用
+
+        >>> session = await request.session_async()
+        """
+        if not hasattr(self, '_weixin_session_'):
+            session_class = self.config.session_class or Session
+            session = session_class(self, load=False)
+            await session.load_async()
+            self._weixin_session_ = session
+
+        return self._weixin_session_
+
+    def save_session(self):
+        """
+        保存已加载的会话, 没有使用过会话时不做任何操作
+        """
+        session = getattr(self, '_weixin_session_', None)
+        if session is not None:
+            session.save()
+
+    async def save_session_async(self):
+        session = getattr(self, '_weixin_session_', None)
+        if session is not None:
+            await session.save_async()
+
     @property
     def message(self):
         if not hasattr(self, '_weixin_msg_'):
             self._weixin_msg_ = AttrNone()
             if self._raw_xml_:
+                # 设置了 lazy_message 时, 消息节点在第一次访问时才解码
+                msg_class = WeixinMsg
+                if self.config.lazy_message:
+                    msg_class = LazyWeixinMsg
+
                 try:
-                    self._weixin_msg_ = WeixinMsg(self._raw_xml_)
+                    self._weixin_msg_ = msg_class(self._raw_xml_)
                     encrypted_msg = self._weixin_msg_.Encrypt
                     cryptor = self.config.cryptor
 
@@ -36,7 +72,7 @@ class WeixinRequest(object):
                         body = cryptor.decrypt(encrypted_msg)
 
                         del self._weixin_msg_
-                        self._weixin_msg_ = WeixinMsg(body)
+                        self._weixin_msg_ = msg_class(body)
 
                     elif encrypted_msg or cryptor:
                         raise Exception(
@@ -58,19 +94,29 @@ class WeixinRequest(object):
                 msg.postmark(self.message)
 
             if self.config.cryptor:
-                # 设置了消息加解密, 加密明文消息
-                kw = self.config.cryptor.encrypt(msg.xml)
+                # 设置了消息加解密, 明文消息直接以字节渲染并加密
+                kw = self.config.cryptor.encrypt(msg.xml_chunks(), binary=True)
                 msg = EncryptReply(**kw)
 
             return msg
 
+    def _build_response(self, msg):
+        msg = self._build_msg(msg)
+        if isinstance(msg, EncryptReply):
+            return msg.xml_bytes
+
+        return msg.xml
+
     def render(self, template, *args, **kwargs):
         msg = template(*args, **kwargs)
-        self._response_xml_ = self._build_msg(msg).xml
+        self._response_xml_ = self._build_response(msg)
         return
 
     def response(self, msg):
-        self._response_xml_ = self._build_msg(msg).xml
+        self._response_xml_ = self._build_response(msg)
 
     def get_response_xml(self, default=None):
+        """
+        返回渲染的xml, 加密回复为 bytes, 其他为字符串
+        """
         return self._response_xml_ or default
@@ -0,0 +1,93 @@
+# encoding=utf-8
+import re
+
+
+__all__ = ['TextFilterRouter',]
+
+
+# 含有这些字符的关键词会被当作正则表达式处理, 无法放入关键词索引
+_REGEX_META_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+_PATTERN_TYPE = type(re.compile(""))
+
+
+def is_plain_keyword(keyword):
+    """
+    判断关键词是否可以直接做精确匹配
+    """
+    return bool(keyword) \
+        and keyword == keyword.strip() \
+        and not _REGEX_META_CHARS.intersection(keyword)
+
+
+def compile_keywords(keywords):
+    """
+    将关键词数组编译为完整匹配的正则表达式
+    """
+    regex = r'^\s*(%s)\s*$' % '|'.join(keywords)
+    return re.compile(regex)
+
+
+class TextFilterRouter(object):
+    """
+    文本消息关键词路由
+
+    关键词数组中的普通关键词被合并进同一个哈希索引, 一次查找即可
+    得到注册顺序最靠前的处理器; 正则表达式及含有正则元字符的关键词
+    仍逐个匹配, 但只检查注册顺序在命中关键词之前的那部分,
+    因此路由结果与按注册顺序逐个匹配完全一致
+    """
+
+    def __init__(self):
+        # 关键词 -> (注册序号, 处理器)
+        self.keywords = dict()
+        # [(注册序号, 正则表达式, 处理器), ...] 按注册序号递增
+        self.patterns = []
+        self.count = 0
+
+    def add(self, filter_, function):
+        index = self.count
+        self.count += 1
+
+        if isinstance(filter_, list):
+            regex_kws = []
+            for kw in filter_:
+                if not is_plain_keyword(kw):
+                    regex_kws.append(kw)
+                # 同一关键词以先注册的为准
+                elif kw not in self.keywords:
+                    self.keywords[kw] = (index, function)
+
+            if regex_kws or not filter_:
+                self.patterns.append(
+                    (index, compile_keywords(regex_kws), function))
+
+        elif isinstance(filter_, str):
+            self.patterns.append((index, re.compile(filter_), function))
+
+        elif isinstance(filter_, _PATTERN_TYPE):
+            self.patterns.append((index, filter_, function))
+
+        else:
+            raise Exception(
+                "filter is not list, str or re_pattern.")
+
+    def match(self, content):
+        """
+        返回匹配content的处理器, 无匹配时返回 None
+        """
+        hit = self.keywords.get(content.strip())
+        if hit is None:
+            for _, cpre, h in self.patterns:
+                if cpre.match(content):
+                    return h
+            return
+
+        index, h = hit
+        for pindex, cpre, ph in self.patterns:
+            if pindex >= index:
+                break
+            if cpre.match(content):
+                return ph
+
+        return h
@@ -1,10 +1,18 @@
 # encoding=utf-8
+from .utils import call_async
+
 
 class BaseSession(object):
 
     def session_id(self):
         raise NotImplementedError
 
+    def load(self):
+        raise NotImplementedError
+
+    async def load_async(self):
+        raise NotImplementedError
+
     def save(self, expires=86400):
         raise NotImplementedError
 
@@ -19,33 +27,84 @@ class BaseSession(object):
 
 
 class Session(BaseSession):
+    """
+    会话只在被修改过时才写入存储器, 未修改时 save 只延长过期时间。
+    直接修改会话中的可变对象 (如 session['list'].append) 不会被记录,
+    此时需调用 save(force=True)
+    """
 
-    def __init__(self, req):
+    def __init__(self, req, load=True):
         self.dict = {}
         self.storage = req.config.storage
         self.openid = req.message.FromUserName
+        # 会话是否被修改过, 以及存储器中是否存在此会话
+        self.dirty = False
+        self.stored = False
+        if load:
+            self.load()
+
+    def _loaded(self, session):
+        if session:
+            self.dict.update(session)
+            self.stored = True
+
+    def load(self):
         # 从数据库读取并加载会话信息
         session = self.storage.get(
             self.session_id(),
             encoding="utf-8"
-        ) or {}
-        self.dict.update(session)
+        )
+        self._loaded(session)
+
+    async def load_async(self):
+        session = await call_async(
+            self.storage.get,
+            self.session_id(),
+            encoding="utf-8"
+        )
+        self._loaded(session)
 
     def session_id(self):
         # self._openid 必须要在先前被设置
         return "session:%s" % self.openid
 
-    def save(self, expires=7*86400):
-        self.storage.set(
-            self.session_id(),
-            self.dict,
-            expires
-        )
+    def save(self, expires=7*86400, force=False):
+        if self.dirty or force:
+            self.storage.set(
+                self.session_id(),
+                self.dict,
+                expires
+            )
+            self.dirty = False
+            self.stored = True
+
+        elif self.stored:
+            self.storage.touch(self.session_id(), expires)
+
+    async def save_async(self, expires=7*86400, force=False):
+        if self.dirty or force:
+            await call_async(
+                self.storage.set,
+                self.session_id(),
+                self.dict,
+                expires
+            )
+            self.dirty = False
+            self.stored = True
+
+        elif self.stored:
+            await call_async(self.storage.touch, self.session_id(), expires)
 
     def destroy(self):
         self.dict = {}
+        self.dirty = self.stored = False
         self.storage.delete(self.session_id())
 
+    async def destroy_async(self):
+        self.dict = {}
+        self.dirty = self.stored = False
+        await call_async(self.storage.delete, self.session_id())
+
     def __call__(self, key, value=None):
         if value is not None:
             self.__setitem__(key, value)
@@ -53,11 +112,137 @@ class Session(BaseSession):
         return self.__getitem__(key)
 
     def __setitem__(self, key, value):
+        self.dirty = True
         self.dict[key] = value
 
+    def __delitem__(self, key):
+        if key in self.dict:
+            del self.dict[key]
+            self.dirty = True
+
     def __getitem__ (self, key):
         try:
             return self.dict[key]
 
         except KeyError:
             return
+
+
+class HashSession(BaseSession):
+    """
+    按字段保存的会话, 使用存储器的哈希接口 (hget/hset)
+
+    字段在第一次读取时才从存储器加载, save 只写入被修改或删除的字段,
+    因此同一用户的并发请求修改不同字段时不会互相覆盖。
+    构造时 (load=True) 一次预先加载 prefetch 中的字段, 其他字段按需加载;
+    协程中使用异步存储器时, 通过 get_async 读取字段或 load_async 预先加载
+
+    >>> class MySession(HashSession):
+    ...     prefetch = ("state", "step")
+    >>> app.add_config("session_class", MySession)
+    """
+
+    # 预先加载的字段
+    prefetch = ()
+
+    def __init__(self, req, load=True):
+        self.storage = req.config.storage
+        self.openid = req.message.FromUserName
+        # 已加载的字段, 不存在的字段为 None
+        self.dict = {}
+        self.changed = set()
+        self.deleted = set()
+        if load:
+            self.load()
+
+    @property
+    def dirty(self):
+        return bool(self.changed or self.deleted)
+
+    def session_id(self):
+        # 与 Session 使用不同的key, 两种会话可以共存
+        return "hsession:%s" % self.openid
+
+    def _unloaded(self, fields):
+        if fields is None:
+            fields = self.prefetch
+        return [f for f in fields if f not in self.dict]
+
+    def load(self, fields=None):
+        """
+        一次加载多个字段, 默认为 prefetch 中的字段
+        """
+        fields = self._unloaded(fields)
+        if fields:
+            values = self.storage.hget_many(
+                self.session_id(), fields, encoding="utf-8")
+            self.dict.update(zip(fields, values))
+
+    async def load_async(self, fields=None):
+        fields = self._unloaded(fields)
+        if fields:
+            values = await call_async(
+                self.storage.hget_many,
+                self.session_id(), fields, encoding="utf-8")
+            self.dict.update(zip(fields, values))
+
+    async def get_async(self, key):
+        await self.load_async([key])
+        return self.dict[key]
+
+    def _pending(self):
+        changed = dict((k, self.dict[k]) for k in self.changed)
+        deleted = list(self.deleted)
+        self.changed, self.deleted = set(), set()
+        return changed, deleted
+
+    def save(self, expires=7*86400, force=False):
+        # force 只为与 Session 保持一致, 字段总是按修改记录写入
+        changed, deleted = self._pending()
+        if deleted:
+            self.storage.hdel(self.session_id(), deleted)
+        if changed:
+            self.storage.hset(self.session_id(), changed, expires)
+        else:
+            self.storage.htouch(self.session_id(), expires)
+
+    async def save_async(self, expires=7*86400, force=False):
+        changed, deleted = self._pending()
+        if deleted:
+            await call_async(self.storage.hdel, self.session_id(), deleted)
+        if changed:
+            await call_async(
+                self.storage.hset, self.session_id(), changed, expires)
+        else:
+            await call_async(self.storage.htouch, self.session_id(), expires)
+
+    def destroy(self):
+        self.dict, self.changed, self.deleted = {}, set(), set()
+        self.storage.hclear(self.session_id())
+
+    async def destroy_async(self):
+        self.dict, self.changed, self.deleted = {}, set(), set()
+        await call_async(self.storage.hclear, self.session_id())
+
+    def __call__(self, key, value=None):
+        if value is not None:
+            self.__setitem__(key, value)
+
+        return self.__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.dict[key] = value
+        self.changed.add(key)
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        self.dict[key] = None
+        self.deleted.add(key)
+        self.changed.discard(key)
+
+    def __getitem__(self, key):
+        if key not in self.dict:
+            self.dict[key] = self.storage.hget(
+                self.session_id(), key, encoding="utf-8")
+
+        return self.dict[key]
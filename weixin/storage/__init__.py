@@ -3,3 +3,23 @@ from .mysql import MySQLStorage
 from .redis import RedisStorage
 from .sqlite3 import Sqlite3Storage
 from .storage import StorageBase, SqlStorageBase
+from .storage import AsyncStorageBase, AsyncSqlStorageBase
+from .serializer import Serializer, register_codec
+
+# 异步存储器依赖的库为可选安装
+try:
+    from .aioredis import AsyncRedisStorage
+except ImportError:
+    pass
+
+try:
+    from .aiomysql import AsyncMySQLStorage
+except ImportError:
+    pass
+
+try:
+    from .aiosqlite import AsyncSqlite3Storage
+except ImportError:
+    pass
+
+from .cached import CachedStorage, RedisInvalidator
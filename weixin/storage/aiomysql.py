@@ -0,0 +1,87 @@
+# encoding=utf-8
+import asyncio
+
+import aiomysql
+
+from .storage import AsyncSqlStorageBase
+from .mysql import SCHEMA, MYSQL_LOCK_ACQUIRE, parse_mysql_uri
+
+
+class AsyncMySQLStorage(AsyncSqlStorageBase):
+    """
+    基于 aiomysql 连接池的异步存储器, 与 MySQLStorage 使用相同的表结构,
+    连接池在第一次使用时建立
+    """
+
+    INSERT_IGNORE = "INSERT IGNORE"
+    LOCK_ACQUIRE = MYSQL_LOCK_ACQUIRE
+    LOCK_TOKEN_FROM_UPDATE = True
+
+    def __init__(self, uri, minsize=1, maxsize=10):
+        params, options = parse_mysql_uri(uri)
+
+        self.params = dict(
+            host=params['host'] or "127.0.0.1",
+            port=params['port'] or 3306,
+            user=params['user'],
+            password=params['password'] or "",
+            db=params['database'],
+            minsize=minsize,
+            maxsize=options.get("pool_size", maxsize),
+            # 连接池中的连接被复用, 开启自动提交以免读到旧的快照
+            autocommit=True,
+        )
+        self.database = None
+        # 在事件循环中创建
+        self._lock = None
+
+    @property
+    def lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _connect(self):
+        async with self.lock:
+            if self.database is None:
+                database = await aiomysql.create_pool(**self.params)
+                async with database.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        for statement in SCHEMA:
+                            await cursor.execute(statement)
+                self.database = database
+
+        return self.database
+
+    async def _execute(self, statement, args, fetch=None, commit=False):
+        database = self.database or await self._connect()
+
+        async with database.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(statement, args)
+                if fetch == "one":
+                    result = await cursor.fetchone()
+                elif fetch == "all":
+                    result = await cursor.fetchall()
+                elif fetch == "rowcount":
+                    result = cursor.rowcount
+                elif fetch == "lastrowid":
+                    result = cursor.lastrowid if cursor.rowcount > 0 else None
+                else:
+                    result = None
+
+        return result
+
+    def _translate_blob(self, data):
+        return data
+
+    def _escape_sql_args_formatter(self, statement):
+        return statement.replace("?", "%s")
+
+    async def close(self):
+        if self.database is not None:
+            self.database.close()
+            await self.database.wait_closed()
+            self.database = None
+        # 关闭后可以在其他事件循环中重新连接
+        self._lock = None
@@ -0,0 +1,139 @@
+# encoding=utf-8
+from collections import OrderedDict
+
+import redis.asyncio
+
+from .redis import SCAN_COUNT
+from .storage import AsyncStorageBase, _items
+
+
+class AsyncRedisStorage(AsyncStorageBase):
+    """
+    基于 redis.asyncio 的异步存储器, 可以传入已有的 client
+    """
+
+    def __init__(self, uri="redis://127.0.0.1/0", client=None):
+        if client is None:
+            client = redis.asyncio.StrictRedis.from_url(uri)
+        self.database = client
+
+    async def get(self, key, encoding=None):
+        result = await self.database.get(key)
+
+        result = self.unserialize(result, encoding=encoding)
+        return result
+
+    async def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        data = self.serialize(pyobj, encoding=encoding)
+
+        await self.database.set(key, data, ex=expires)
+        return
+
+    async def delete(self, key):
+        await self.database.delete(key)
+
+    async def purge_expired(self):
+        return
+
+    async def get_all_keys_by_wildcard(self, wildcard="*"):
+        keys = OrderedDict()
+        async for key in self.database.scan_iter(
+                match=wildcard, count=SCAN_COUNT):
+            keys[key.decode("utf-8")] = None
+
+        return list(keys)
+
+    async def is_expired(self, key):
+        return not await self.database.exists(key)
+
+    async def get_ttl(self, key):
+        return await self.database.ttl(key)
+
+    async def touch(self, key, expires=86400):
+        return bool(await self.database.expire(key, expires))
+
+    async def get_many(self, keys, encoding=None):
+        keys = list(keys)
+        if not keys:
+            return []
+
+        result = await self.database.mget(keys)
+        return [self.unserialize(r, encoding=encoding) for r in result]
+
+    async def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        pipe = self.database.pipeline(transaction=False)
+        for key, pyobj in _items(mapping):
+            pipe.set(key, self.serialize(pyobj, encoding=encoding), ex=expires)
+        await pipe.execute()
+
+    async def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            await self.database.delete(*keys)
+
+    async def hget(self, key, field, encoding=None):
+        result = await self.database.hget(key, field)
+        return self.unserialize(result, encoding=encoding)
+
+    async def hget_many(self, key, fields, encoding=None):
+        fields = list(fields)
+        if not fields:
+            return []
+
+        result = await self.database.hmget(key, fields)
+        return [self.unserialize(r, encoding=encoding) for r in result]
+
+    async def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        pipe = self.database.pipeline()
+        for field, pyobj in _items(mapping):
+            pipe.hset(key, field, self.serialize(pyobj, encoding=encoding))
+        pipe.expire(key, expires)
+        await pipe.execute()
+
+    async def hdel(self, key, fields):
+        fields = list(fields)
+        if fields:
+            await self.database.hdel(key, *fields)
+
+    async def hclear(self, key):
+        await self.database.delete(key)
+
+    async def htouch(self, key, expires=86400):
+        return bool(await self.database.expire(key, expires))
+
+    async def lock_acquire(self, key, ttl=10):
+        # 令牌计数器保留一天, 过期前令牌单调递增
+        fence = "lock:fence:%s" % key
+        pipe = self.database.pipeline()
+        pipe.incr(fence)
+        pipe.expire(fence, 86400)
+        token, _ = await pipe.execute()
+
+        if await self.database.set(
+                "lock:%s" % key, token, nx=True, px=int(ttl * 1000)):
+            return token
+
+    async def lock_release(self, key, token):
+        name = "lock:%s" % key
+        async with self.database.pipeline() as pipe:
+            try:
+                await pipe.watch(name)
+                if await pipe.get(name) != str(token).encode():
+                    await pipe.unwatch()
+                    return False
+
+                pipe.multi()
+                pipe.delete(name)
+                await pipe.execute()
+            except redis.exceptions.WatchError:
+                return False
+
+        return True
+
+    async def close(self):
+        # redis-py 5.0.1 起 close() 已弃用, 改为 aclose()
+        aclose = getattr(self.database, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        else:
+            await self.database.close()
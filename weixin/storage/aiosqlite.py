@@ -0,0 +1,73 @@
+# encoding=utf-8
+import asyncio
+
+import aiosqlite
+
+from .storage import AsyncSqlStorageBase
+from .sqlite3 import SCHEMA, pragmas
+
+
+class AsyncSqlite3Storage(AsyncSqlStorageBase):
+    """
+    基于 aiosqlite 的异步存储器, 与 Sqlite3Storage 使用相同的表结构及
+    PRAGMA 设置, 连接在第一次使用时建立
+    """
+
+    def __init__(self, uri="weixin.sqlite3", journal_mode="WAL",
+                 synchronous="NORMAL"):
+        self.uri = uri
+        self.pragmas = pragmas(journal_mode, synchronous)
+        self.database = None
+        # 在事件循环中创建
+        self._lock = None
+
+    @property
+    def lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _connect(self):
+        async with self.lock:
+            if self.database is None:
+                database = await aiosqlite.connect(self.uri)
+                for statement in self.pragmas:
+                    await database.execute(statement)
+                for statement in SCHEMA:
+                    await database.execute(statement)
+                await database.commit()
+                self.database = database
+
+        return self.database
+
+    async def _execute(self, statement, args, fetch=None, commit=False):
+        database = self.database or await self._connect()
+
+        async with database.execute(statement, args) as cursor:
+            if fetch == "one":
+                result = await cursor.fetchone()
+            elif fetch == "all":
+                result = await cursor.fetchall()
+            elif fetch == "rowcount":
+                result = cursor.rowcount
+            elif fetch == "lastrowid":
+                result = cursor.lastrowid if cursor.rowcount > 0 else None
+            else:
+                result = None
+
+        if commit:
+            await database.commit()
+        return result
+
+    def _translate_blob(self, data):
+        return memoryview(data)
+
+    def _escape_sql_args_formatter(self, statement):
+        return statement
+
+    async def close(self):
+        if self.database is not None:
+            await self.database.close()
+            self.database = None
+        # 关闭后可以在其他事件循环中重新连接
+        self._lock = None
@@ -0,0 +1,236 @@
+# encoding=utf-8
+import os
+import threading
+
+from .storage import StorageBase, _items
+from ..utils import LRUCache
+
+
+__all__ = ['CachedStorage', 'RedisInvalidator']
+
+
+class RedisInvalidator(object):
+    """
+    通过redis发布/订阅在多个节点之间同步缓存失效
+
+    每个节点写入或删除key后发布消息, 其他节点收到后删除本地缓存,
+    自己发布的消息会被忽略
+    """
+
+    def __init__(self, client, channel="weixin:storage:invalidate"):
+        self.client = client
+        self.channel = channel
+        self.node = "%s-%s" % (os.getpid(), os.urandom(4).hex())
+        self._thread = None
+
+    def publish(self, key):
+        self.client.publish(self.channel, "%s %s" % (self.node, key))
+
+    def subscribe(self, callback):
+        """
+        在后台线程中监听失效消息, callback 的参数为失效的key
+        """
+        def handler(message):
+            node, _, key = message["data"].decode("utf-8").partition(" ")
+            if node != self.node:
+                callback(key)
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: handler})
+        self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+class CachedStorage(StorageBase):
+    """
+    在任意存储器前增加一层进程内LRU缓存
+
+    缓存的过期时间不超过 ttl 秒, 也不超过后端存储中剩余的过期时间;
+    set/delete 同时写入后端与本地缓存。多节点部署时传入 invalidator
+    (RedisInvalidator) 同步失效, 否则其他节点的修改最多延迟 ttl 秒可见。
+    缓存的是序列化后的数据, 每次读取都返回新的对象
+
+    >>> app.set_storage(CachedStorage(RedisStorage(uri)))
+    """
+
+    def __init__(self, storage, maxsize=1024, ttl=60, invalidator=None):
+        self.storage = storage
+        self.ttl = ttl
+        self.cache = LRUCache(maxsize=maxsize)
+        self.invalidator = invalidator
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if invalidator is not None:
+            invalidator.subscribe(self.cache.delete)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        返回命中次数, 未命中次数及缓存的key数量
+        """
+        return dict(hits=self.hits, misses=self.misses, size=len(self.cache))
+
+    def _cache_ttl(self, expires):
+        if expires is None or expires < 0:
+            return self.ttl
+        return min(self.ttl, expires)
+
+    def _invalidate(self, key):
+        self.cache.delete(key)
+        if self.invalidator is not None:
+            self.invalidator.publish(key)
+
+    def get(self, key, encoding=None):
+        data = self.cache.get(key)
+        self._count(data is not None)
+        if data is not None:
+            return self.unserialize(data, encoding=encoding)
+
+        try:
+            value = self.storage.get(key, encoding="utf-8")
+        except UnicodeDecodeError:
+            # 旧版本写入的非utf-8字符串, 不做缓存
+            return self.storage.get(key, encoding=encoding)
+
+        if value is None:
+            return
+
+        data = self.serialize(value)
+        expires = self.storage.get_ttl(key)
+        if expires != -2:
+            self.cache.set(key, data, ttl=self._cache_ttl(expires))
+
+        if encoding is None:
+            return self.unserialize(data)
+        return value
+
+    def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        self.storage.set(key, pyobj, expires=expires, encoding=encoding)
+        self._invalidate(key)
+        self.cache.set(key, self.serialize(pyobj, encoding=encoding),
+                       ttl=self._cache_ttl(expires))
+
+    def delete(self, key):
+        self.storage.delete(key)
+        self._invalidate(key)
+
+    def touch(self, key, expires=86400):
+        # 本地缓存的过期时间更短, 无需更新
+        return self.storage.touch(key, expires=expires)
+
+    def get_many(self, keys, encoding=None):
+        # 未命中的key批量从后端读取, 与 get 一样按后端剩余时间写入缓存
+        keys = list(keys)
+        result = [self.cache.get(key) for key in keys]
+        missing = [k for k, data in zip(keys, result) if data is None]
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            try:
+                fetched = self._fetch_many(missing)
+            except UnicodeDecodeError:
+                # 旧版本写入的非utf-8字符串, 不做缓存
+                values = iter(self.storage.get_many(missing, encoding=encoding))
+                return [next(values) if data is None
+                        else self.unserialize(data, encoding=encoding)
+                        for data in result]
+
+            result = [fetched.get(key) if data is None else data
+                      for key, data in zip(keys, result)]
+
+        return [None if data is None
+                else self.unserialize(data, encoding=encoding)
+                for data in result]
+
+    def _fetch_many(self, keys):
+        """
+        从后端批量读取并写入缓存, 返回 {key: 序列化后的数据}
+        """
+        values = self.storage.get_many(keys, encoding="utf-8")
+        found = [(k, v) for k, v in zip(keys, values) if v is not None]
+        ttls = self.storage.get_ttl_many([k for k, _ in found])
+
+        fetched = dict()
+        for (key, value), expires in zip(found, ttls):
+            data = fetched[key] = self.serialize(value)
+            if expires != -2:
+                self.cache.set(key, data, ttl=self._cache_ttl(expires))
+
+        return fetched
+
+    def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        items = list(_items(mapping))
+        self.storage.set_many(items, expires=expires, encoding=encoding)
+        for key, pyobj in items:
+            self._invalidate(key)
+            self.cache.set(key, self.serialize(pyobj, encoding=encoding),
+                           ttl=self._cache_ttl(expires))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        self.storage.delete_many(keys)
+        for key in keys:
+            self._invalidate(key)
+
+    # 哈希字段不经过本地缓存
+
+    def hget(self, key, field, encoding=None):
+        return self.storage.hget(key, field, encoding=encoding)
+
+    def hget_many(self, key, fields, encoding=None):
+        return self.storage.hget_many(key, fields, encoding=encoding)
+
+    def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        return self.storage.hset(
+            key, mapping, expires=expires, encoding=encoding)
+
+    def hdel(self, key, fields):
+        return self.storage.hdel(key, fields)
+
+    def hclear(self, key):
+        return self.storage.hclear(key)
+
+    def htouch(self, key, expires=86400):
+        return self.storage.htouch(key, expires=expires)
+
+    def lock_acquire(self, key, ttl=10):
+        return self.storage.lock_acquire(key, ttl=ttl)
+
+    def lock_release(self, key, token):
+        return self.storage.lock_release(key, token)
+
+    def purge_expired(self):
+        return self.storage.purge_expired()
+
+    def get_all_keys_by_wildcard(self, wildcard="*"):
+        return self.storage.get_all_keys_by_wildcard(wildcard)
+
+    def iter_keys_by_wildcard(self, wildcard="*"):
+        return self.storage.iter_keys_by_wildcard(wildcard)
+
+    def is_expired(self, key):
+        if key in self.cache:
+            return False
+        return self.storage.is_expired(key)
+
+    def get_ttl(self, key):
+        return self.storage.get_ttl(key)
+
+    def get_ttl_many(self, keys):
+        return self.storage.get_ttl_many(keys)
@@ -1,13 +1,21 @@
 # encoding=utf-8
+from collections import OrderedDict
+
 import redis
 
-from .storage import StorageBase
+from .storage import StorageBase, _items
+
+
+# 每次 SCAN 返回的key数量
+SCAN_COUNT = 1000
 
 
 class RedisStorage(StorageBase):
 
-    def __init__(self, uri="redis://127.0.0.1/0"):
-        self.database = redis.StrictRedis.from_url(uri)
+    def __init__(self, uri="redis://127.0.0.1/0", client=None):
+        if client is None:
+            client = redis.StrictRedis.from_url(uri)
+        self.database = client
 
     def get(self, key, encoding=None):
         result = self.database.get(key)
@@ -28,13 +36,105 @@ class RedisStorage(StorageBase):
         return
 
     def get_all_keys_by_wildcard(self, wildcard="*"):
-        keys = self.database.keys(wildcard)
+        # SCAN 可能返回重复的key
+        keys = OrderedDict.fromkeys(self.iter_keys_by_wildcard(wildcard))
+        return list(keys)
 
-        mmp = map(lambda k: k.decode("utf-8"), keys)
-        return list(mmp)
+    def iter_keys_by_wildcard(self, wildcard="*"):
+        # 使用 SCAN 分批遍历, 不会像 KEYS 一样阻塞redis
+        for key in self.database.scan_iter(match=wildcard, count=SCAN_COUNT):
+            yield key.decode("utf-8")
 
     def is_expired(self, key):
         return not self.database.exists(key)
 
     def get_ttl(self, key):
         return self.database.ttl(key)
+
+    def touch(self, key, expires=86400):
+        return bool(self.database.expire(key, expires))
+
+    def get_many(self, keys, encoding=None):
+        keys = list(keys)
+        if not keys:
+            return []
+
+        result = self.database.mget(keys)
+        return [self.unserialize(r, encoding=encoding) for r in result]
+
+    def get_ttl_many(self, keys):
+        pipe = self.database.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+        return pipe.execute()
+
+    def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        pipe = self.database.pipeline(transaction=False)
+        for key, pyobj in _items(mapping):
+            pipe.set(key, self.serialize(pyobj, encoding=encoding), ex=expires)
+        pipe.execute()
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self.database.delete(*keys)
+
+    def hget(self, key, field, encoding=None):
+        result = self.database.hget(key, field)
+        return self.unserialize(result, encoding=encoding)
+
+    def hget_many(self, key, fields, encoding=None):
+        fields = list(fields)
+        if not fields:
+            return []
+
+        result = self.database.hmget(key, fields)
+        return [self.unserialize(r, encoding=encoding) for r in result]
+
+    def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        pipe = self.database.pipeline()
+        for field, pyobj in _items(mapping):
+            pipe.hset(key, field, self.serialize(pyobj, encoding=encoding))
+        pipe.expire(key, expires)
+        pipe.execute()
+
+    def hdel(self, key, fields):
+        fields = list(fields)
+        if fields:
+            self.database.hdel(key, *fields)
+
+    def hclear(self, key):
+        self.database.delete(key)
+
+    def htouch(self, key, expires=86400):
+        return bool(self.database.expire(key, expires))
+
+    def lock_acquire(self, key, ttl=10):
+        # 令牌计数器保留一天, 过期前令牌单调递增
+        fence = "lock:fence:%s" % key
+        pipe = self.database.pipeline()
+        pipe.incr(fence)
+        pipe.expire(fence, 86400)
+        token, _ = pipe.execute()
+
+        if self.database.set(
+                "lock:%s" % key, token, nx=True, px=int(ttl * 1000)):
+            return token
+
+    def lock_release(self, key, token):
+        # 比较令牌后删除, 期间锁被修改时放弃
+        name = "lock:%s" % key
+        with self.database.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                if pipe.get(name) != str(token).encode():
+                    pipe.unwatch()
+                    return False
+
+                pipe.multi()
+                pipe.delete(name)
+                pipe.execute()
+            except redis.exceptions.WatchError:
+                return False
+
+        return True
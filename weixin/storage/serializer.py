@@ -0,0 +1,223 @@
+# encoding=utf-8
+import zlib
+
+import msgpack
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+__all__ = ['Serializer', 'register_codec', 'get_codec', 'MARKER',
+           'UnknownCodecError']
+
+
+# 带编码标记的数据以 0xC1 开头, msgpack 从未使用这个字节,
+# 因此没有标记的数据 (包括旧数据) 按 msgpack 解码
+MARKER = b'\xc1'
+
+# 标记字节的整数值 -> 编解码器
+_CODECS = dict()
+
+_unpackb = msgpack.unpackb
+
+# 原样保存的二进制类型
+_BINARY_TYPES = frozenset([bytes, bytearray, memoryview])
+
+if msgpack.version >= (1, 0):
+    # 1.0 起默认 use_bin_type=True, 不传参数可以少一次参数解析
+    _packb = msgpack.packb
+else:
+    def _packb(pyobj):
+        return msgpack.packb(pyobj, use_bin_type=True)
+
+
+class UnknownCodecError(ValueError):
+    pass
+
+
+class Codec(object):
+    """
+    tag 为一个字节的编码标记; compression 为 True 的编解码器
+    用于压缩另一段带标记的数据; buffer 为 True 时 loads 接收
+    memoryview, 避免复制数据
+    """
+
+    tag = None
+    name = None
+    compression = False
+    buffer = True
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        raise NotImplementedError
+
+    def loads(self, data, encoding=None):
+        raise NotImplementedError
+
+
+class MsgpackCodec(Codec):
+
+    tag = b'm'
+    name = "msgpack"
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        return _packb(pyobj)
+
+    def loads(self, data, encoding=None):
+        # 未指定encoding时字符串以bytes返回, 与旧版本一致
+        return _unpackb(data, raw=encoding is None)
+
+
+class StrCodec(Codec):
+
+    tag = b's'
+    name = "str"
+    buffer = False
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        return pyobj.encode(encoding or "utf-8")
+
+    def loads(self, data, encoding=None):
+        if encoding is None:
+            return data
+        return data.decode(encoding)
+
+
+class BytesCodec(Codec):
+
+    tag = b'b'
+    name = "bytes"
+    buffer = False
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        return bytes(pyobj)
+
+    def loads(self, data, encoding=None):
+        return bytes(data)
+
+
+class ZlibCodec(Codec):
+
+    tag = b'z'
+    name = "zlib"
+    compression = True
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def dumps(self, data, encoding="utf-8"):
+        return zlib.compress(data, self.level)
+
+    def loads(self, data, encoding=None):
+        return zlib.decompress(data)
+
+
+class LZ4Codec(Codec):
+
+    tag = b'4'
+    name = "lz4"
+    compression = True
+
+    def dumps(self, data, encoding="utf-8"):
+        return lz4.frame.compress(data)
+
+    def loads(self, data, encoding=None):
+        return lz4.frame.decompress(data)
+
+
+def register_codec(codec):
+    """
+    注册编解码器, 标记字节不能重复
+    """
+    if len(codec.tag) != 1:
+        raise ValueError("codec tag must be a single byte.")
+
+    tag = codec.tag[0]
+    if tag in _CODECS and _CODECS[tag].name != codec.name:
+        raise ValueError("codec tag %r is already registered." % codec.tag)
+
+    codec.prefix = MARKER + codec.tag
+    _CODECS[tag] = codec
+
+
+def get_codec(name):
+    for codec in _CODECS.values():
+        if codec.name == name:
+            return codec
+
+    raise KeyError("codec %s is not registered or not installed." % name)
+
+
+register_codec(MsgpackCodec())
+register_codec(StrCodec())
+register_codec(BytesCodec())
+register_codec(ZlibCodec())
+if lz4 is not None:
+    register_codec(LZ4Codec())
+
+
+class Serializer(object):
+    """
+    存储器使用的序列化器
+
+    str 与 bytes 直接保存, 其他对象使用 msgpack; 数据大于 threshold 字节时
+    使用 compress (zlib 或 lz4) 压缩。str, bytes 及压缩后的数据以
+    MARKER + 标记字节开头, 解码时按标记选择编解码器; msgpack 数据不加标记,
+    与旧版本的格式相同, 因此不同配置写入的数据可以共存
+
+    >>> storage.serializer = Serializer(compress="zlib", threshold=1024)
+    """
+
+    def __init__(self, compress=None, threshold=1024):
+        self.compress = get_codec(compress) if compress else None
+        self.threshold = threshold
+
+        self._str_prefix = get_codec("str").prefix
+        self._bytes_prefix = get_codec("bytes").prefix
+
+    def dumps(self, pyobj, encoding="utf-8"):
+        cls = type(pyobj)
+        if cls is dict:
+            # 会话等字典最常见, msgpack 数据不加标记
+            data = _packb(pyobj)
+        elif cls is str:
+            data = self._str_prefix + pyobj.encode(encoding or "utf-8")
+        elif cls in _BINARY_TYPES:
+            data = self._bytes_prefix + bytes(pyobj)
+        else:
+            data = _packb(pyobj)
+
+        compress = self.compress
+        if compress is not None and len(data) > self.threshold:
+            packed = compress.dumps(data)
+            if len(packed) + 2 < len(data):
+                data = compress.prefix + packed
+
+        return data
+
+    def loads(self, data, encoding=None):
+        if not isinstance(data, bytes):
+            return
+
+        # 没有标记的数据按 msgpack 解码
+        if not data or data[0] != 0xC1:
+            return _unpackb(data, raw=encoding is None)
+
+        tag = data[1]
+        if tag == 0x73:
+            # str 最常见 (如 access_token), 不经过编解码器查找
+            payload = data[2:]
+            return payload if encoding is None else payload.decode(encoding)
+
+        codec = _CODECS.get(tag)
+        if codec is None:
+            raise UnknownCodecError(
+                "unknown codec tag %r, the codec may not be installed." %
+                data[1:2])
+
+        payload = memoryview(data)[2:] if codec.buffer else data[2:]
+        if codec.compression:
+            return self.loads(codec.loads(payload), encoding=encoding)
+
+        return codec.loads(payload, encoding=encoding)
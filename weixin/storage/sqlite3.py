@@ -1,39 +1,140 @@
 # encoding=utf-8
+import contextlib
 import sqlite3
+import threading
 
 from .storage import SqlStorageBase
 
 
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS storage
+    (
+        key TEXT PRIMARY KEY NOT NULL,
+        value BLOB NOT NULL,
+        expired BIGINT DEFAULT 0
+    );"""
+
+CREATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS storage_expired
+    ON storage (expired);"""
+
+# 哈希字段, 每个字段一行
+CREATE_HASH_TABLE = """
+    CREATE TABLE IF NOT EXISTS storage_hash
+    (
+        key TEXT NOT NULL,
+        field TEXT NOT NULL,
+        value BLOB NOT NULL,
+        expired BIGINT DEFAULT 0,
+        PRIMARY KEY (key, field)
+    );"""
+
+CREATE_HASH_INDEX = """
+    CREATE INDEX IF NOT EXISTS storage_hash_expired
+    ON storage_hash (expired);"""
+
+CREATE_LOCK_TABLE = """
+    CREATE TABLE IF NOT EXISTS storage_lock
+    (
+        key TEXT PRIMARY KEY NOT NULL,
+        token BIGINT DEFAULT 0,
+        expired BIGINT DEFAULT 0
+    );"""
+
+SCHEMA = [CREATE_TABLE, CREATE_INDEX, CREATE_HASH_TABLE, CREATE_HASH_INDEX,
+          CREATE_LOCK_TABLE]
+
+
+def pragmas(journal_mode=None, synchronous=None):
+    """
+    打开数据库后执行的 PRAGMA 语句
+    """
+    statements = []
+    if journal_mode:
+        statements.append("PRAGMA journal_mode=%s;" % journal_mode)
+    if synchronous:
+        statements.append("PRAGMA synchronous=%s;" % synchronous)
+    return statements
+
+
 class Sqlite3Storage(SqlStorageBase):
+    """
+    默认使用 WAL 日志与 synchronous=NORMAL, 写入不再每次都等待fsync,
+    读取与写入互不阻塞; journal_mode/synchronous 为 None 时保持数据库原有设置
 
-    def __init__(self, uri="weixin.sqlite3"):
+    commit_interval 大于0时开启组提交: 该时间窗口(秒)内的写入合并为一次提交,
+    其他进程在提交后才能读到, 退出前应调用 flush() 或 close()
+    """
+
+    def __init__(self, uri="weixin.sqlite3", journal_mode="WAL",
+                 synchronous="NORMAL", commit_interval=0):
 
         self.database = sqlite3.connect(uri, check_same_thread=False)
+        self.commit_interval = commit_interval
 
-        def make_cursor(database):
-            class Sqlite3Cursor(sqlite3.Cursor):
-                def __enter__(self):
-                    return self
+        # 多个线程共用一个连接, 语句与提交需要串行
+        self._lock = threading.RLock()
+        self._commit_timer = None
 
-                def __exit__(self, *exc_info):
-                    del exc_info
-                    database.commit()
-                    self.close()
+        for statement in pragmas(journal_mode, synchronous):
+            self.database.execute(statement)
+        self._create_table()
 
-            return Sqlite3Cursor
+    @contextlib.contextmanager
+    def _cursor(self, commit=True):
+        with self._lock:
+            cursor = self.database.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
 
-        self.Cursor = make_cursor(self.database)
-        self._create_table()
+            # 只读查询不会开启事务, 无需提交
+            if commit:
+                self._commit()
+
+    def _commit(self):
+        if self.commit_interval <= 0:
+            self.database.commit()
+            return
+
+        if self._commit_timer is None:
+            self._commit_timer = threading.Timer(
+                self.commit_interval, self.flush)
+            self._commit_timer.daemon = True
+            self._commit_timer.start()
+
+    def flush(self):
+        """
+        立即提交组提交窗口中的写入
+        """
+        with self._lock:
+            if self._commit_timer is not None:
+                self._commit_timer.cancel()
+                self._commit_timer = None
+            self.database.commit()
+
+    def close(self):
+        self.flush()
+        self.database.close()
+
+    def lock_acquire(self, key, ttl=10):
+        # 锁需要立即对其他进程可见, 不参与组提交
+        token = super(Sqlite3Storage, self).lock_acquire(key, ttl)
+        if self.commit_interval > 0:
+            self.flush()
+        return token
+
+    def lock_release(self, key, token):
+        result = super(Sqlite3Storage, self).lock_release(key, token)
+        if self.commit_interval > 0:
+            self.flush()
+        return result
 
     def _create_table(self):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS storage
-            (
-                key TEXT PRIMARY KEY NOT NULL,
-                value BLOB NOT NULL,
-                expired BIGINT DEFAULT 0
-            );""")
+        with self._cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
 
     def _translate_blob(self, data):
         return memoryview(data)
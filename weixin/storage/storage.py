@@ -1,10 +1,26 @@
 # encoding=utf-8
-import msgpack
 from time import time as get_timestamp
 
+from .serializer import Serializer
+
+
+def _items(mapping):
+    if isinstance(mapping, dict):
+        return mapping.items()
+    return mapping
+
+
+def _chunks(items, size):
+    items = list(items)
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
 
 class StorageBase(object):
 
+    # 可以在实例上替换, 例如 Serializer(compress="zlib")
+    serializer = Serializer()
+
     def get(self, key, encoding=None):
         raise NotImplementedError
 
@@ -26,18 +42,313 @@ class StorageBase(object):
     def get_ttl(self, key):
         raise NotImplementedError
 
-    def serialize(self, dict, encoding="utf-8"):
-        bytes = msgpack.dumps(dict, encoding=encoding)
-        return bytes
+    def touch(self, key, expires=86400):
+        """
+        只更新key的过期时间, key不存在时返回 False
+        """
+        value = self.get(key, encoding="utf-8")
+        if value is None:
+            return False
+
+        self.set(key, value, expires=expires)
+        return True
+
+    def get_many(self, keys, encoding=None):
+        """
+        批量读取, 返回与 keys 顺序一致的数组, 不存在的key为 None
+        """
+        return [self.get(key, encoding=encoding) for key in keys]
+
+    def get_ttl_many(self, keys):
+        """
+        批量读取剩余过期时间, 与 get_ttl 一致: 不存在为 -2, 不过期为 -1
+        """
+        return [self.get_ttl(key) for key in keys]
+
+    def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        """
+        批量写入, mapping 为字典或 (key, pyobj) 数组
+        """
+        for key, pyobj in _items(mapping):
+            self.set(key, pyobj, expires=expires, encoding=encoding)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def iter_keys_by_wildcard(self, wildcard="*"):
+        """
+        逐个返回匹配的key, 存储器支持时不会一次读取全部key
+        """
+        return iter(self.get_all_keys_by_wildcard(wildcard))
+
+    # 哈希: key 下的每个字段单独序列化, 读写单个字段无需处理整个字典。
+    # 默认实现把字段保存在一个字典中, redis 与 SQL 存储器按字段读写
+
+    def hget(self, key, field, encoding=None):
+        return self.hget_many(key, [field], encoding=encoding)[0]
+
+    def hget_many(self, key, fields, encoding=None):
+        """
+        返回与 fields 顺序一致的数组, 不存在的字段为 None
+        """
+        data = self.get(key, encoding="utf-8") or {}
+        return [self.unserialize(data.get(f), encoding=encoding)
+                for f in fields]
+
+    def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        """
+        写入多个字段, 并将整个key的过期时间设为 expires
+        """
+        data = self.get(key, encoding="utf-8") or {}
+        for field, pyobj in _items(mapping):
+            data[field] = self.serialize(pyobj, encoding=encoding)
+        self.set(key, data, expires=expires)
+
+    def hdel(self, key, fields):
+        data = self.get(key, encoding="utf-8")
+        ttl = self.get_ttl(key)
+        if data and ttl > 0:
+            for field in fields:
+                data.pop(field, None)
+            self.set(key, data, expires=ttl)
+
+    def hclear(self, key):
+        self.delete(key)
+
+    def htouch(self, key, expires=86400):
+        return self.touch(key, expires=expires)
+
+    def lock_acquire(self, key, ttl=10):
+        """
+        获取 ttl 秒后自动过期的分布式锁, 成功时返回递增的令牌, 否则返回 None
+        """
+        raise NotImplementedError
+
+    def lock_release(self, key, token):
+        """
+        令牌一致时释放锁, 锁已过期或被其他节点持有时返回 False
+        """
+        raise NotImplementedError
+
+    def serialize(self, pyobj, encoding="utf-8"):
+        return self.serializer.dumps(pyobj, encoding=encoding)
 
     def unserialize(self, byte, encoding=None):
-        if not isinstance(byte, bytes):
-            return
-        dict = msgpack.loads(byte, encoding=encoding)
-        return dict
+        return self.serializer.loads(byte, encoding=encoding)
+
+
+class AsyncStorageBase(StorageBase):
+    """
+    异步存储器, 方法与 StorageBase 相同但均为协程,
+    序列化方式与数据布局与同步存储器一致, 可以共用同一份数据
+    """
+
+    async def get(self, key, encoding=None):
+        raise NotImplementedError
+
+    async def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        raise NotImplementedError
+
+    async def delete(self, key):
+        raise NotImplementedError
+
+    async def purge_expired(self):
+        raise NotImplementedError
+
+    async def get_all_keys_by_wildcard(self, wildcard="*"):
+        raise NotImplementedError
+
+    async def is_expired(self, key):
+        raise NotImplementedError
+
+    async def get_ttl(self, key):
+        raise NotImplementedError
+
+    async def touch(self, key, expires=86400):
+        value = await self.get(key, encoding="utf-8")
+        if value is None:
+            return False
+
+        await self.set(key, value, expires=expires)
+        return True
 
+    async def get_many(self, keys, encoding=None):
+        return [await self.get(key, encoding=encoding) for key in keys]
 
-class SqlStorageBase(StorageBase):
+    async def get_ttl_many(self, keys):
+        return [await self.get_ttl(key) for key in keys]
+
+    async def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        for key, pyobj in _items(mapping):
+            await self.set(key, pyobj, expires=expires, encoding=encoding)
+
+    async def delete_many(self, keys):
+        for key in keys:
+            await self.delete(key)
+
+    def iter_keys_by_wildcard(self, wildcard="*"):
+        raise NotImplementedError(
+            "use get_all_keys_by_wildcard with async storages.")
+
+    async def hget(self, key, field, encoding=None):
+        return (await self.hget_many(key, [field], encoding=encoding))[0]
+
+    async def hget_many(self, key, fields, encoding=None):
+        data = await self.get(key, encoding="utf-8") or {}
+        return [self.unserialize(data.get(f), encoding=encoding)
+                for f in fields]
+
+    async def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        data = await self.get(key, encoding="utf-8") or {}
+        for field, pyobj in _items(mapping):
+            data[field] = self.serialize(pyobj, encoding=encoding)
+        await self.set(key, data, expires=expires)
+
+    async def hdel(self, key, fields):
+        data = await self.get(key, encoding="utf-8")
+        ttl = await self.get_ttl(key)
+        if data and ttl > 0:
+            for field in fields:
+                data.pop(field, None)
+            await self.set(key, data, expires=ttl)
+
+    async def hclear(self, key):
+        await self.delete(key)
+
+    async def htouch(self, key, expires=86400):
+        return await self.touch(key, expires=expires)
+
+
+class SqlStatements(object):
+    """
+    同步与异步SQL存储器共用的语句, 参数占位符为 ?
+    """
+
+    GET = """
+        SELECT `value`
+        FROM `storage`
+        WHERE `key`=? AND `expired`>?
+        LIMIT 1;"""
+
+    SET = """
+        REPLACE INTO `storage`
+        (`key`, `value`, `expired`)
+        VALUES (?, ?, ?);"""
+
+    DELETE = """
+        DELETE
+        FROM `storage`
+        WHERE `key`=?;"""
+
+    PURGE_EXPIRED = """
+        DELETE
+        FROM `storage`
+        WHERE `expired`<=?;"""
+
+    GET_KEYS = """
+        SELECT `key`
+        FROM `storage`
+        WHERE `expired`>? AND `key` LIKE ?;"""
+
+    IS_EXPIRED = """
+        SELECT 1
+        FROM `storage`
+        WHERE `key`=? AND `expired`>?
+        LIMIT 1;"""
+
+    GET_TTL = """
+        SELECT `expired`
+        FROM `storage`
+        WHERE `key`=? AND `expired`>?
+        LIMIT 1;"""
+
+    TOUCH = """
+        UPDATE `storage`
+        SET `expired`=?
+        WHERE `key`=? AND `expired`>?;"""
+
+    GET_MANY = """
+        SELECT `key`, `value`
+        FROM `storage`
+        WHERE `key` IN (%s) AND `expired`>?;"""
+
+    GET_TTL_MANY = """
+        SELECT `key`, `expired`
+        FROM `storage`
+        WHERE `key` IN (%s) AND `expired`>?;"""
+
+    SET_MANY = """
+        REPLACE INTO `storage`
+        (`key`, `value`, `expired`)
+        VALUES %s;"""
+
+    DELETE_MANY = """
+        DELETE
+        FROM `storage`
+        WHERE `key` IN (%s);"""
+
+    HGET_MANY = """
+        SELECT `field`, `value`
+        FROM `storage_hash`
+        WHERE `key`=? AND `field` IN (%s) AND `expired`>?;"""
+
+    HSET_MANY = """
+        REPLACE INTO `storage_hash`
+        (`key`, `field`, `value`, `expired`)
+        VALUES %s;"""
+
+    HDEL_MANY = """
+        DELETE
+        FROM `storage_hash`
+        WHERE `key`=? AND `field` IN (%s);"""
+
+    HCLEAR = """
+        DELETE
+        FROM `storage_hash`
+        WHERE `key`=?;"""
+
+    HTOUCH = """
+        UPDATE `storage_hash`
+        SET `expired`=?
+        WHERE `key`=? AND `expired`>?;"""
+
+    # 锁的行在第一次加锁时创建且不删除, 令牌在同一个key上单调递增;
+    # expired 为毫秒时间戳
+    LOCK_INSERT = """
+        %s INTO `storage_lock`
+        (`key`, `token`, `expired`)
+        VALUES (?, 0, 0);"""
+
+    LOCK_ACQUIRE = """
+        UPDATE `storage_lock`
+        SET `token`=`token`+1, `expired`=?
+        WHERE `key`=? AND `expired`<=?;"""
+
+    LOCK_TOKEN = """
+        SELECT `token`
+        FROM `storage_lock`
+        WHERE `key`=?;"""
+
+    # 为 True 时 LOCK_ACQUIRE 通过 LAST_INSERT_ID(expr) 在同一条语句中返回令牌,
+    # 否则在同一个事务中由 LOCK_TOKEN 读取
+    LOCK_TOKEN_FROM_UPDATE = False
+
+    LOCK_RELEASE = """
+        UPDATE `storage_lock`
+        SET `expired`=0
+        WHERE `key`=? AND `token`=? AND `expired`>?;"""
+
+    # 忽略主键冲突的插入语句, mysql 为 INSERT IGNORE
+    INSERT_IGNORE = "INSERT OR IGNORE"
+
+    PURGE_HASH_EXPIRED = """
+        DELETE
+        FROM `storage_hash`
+        WHERE `expired`<=?;"""
+
+    # 单条语句的参数个数上限, 旧版本 sqlite 为 999
+    MAX_SQL_ARGS = 900
 
     def _translate_blob(self, data):
         raise NotImplementedError
@@ -45,13 +356,102 @@ class SqlStorageBase(StorageBase):
     def _escape_sql_args_formatter(self, statement):
         raise NotImplementedError
 
+    def _get_many_statements(self, keys, template=None):
+        now = get_timestamp()
+        for chunk in _chunks(keys, self.MAX_SQL_ARGS - 1):
+            statement = (template or self.GET_MANY) % \
+                ", ".join("?" * len(chunk))
+            yield self._escape_sql_args_formatter(statement), chunk + [now]
+
+    def _set_many_statements(self, mapping, expires, encoding):
+        expired = get_timestamp() + expires
+        for chunk in _chunks(_items(mapping), self.MAX_SQL_ARGS // 3):
+            statement = self.SET_MANY % ", ".join(["(?, ?, ?)"] * len(chunk))
+            args = []
+            for key, pyobj in chunk:
+                data = self.serialize(pyobj, encoding=encoding)
+                args.extend((key, self._translate_blob(data), expired))
+            yield self._escape_sql_args_formatter(statement), args
+
+    def _delete_many_statements(self, keys):
+        for chunk in _chunks(keys, self.MAX_SQL_ARGS):
+            statement = self.DELETE_MANY % ", ".join("?" * len(chunk))
+            yield self._escape_sql_args_formatter(statement), chunk
+
+    def _hget_many_statements(self, key, fields):
+        now = get_timestamp()
+        for chunk in _chunks(fields, self.MAX_SQL_ARGS - 2):
+            statement = self.HGET_MANY % ", ".join("?" * len(chunk))
+            yield (self._escape_sql_args_formatter(statement),
+                   [key] + chunk + [now])
+
+    def _hset_statements(self, key, mapping, expires, encoding):
+        now = get_timestamp()
+        expired = now + expires
+        for chunk in _chunks(_items(mapping), self.MAX_SQL_ARGS // 4):
+            statement = self.HSET_MANY % \
+                ", ".join(["(?, ?, ?, ?)"] * len(chunk))
+            args = []
+            for field, pyobj in chunk:
+                data = self.serialize(pyobj, encoding=encoding)
+                args.extend((key, field, self._translate_blob(data), expired))
+            yield self._escape_sql_args_formatter(statement), args
+
+        # 其他字段的过期时间与整个key保持一致
+        yield (self._escape_sql_args_formatter(self.HTOUCH),
+               (expired, key, now))
+
+    def _hdel_statements(self, key, fields):
+        for chunk in _chunks(fields, self.MAX_SQL_ARGS - 1):
+            statement = self.HDEL_MANY % ", ".join("?" * len(chunk))
+            yield self._escape_sql_args_formatter(statement), [key] + chunk
+
+    def _lock_statements(self, key, ttl):
+        now = int(get_timestamp() * 1000)
+        return [
+            (self._escape_sql_args_formatter(
+                self.LOCK_INSERT % self.INSERT_IGNORE), (key,)),
+            (self._escape_sql_args_formatter(self.LOCK_ACQUIRE),
+                (now + int(ttl * 1000), key, now)),
+            (self._escape_sql_args_formatter(self.LOCK_TOKEN), (key,)),
+        ]
+
+    def _lock_release_statement(self, key, token):
+        return (self._escape_sql_args_formatter(self.LOCK_RELEASE),
+                (key, token, int(get_timestamp() * 1000)))
+
+    def _order_many(self, keys, rows, encoding):
+        found = dict()
+        for key, value in rows:
+            found[key] = self.unserialize(bytes(value), encoding=encoding)
+        return [found.get(key) for key in keys]
+
+    def _order_ttl_many(self, keys, rows):
+        found = dict((key, expired) for key, expired in rows)
+        return [self._ttl_from_expired((found[key],) if key in found else None)
+                for key in keys]
+
+    def _wildcard_to_like(self, wildcard):
+        return wildcard.replace("*", "%").replace("?", "_")
+
+    def _ttl_from_expired(self, result):
+        if not result: return -2
+
+        ttl = int(result[0]) - get_timestamp()
+        return int(ttl)
+
+
+class SqlStorageBase(SqlStatements, StorageBase):
+
+    def _cursor(self, commit=True):
+        """
+        返回执行语句的游标上下文, commit 为 False 时为只读查询, 无需提交
+        """
+        return self.database.cursor(self.Cursor)
+
     def get(self, key, encoding=None):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                SELECT `value`
-                FROM `storage`
-                WHERE `key`=? AND `expired`>?
-                LIMIT 1;"""),
+        with self._cursor(commit=False) as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.GET),
             (key, get_timestamp()))
 
             result = cursor.fetchone()
@@ -65,36 +465,28 @@ class SqlStorageBase(StorageBase):
 
     def set(self, key, pyobj, expires=86400, encoding="utf-8"):
         data = self.serialize(pyobj, encoding=encoding)
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                REPLACE INTO `storage`
-                (`key`, `value`, `expired`)
-                VALUES (?, ?, ?);"""),
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.SET),
             (key, self._translate_blob(data), get_timestamp() + expires))
 
     def delete(self, key):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                DELETE
-                FROM `storage`
-                WHERE `key`=?;"""),
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.DELETE),
                 (key,))
 
     def purge_expired(self):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                DELETE
-                FROM `storage`
-                WHERE `expired`<=?;"""),
-                (get_timestamp(),))
+        now = get_timestamp()
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.PURGE_EXPIRED),
+                (now,))
+            cursor.execute(
+                self._escape_sql_args_formatter(self.PURGE_HASH_EXPIRED),
+                (now,))
 
     def get_all_keys_by_wildcard(self, wildcard="*"):
-        wc = wildcard.replace("*", "%").replace("?", "_")
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                SELECT `key`
-                FROM `storage`
-                WHERE `expired`>? AND `key` LIKE ?;"""),
+        wc = self._wildcard_to_like(wildcard)
+        with self._cursor(commit=False) as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.GET_KEYS),
                 (get_timestamp(), wc))
 
             result = [k for k, *_ in cursor.fetchall()]
@@ -102,12 +494,8 @@ class SqlStorageBase(StorageBase):
         return result
 
     def is_expired(self, key):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                SELECT 1
-                FROM `storage`
-                WHERE `key`=? AND `expired`>?
-                LIMIT 1;"""),
+        with self._cursor(commit=False) as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.IS_EXPIRED),
                 (key, get_timestamp()))
 
             result = not bool(cursor.fetchone())
@@ -115,16 +503,261 @@ class SqlStorageBase(StorageBase):
         return result
 
     def get_ttl(self, key):
-        with self.database.cursor(self.Cursor) as cursor:
-            cursor.execute(self._escape_sql_args_formatter("""
-                SELECT `expired`
-                FROM `storage`
-                WHERE `key`=? AND `expired`>?
-                LIMIT 1;"""),
+        with self._cursor(commit=False) as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.GET_TTL),
                 (key, get_timestamp()))
             result = cursor.fetchone()
 
-        if not result: return -2
-        
-        ttl = int(result[0]) - get_timestamp()
-        return int(ttl)
+        return self._ttl_from_expired(result)
+
+    def touch(self, key, expires=86400):
+        now = get_timestamp()
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.TOUCH),
+                (now + expires, key, now))
+            result = cursor.rowcount > 0
+
+        return result
+
+    def get_many(self, keys, encoding=None):
+        keys = list(keys)
+        rows = []
+        with self._cursor(commit=False) as cursor:
+            for statement, args in self._get_many_statements(keys):
+                cursor.execute(statement, args)
+                rows.extend(cursor.fetchall())
+
+        return self._order_many(keys, rows, encoding)
+
+    def get_ttl_many(self, keys):
+        keys = list(keys)
+        rows = []
+        with self._cursor(commit=False) as cursor:
+            for statement, args in self._get_many_statements(
+                    keys, self.GET_TTL_MANY):
+                cursor.execute(statement, args)
+                rows.extend(cursor.fetchall())
+
+        return self._order_ttl_many(keys, rows)
+
+    def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        with self._cursor() as cursor:
+            for statement, args in self._set_many_statements(
+                    mapping, expires, encoding):
+                cursor.execute(statement, args)
+
+    def delete_many(self, keys):
+        with self._cursor() as cursor:
+            for statement, args in self._delete_many_statements(keys):
+                cursor.execute(statement, args)
+
+    def hget_many(self, key, fields, encoding=None):
+        fields = list(fields)
+        rows = []
+        with self._cursor(commit=False) as cursor:
+            for statement, args in self._hget_many_statements(key, fields):
+                cursor.execute(statement, args)
+                rows.extend(cursor.fetchall())
+
+        return self._order_many(fields, rows, encoding)
+
+    def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        with self._cursor() as cursor:
+            for statement, args in self._hset_statements(
+                    key, mapping, expires, encoding):
+                cursor.execute(statement, args)
+
+    def hdel(self, key, fields):
+        with self._cursor() as cursor:
+            for statement, args in self._hdel_statements(key, list(fields)):
+                cursor.execute(statement, args)
+
+    def hclear(self, key):
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.HCLEAR),
+                (key,))
+
+    def lock_acquire(self, key, ttl=10):
+        insert, update, select = self._lock_statements(key, ttl)
+        with self._cursor() as cursor:
+            cursor.execute(*insert)
+            cursor.execute(*update)
+            if cursor.rowcount <= 0:
+                return
+
+            if self.LOCK_TOKEN_FROM_UPDATE:
+                return int(cursor.lastrowid)
+
+            cursor.execute(*select)
+            result = cursor.fetchone()
+
+        return int(result[0])
+
+    def lock_release(self, key, token):
+        with self._cursor() as cursor:
+            cursor.execute(*self._lock_release_statement(key, token))
+            result = cursor.rowcount > 0
+
+        return result
+
+    def htouch(self, key, expires=86400):
+        now = get_timestamp()
+        with self._cursor() as cursor:
+            cursor.execute(self._escape_sql_args_formatter(self.HTOUCH),
+                (now + expires, key, now))
+            result = cursor.rowcount > 0
+
+        return result
+
+
+class AsyncSqlStorageBase(SqlStatements, AsyncStorageBase):
+    """
+    异步SQL存储器, 子类实现 _execute
+    """
+
+    async def _execute(self, statement, args, fetch=None, commit=False):
+        """
+        执行语句, fetch 为 "one" 或 "all" 时返回查询结果,
+        为 "rowcount" 时返回影响的行数, 为 "lastrowid" 时返回
+        cursor.lastrowid, 没有影响任何行时返回 None
+        """
+        raise NotImplementedError
+
+    async def get(self, key, encoding=None):
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.GET),
+            (key, get_timestamp()), fetch="one")
+
+        if not result:
+            return
+
+        return self.unserialize(bytes(result[0]), encoding=encoding)
+
+    async def set(self, key, pyobj, expires=86400, encoding="utf-8"):
+        data = self.serialize(pyobj, encoding=encoding)
+        await self._execute(
+            self._escape_sql_args_formatter(self.SET),
+            (key, self._translate_blob(data), get_timestamp() + expires),
+            commit=True)
+
+    async def delete(self, key):
+        await self._execute(
+            self._escape_sql_args_formatter(self.DELETE),
+            (key,), commit=True)
+
+    async def purge_expired(self):
+        now = get_timestamp()
+        await self._execute(
+            self._escape_sql_args_formatter(self.PURGE_EXPIRED),
+            (now,), commit=True)
+        await self._execute(
+            self._escape_sql_args_formatter(self.PURGE_HASH_EXPIRED),
+            (now,), commit=True)
+
+    async def get_all_keys_by_wildcard(self, wildcard="*"):
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.GET_KEYS),
+            (get_timestamp(), self._wildcard_to_like(wildcard)), fetch="all")
+
+        return [k for k, *_ in result]
+
+    async def is_expired(self, key):
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.IS_EXPIRED),
+            (key, get_timestamp()), fetch="one")
+
+        return not bool(result)
+
+    async def get_ttl(self, key):
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.GET_TTL),
+            (key, get_timestamp()), fetch="one")
+
+        return self._ttl_from_expired(result)
+
+    async def touch(self, key, expires=86400):
+        now = get_timestamp()
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.TOUCH),
+            (now + expires, key, now), fetch="rowcount", commit=True)
+
+        return result > 0
+
+    async def get_many(self, keys, encoding=None):
+        keys = list(keys)
+        rows = []
+        for statement, args in self._get_many_statements(keys):
+            rows.extend(await self._execute(statement, args, fetch="all"))
+
+        return self._order_many(keys, rows, encoding)
+
+    async def get_ttl_many(self, keys):
+        keys = list(keys)
+        rows = []
+        for statement, args in self._get_many_statements(
+                keys, self.GET_TTL_MANY):
+            rows.extend(await self._execute(statement, args, fetch="all"))
+
+        return self._order_ttl_many(keys, rows)
+
+    async def set_many(self, mapping, expires=86400, encoding="utf-8"):
+        for statement, args in self._set_many_statements(
+                mapping, expires, encoding):
+            await self._execute(statement, args, commit=True)
+
+    async def delete_many(self, keys):
+        for statement, args in self._delete_many_statements(keys):
+            await self._execute(statement, args, commit=True)
+
+    async def hget_many(self, key, fields, encoding=None):
+        fields = list(fields)
+        rows = []
+        for statement, args in self._hget_many_statements(key, fields):
+            rows.extend(await self._execute(statement, args, fetch="all"))
+
+        return self._order_many(fields, rows, encoding)
+
+    async def hset(self, key, mapping, expires=86400, encoding="utf-8"):
+        for statement, args in self._hset_statements(
+                key, mapping, expires, encoding):
+            await self._execute(statement, args, commit=True)
+
+    async def hdel(self, key, fields):
+        for statement, args in self._hdel_statements(key, list(fields)):
+            await self._execute(statement, args, commit=True)
+
+    async def hclear(self, key):
+        await self._execute(
+            self._escape_sql_args_formatter(self.HCLEAR),
+            (key,), commit=True)
+
+    async def htouch(self, key, expires=86400):
+        now = get_timestamp()
+        result = await self._execute(
+            self._escape_sql_args_formatter(self.HTOUCH),
+            (now + expires, key, now), fetch="rowcount", commit=True)
+
+        return result > 0
+
+    async def lock_acquire(self, key, ttl=10):
+        insert, update, select = self._lock_statements(key, ttl)
+        await self._execute(*insert)
+
+        if self.LOCK_TOKEN_FROM_UPDATE:
+            token = await self._execute(*update, fetch="lastrowid", commit=True)
+            return None if token is None else int(token)
+
+        # 令牌与 UPDATE 在同一个事务中读取后再提交
+        rowcount = await self._execute(*update, fetch="rowcount")
+        result = await self._execute(*select, fetch="one", commit=True)
+        if rowcount <= 0:
+            return
+
+        return int(result[0])
+
+    async def lock_release(self, key, token):
+        statement, args = self._lock_release_statement(key, token)
+        result = await self._execute(
+            statement, args, fetch="rowcount", commit=True)
+
+        return result > 0
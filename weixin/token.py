@@ -0,0 +1,265 @@
+# encoding=utf-8
+import asyncio
+import threading
+import time
+
+from .storage.storage import AsyncStorageBase
+from .utils import call_async
+
+
+__all__ = ['AccessTokenManager', 'TOKEN_KEY']
+
+
+TOKEN_KEY = "weixin:ACCESS_TOKEN"
+
+
+class AccessTokenManager(object):
+    """
+    access_token 管理
+
+    token 保存在 config.storage 中, 即将过期 (剩余不足 refresh_ahead 秒)
+    时由后台线程或协程提前刷新。刷新时进程内只有一个线程请求微信接口,
+    多个进程/节点之间通过存储器的锁 (lock_acquire) 选出一个刷新者,
+    其他调用者等待新的token写入存储器, 避免互相使对方的token失效
+
+    fetch 为请求 /cgi-bin/token 的函数, 返回 {"access_token", "expires_in"}
+
+    存储器为异步存储器或 fetch 为协程函数时只能使用 *_async 方法
+    """
+
+    def __init__(self, config, fetch, refresh_ahead=300, lock_ttl=30,
+                 wait_timeout=10):
+        self.config = config
+        self.fetch = fetch
+        self.refresh_ahead = refresh_ahead
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+
+        self.refreshes = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        # 在事件循环中创建
+        self._async_lock = None
+        self._stop = threading.Event()
+
+    @property
+    def storage(self):
+        return self.config.storage
+
+    def _check_sync(self):
+        if isinstance(self.storage, AsyncStorageBase) or \
+                asyncio.iscoroutinefunction(self.fetch):
+            raise TypeError(
+                "async storage or fetch, use get_token_async/refresh_async.")
+
+    def get_token(self):
+        """
+        返回有效的token, 不存在时刷新
+        """
+        self._check_sync()
+        token = self.storage.get(TOKEN_KEY, encoding="utf-8")
+        if token is not None:
+            return token
+
+        return self.refresh()
+
+    def _fresh_token(self, stale, ahead):
+        token = self.storage.get(TOKEN_KEY, encoding="utf-8")
+        if token is None or token == stale:
+            return None
+        if ahead and self._expiring(self.storage.get_ttl(TOKEN_KEY)):
+            return None
+        return token
+
+    def _expiring(self, ttl):
+        # ttl 为 -1 时没有过期时间
+        return ttl != -1 and ttl < self.refresh_ahead
+
+    def refresh(self, stale=None, ahead=False, expires=None):
+        """
+        刷新token并返回新的token
+
+        stale 为调用者认为已失效的token; ahead 为 True 时剩余时间
+        不足 refresh_ahead 秒的token也会被刷新。等待期间其他调用者
+        已经完成刷新时直接返回新的token
+        """
+        self._check_sync()
+        if not self._lock.acquire(timeout=self.wait_timeout):
+            raise TimeoutError("timeout waiting for access token refresh.")
+
+        try:
+            token = self._fresh_token(stale, ahead)
+            if token is not None:
+                return token
+
+            return self._refresh_shared(stale, ahead, expires)
+        finally:
+            self._lock.release()
+
+    def _refresh_shared(self, stale, ahead, expires):
+        storage = self.storage
+        try:
+            lock = storage.lock_acquire(TOKEN_KEY, ttl=self.lock_ttl)
+        except NotImplementedError:
+            # 存储器不支持加锁, 只在进程内保证单次刷新
+            lock = True
+
+        if lock is None:
+            # 其他节点正在刷新, 等待新的token写入
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                token = self._fresh_token(stale, ahead)
+                if token is not None:
+                    return token
+
+            raise TimeoutError("timeout waiting for access token refresh.")
+
+        try:
+            # 加锁前其他节点可能刚刚完成刷新
+            token = self._fresh_token(stale, ahead)
+            if token is not None:
+                return token
+
+            result = self.fetch()
+            token = result["access_token"]
+            storage.set(TOKEN_KEY, token,
+                        expires=expires or result["expires_in"])
+            self.refreshes += 1
+            return token
+        finally:
+            if lock is not True:
+                storage.lock_release(TOKEN_KEY, lock)
+
+    def _tick(self, interval):
+        """
+        需要时提前刷新, 返回距下次检查的秒数
+        """
+        try:
+            ttl = self.storage.get_ttl(TOKEN_KEY)
+            if self._expiring(ttl):
+                self.refresh(ahead=True)
+                ttl = self.storage.get_ttl(TOKEN_KEY)
+            self.last_error = None
+        except Exception as e:
+            # 刷新失败时稍后重试, 错误保存在 last_error
+            self.last_error = e
+            return min(5, interval)
+
+        return self._next_check(ttl, interval)
+
+    def _next_check(self, ttl, interval):
+        if ttl == -1:
+            return interval
+        return max(1, min(ttl - self.refresh_ahead, interval))
+
+    def start(self, interval=60):
+        """
+        启动后台刷新线程, 每 interval 秒内至少检查一次
+        """
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self._tick(interval)):
+                pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    # 以下为协程版本, 存储器与 fetch 可以是同步或异步的,
+    # 同步的调用放入线程池执行
+
+    async def _fresh_token_async(self, stale, ahead):
+        token = await call_async(self.storage.get, TOKEN_KEY, encoding="utf-8")
+        if token is None or token == stale:
+            return None
+        if ahead and self._expiring(
+                await call_async(self.storage.get_ttl, TOKEN_KEY)):
+            return None
+        return token
+
+    async def get_token_async(self):
+        token = await call_async(self.storage.get, TOKEN_KEY, encoding="utf-8")
+        if token is not None:
+            return token
+
+        return await self.refresh_async()
+
+    async def refresh_async(self, stale=None, ahead=False, expires=None):
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+
+        try:
+            await asyncio.wait_for(self._async_lock.acquire(),
+                                   self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("timeout waiting for access token refresh.")
+
+        try:
+            token = await self._fresh_token_async(stale, ahead)
+            if token is not None:
+                return token
+
+            return await self._refresh_shared_async(stale, ahead, expires)
+        finally:
+            self._async_lock.release()
+
+    async def _refresh_shared_async(self, stale, ahead, expires):
+        storage = self.storage
+        try:
+            lock = await call_async(
+                storage.lock_acquire, TOKEN_KEY, ttl=self.lock_ttl)
+        except NotImplementedError:
+            lock = True
+
+        if lock is None:
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                token = await self._fresh_token_async(stale, ahead)
+                if token is not None:
+                    return token
+
+            raise TimeoutError("timeout waiting for access token refresh.")
+
+        try:
+            token = await self._fresh_token_async(stale, ahead)
+            if token is not None:
+                return token
+
+            result = await call_async(self.fetch)
+            token = result["access_token"]
+            await call_async(storage.set, TOKEN_KEY, token,
+                             expires=expires or result["expires_in"])
+            self.refreshes += 1
+            return token
+        finally:
+            if lock is not True:
+                await call_async(storage.lock_release, TOKEN_KEY, lock)
+
+    async def _tick_async(self, interval):
+        try:
+            ttl = await call_async(self.storage.get_ttl, TOKEN_KEY)
+            if self._expiring(ttl):
+                await self.refresh_async(ahead=True)
+                ttl = await call_async(self.storage.get_ttl, TOKEN_KEY)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            return min(5, interval)
+
+        return self._next_check(ttl, interval)
+
+    async def run_async(self, interval=60):
+        """
+        后台刷新的协程版本
+
+        >>> asyncio.ensure_future(manager.run_async())
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            await asyncio.sleep(await self._tick_async(interval))
@@ -0,0 +1,111 @@
+# encoding=utf-8
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+__all__ = ['make_session', 'HttpxSession', 'DEFAULT_TIMEOUT', 'httpx_timeout',
+           'TRANSPORT_ERRORS']
+
+
+# (连接超时, 读取超时) 秒
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# 连接失败, 超时等传输层错误
+TRANSPORT_ERRORS = (requests.RequestException,)
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.HTTPError,)
+
+# 服务器繁忙或网关错误时重试
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+def make_retry(retries, backoff_factor):
+    """
+    连接失败时所有请求都可以重试 (请求尚未发出);
+    读取超时与 5xx 只重试 GET, 避免重复发送消息等非幂等请求
+    """
+    options = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=frozenset(["GET", "HEAD"]), **options)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(["GET", "HEAD"]), **options)
+
+
+def make_session(pool_connections=4, pool_maxsize=16, retries=3,
+                 backoff_factor=0.3):
+    """
+    保持长连接的 requests.Session, 连接池中每个主机最多 pool_maxsize 个连接,
+    多线程共用一个 session 时 pool_maxsize 应不小于线程数
+    """
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=make_retry(retries, backoff_factor),
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def httpx_timeout(timeout):
+    """
+    requests 风格的 (连接超时, 读取超时) 转换为 httpx.Timeout
+    """
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return timeout
+
+
+class HttpxSession(object):
+    """
+    httpx 实现的 HTTP/2 传输, 接口与 requests.Session 中用到的部分一致,
+    需安装 httpx[http2]
+
+    HTTP/2 在一个连接上复用多个请求, 多线程并发请求时不再需要连接池
+    """
+
+    def __init__(self, http2=True, pool_maxsize=16, retries=3):
+        if httpx is None:
+            raise ImportError("HttpxSession requires httpx[http2].")
+
+        # httpx 只支持连接失败时重试
+        transport = httpx.HTTPTransport(
+            http2=http2,
+            retries=retries,
+            limits=httpx.Limits(max_connections=pool_maxsize),
+        )
+        self.client = httpx.Client(transport=transport)
+
+    def request(self, method, url, params=None, data=None, timeout=None,
+                **kwargs):
+        if isinstance(data, bytes):
+            kwargs["content"] = data
+        elif data is not None:
+            kwargs["data"] = data
+
+        return self.client.request(method, url, params=params,
+                                   timeout=httpx_timeout(timeout), **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.client.close()
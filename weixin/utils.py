@@ -1,9 +1,15 @@
 # encoding=utf-8
 import re
+import asyncio
 import hashlib
+import inspect
+import threading
+import functools
+from hmac import compare_digest
+from collections import OrderedDict
 import json as _json
 import time as _time
-from random import choice
+from os import urandom
 
 
 __all__ = [
@@ -16,8 +22,12 @@ __all__ = [
     'join_sequence',
     'mix_seq',
     'get_nonce',
+    'get_nonce_bytes',
     'get_signature',
     'is_valid_request',
+    'LRUCache',
+    'call_async',
+    'SignatureVerifier',
     'AttributeDict',
     'AttrNone',
 ]
@@ -64,13 +74,30 @@ def join_sequence(seq):
 mix_seq = join_sequence
 
 
-def get_nonce(length):
-    table = '0123456789'\
-            'abcdefghijklmnopqrstuvwxyz'\
-            'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_NONCE_TABLE = b'0123456789'\
+               b'abcdefghijklmnopqrstuvwxyz'\
+               b'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# 随机字节到字母数字表的映射, 只使用 0~247 (62的整数倍) 以保证均匀分布
+_NONCE_TRANS = _NONCE_TABLE * 4 + bytes(256 - len(_NONCE_TABLE) * 4)
+_NONCE_DELETE = bytes(range(len(_NONCE_TABLE) * 4, 256))
+
+
+def get_nonce_bytes(length):
+    """
+    由 os.urandom 生成字母数字组成的随机串 (bytes)
+    """
+    nonce = b''
+    while len(nonce) < length:
+        # 多取一些字节, 补偿被丢弃的 248~255
+        data = urandom(length - len(nonce) + 4)
+        nonce += data.translate(_NONCE_TRANS, _NONCE_DELETE)
 
-    seq = map(lambda x: choice(table), range(length))
-    return join_sequence(seq)
+    return nonce[:length]
+
+
+def get_nonce(length):
+    return get_nonce_bytes(length).decode('ascii')
 
 
 def get_signature(*args):
@@ -81,8 +108,128 @@ def get_signature(*args):
 
 
 def is_valid_request(token, nonce, timestamp, signature):
+    if signature is None or nonce is None or timestamp is None:
+        return False
+
     sig = get_signature(token, nonce, timestamp)
-    return sig == signature
+    return compare_digest(to_bytes(sig), to_bytes(signature))
+
+
+async def call_async(func, *args, executor=None, **kwargs):
+    """
+    协程函数直接等待, 普通函数放入线程池执行, 返回值为awaitable时继续等待
+    """
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        executor, functools.partial(func, *args, **kwargs))
+
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class LRUCache(object):
+    """
+    线程安全的定长LRU缓存, 每个key可以设置过期时间(秒),
+    clock 为返回当前时间(秒)的函数
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=_time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expired = self._data[key]
+            except KeyError:
+                return default
+
+            if expired is not None and expired <= self.clock():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expired = self.clock() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expired)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class SignatureVerifier(object):
+    """
+    带缓存的请求签名校验
+
+    微信会以相同的 (nonce, timestamp, signature) 重试同一个请求,
+    最近校验通过的三元组被缓存, 命中时无需再次计算sha1。
+    时间戳与本机时间相差超过 max_skew 秒的请求被拒绝(为None时不检查),
+    reject_replay 为真时缓存命中的请求被视为重放而拒绝。
+
+    只有仍在缓存中的签名能被识别为重放: 2 * max_skew 秒内通过校验的请求
+    超过 cache_size 个时, 最早的签名被淘汰, 其后在有效期内的重放会被接受,
+    需要完整防重放时 cache_size 应不小于这段时间内的请求数
+    """
+
+    def __init__(self, token, max_skew=300, cache_size=1024, reject_replay=False,
+                 clock=_time.time):
+        self.token = token
+        self.max_skew = max_skew
+        self.reject_replay = reject_replay
+        self.clock = clock
+        # 时间戳在 [now - max_skew, now + max_skew] 内都会被接受,
+        # 缓存需保留 2 * max_skew 秒才能覆盖整个有效期
+        ttl = None if max_skew is None else 2 * max_skew
+        self.cache = LRUCache(maxsize=cache_size, ttl=ttl, clock=clock)
+
+    def verify(self, nonce, timestamp, signature):
+        if self.max_skew is not None:
+            try:
+                skew = abs(self.clock() - int(timestamp))
+            except (TypeError, ValueError):
+                return False
+
+            if skew > self.max_skew:
+                return False
+
+        key = (nonce, timestamp, signature)
+        if key in self.cache:
+            return not self.reject_replay
+
+        if not is_valid_request(self.token, nonce, timestamp, signature):
+            return False
+
+        self.cache.set(key, True)
+        return True
 
 
 def parse_rfc1738_args(url):